@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+import uuid
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+_WORDS = (
+    "markdown notes keep the outline short while each section explains one idea "
+    "with examples links and a brief summary for readers who skim"
+).split()
+
+
+@dataclass
+class FakeLLMConfig:
+    """Shape of the simulated model: latency to first token, output speed and failures."""
+
+    ttft: float = 0.2
+    tokens_per_second: float = 200.0
+    output_tokens: int = 150
+    error_rate: float = 0.0
+    tokens_per_chunk: int = 3
+
+
+def fake_output(config: FakeLLMConfig, edit: bool) -> list[str]:
+    """Token-ish pieces of a reply; edit replies are a fenced markdown document."""
+    tokens = [f"{random.choice(_WORDS)} " for _ in range(config.output_tokens)]
+    if edit:
+        return ["```markdown\n", "# Edited\n\n", *tokens, "\n```"]
+    return tokens
+
+
+async def paced(config: FakeLLMConfig, pieces: list[str]) -> AsyncIterator[str]:
+    """Yield pieces in chunks after the configured TTFT at the configured token rate."""
+    await asyncio.sleep(config.ttft)
+    step = max(config.tokens_per_chunk, 1)
+    delay = step / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+    for index in range(0, len(pieces), step):
+        if index:
+            await asyncio.sleep(delay)
+        yield "".join(pieces[index : index + step])
+
+
+def _sse(event: dict) -> bytes:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode("utf-8")
+
+
+def _is_edit(payload: dict) -> bool:
+    return "fenced code block" in json.dumps(payload.get("instructions") or payload)
+
+
+def create_openai_app(config: FakeLLMConfig) -> Starlette:
+    """OpenAI-compatible stand-in serving streamed Responses and Chat Completions."""
+
+    async def responses(request: Request):
+        payload = await request.json()
+        if random.random() < config.error_rate:
+            return JSONResponse({"error": {"message": "simulated overload"}}, status_code=503)
+        response_id = f"resp_{uuid.uuid4().hex}"
+        item_id = f"msg_{uuid.uuid4().hex}"
+        pieces = fake_output(config, _is_edit(payload))
+
+        async def events() -> AsyncIterator[bytes]:
+            sequence = 0
+            async for text in paced(config, pieces):
+                yield _sse(
+                    {
+                        "type": "response.output_text.delta",
+                        "item_id": item_id,
+                        "output_index": 0,
+                        "content_index": 0,
+                        "delta": text,
+                        "logprobs": [],
+                        "sequence_number": sequence,
+                    }
+                )
+                sequence += 1
+            message = {
+                "type": "message",
+                "id": item_id,
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": "".join(pieces), "annotations": []}],
+            }
+            yield _sse(
+                {
+                    "type": "response.completed",
+                    "sequence_number": sequence,
+                    "response": {
+                        "id": response_id,
+                        "object": "response",
+                        "created_at": int(time.time()),
+                        "model": payload.get("model", "fake"),
+                        "status": "completed",
+                        "output": [message],
+                        "parallel_tool_calls": False,
+                        "tool_choice": "auto",
+                        "tools": [],
+                        "usage": {
+                            "input_tokens": 0,
+                            "input_tokens_details": {"cached_tokens": 0},
+                            "output_tokens": len(pieces),
+                            "output_tokens_details": {"reasoning_tokens": 0},
+                            "total_tokens": len(pieces),
+                        },
+                    },
+                }
+            )
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        if random.random() < config.error_rate:
+            return JSONResponse({"error": {"message": "simulated overload"}}, status_code=503)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        pieces = fake_output(config, _is_edit(payload))
+
+        async def events() -> AsyncIterator[bytes]:
+            async for text in paced(config, pieces):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": payload.get("model", "fake"),
+                    "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
+            yield b"data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return Starlette(
+        routes=[
+            Route("/v1/responses", responses, methods=["POST"]),
+            Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        ]
+    )
+
+
+class BackgroundServer:
+    """Runs an ASGI app with uvicorn on its own thread and event loop."""
+
+    def __init__(self, app, host: str = "127.0.0.1") -> None:
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((host, 0))
+        self.host, self.port = self._socket.getsockname()[:2]
+        self._server = uvicorn.Server(
+            uvicorn.Config(app, log_level="warning", lifespan="on", timeout_keep_alive=30)
+        )
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._server.serve(sockets=[self._socket]))
+
+    def start(self) -> BackgroundServer:
+        self._thread.start()
+        while not self._server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError("Benchmark server failed to start.")
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
+
+
+class _FakeModels:
+    def __init__(self, config: FakeLLMConfig) -> None:
+        self._config = config
+
+    async def generate_content_stream(self, *, model, contents, config=None):
+        if random.random() < self._config.error_rate:
+            raise ConnectionError("simulated overload")
+        instruction = str(getattr(config, "system_instruction", "") or "")
+        pieces = fake_output(self._config, "fenced code block" in instruction)
+
+        async def stream():
+            async for text in paced(self._config, pieces):
+                yield SimpleNamespace(text=text, candidates=None)
+
+        return stream()
+
+
+class FakeGenaiClient:
+    """Stand-in for ``google.genai.Client`` exposing only what the Gemini agent uses."""
+
+    def __init__(self, config: FakeLLMConfig, api_key: str | None = None) -> None:
+        self.aio = SimpleNamespace(models=_FakeModels(config), aclose=self._aclose)
+
+    async def _aclose(self) -> None:
+        return None
+
+    def close(self) -> None:
+        return None
+
+
+def fake_genai_module(config: FakeLLMConfig) -> SimpleNamespace:
+    """Drop-in replacement for the ``genai`` module reference in the Gemini agent."""
+    return SimpleNamespace(Client=lambda api_key=None: FakeGenaiClient(config, api_key))
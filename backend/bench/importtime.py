@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+# Provider SDKs must only load when an agent using them is first requested.
+LAZY_MODULES = ("agents", "openai", "google.genai")
+
+_SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+
+
+def _parse_importtime(stderr: str) -> dict[str, tuple[int, int]]:
+    """Module -> (self_us, cumulative_us) from ``python -X importtime`` output."""
+    timings: dict[str, tuple[int, int]] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # the header row
+        timings[fields[2].strip()] = (int(fields[0]), int(fields[1]))
+    return timings
+
+
+def measure(module: str, workspace: str) -> dict[str, tuple[int, int]]:
+    """Import ``module`` in a fresh interpreter and return its import timings."""
+    env = {
+        **os.environ,
+        "WORKSPACE_DIR": workspace,
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(_SRC_DIR), os.getenv("PYTHONPATH")])),
+    }
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=False,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+    return _parse_importtime(completed.stderr)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Measure how long the backend takes to import (cold start cost)."
+    )
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to sample.")
+    parser.add_argument("--top", type=int, default=15, help="Slowest modules to list.")
+    parser.add_argument("--max-ms", type=float, help="Fail if the median import exceeds this.")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="imd-importtime-") as workspace:
+        # The first import also writes bytecode caches; keep it out of the samples.
+        measure(args.module, workspace)
+        runs = [measure(args.module, workspace) for _ in range(max(args.runs, 1))]
+
+    totals = [run[args.module][1] / 1000 for run in runs if args.module in run]
+    last = runs[-1]
+    slowest = sorted(last.items(), key=lambda item: item[1][0], reverse=True)[: args.top]
+    eager = sorted(
+        name
+        for name in last
+        if any(name == lazy or name.startswith(f"{lazy}.") for lazy in LAZY_MODULES)
+    )
+    report = {
+        "module": args.module,
+        "python": sys.version.split()[0],
+        "runs": len(totals),
+        "median_ms": round(statistics.median(totals), 1),
+        "min_ms": round(min(totals), 1),
+        "max_ms": round(max(totals), 1),
+        "modules_imported": len(last),
+        "slowest_self_ms": {name: round(self_us / 1000, 1) for name, (self_us, _) in slowest},
+        "eager_provider_modules": eager,
+    }
+    print(json.dumps(report, indent=2))
+
+    failed = False
+    if eager:
+        print(f"Provider SDK modules imported eagerly: {', '.join(eager[:10])}", file=sys.stderr)
+        failed = True
+    if args.max_ms is not None and report["median_ms"] > args.max_ms:
+        print(
+            f"Median import time {report['median_ms']}ms exceeds budget {args.max_ms}ms",
+            file=sys.stderr,
+        )
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
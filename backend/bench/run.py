@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import httpx
+
+from .fake_llm import BackgroundServer, FakeLLMConfig, create_openai_app, fake_genai_module
+
+SCENARIOS = ("files", "file", "chat-openai", "chat-google")
+
+_AGENT_FOR_SCENARIO = {"chat-openai": "openai-qa", "chat-google": "google-adk-qa"}
+
+
+@dataclass
+class ScenarioResult:
+    requests: int = 0
+    errors: int = 0
+    duration_s: float = 0.0
+    latencies: list[float] = field(default_factory=list)
+    ttfts: list[float] = field(default_factory=list)
+    loop_lags: list[float] = field(default_factory=list)
+    statuses: dict[str, int] = field(default_factory=dict)
+
+    def summary(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "statuses": self.statuses,
+            "duration_s": round(self.duration_s, 3),
+            "throughput_rps": round(self.requests / self.duration_s, 2) if self.duration_s else 0,
+            "latency_ms": _percentiles(self.latencies),
+            "ttft_ms": _percentiles(self.ttfts),
+            "loop_lag_ms": _percentiles(self.loop_lags),
+        }
+
+
+def _percentiles(samples: list[float]) -> dict[str, float] | None:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def rank(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)] * 1000, 2)
+
+    return {"p50": rank(0.50), "p95": rank(0.95), "p99": rank(0.99), "max": rank(1.0)}
+
+
+def _make_workspace(directory: Path, documents: int, sections: int) -> None:
+    body = (
+        "Paragraph text describing the topic in a few sentences so search and context "
+        "selection have something realistic to work with.\n\n"
+    )
+    for index in range(documents):
+        parts = [f"# Document {index}\n\n"]
+        for section in range(sections):
+            parts.append(f"## Section {section}\n\n{body * 3}")
+        (directory / f"doc-{index}.md").write_text("".join(parts), encoding="utf-8")
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def _monitor_loop_lag(samples: list[float], interval: float = 0.01) -> None:
+    """Sample how late the backend event loop wakes up; blocking calls show up here."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - expected))
+
+
+async def _one_request(
+    client: httpx.AsyncClient, scenario: str, index: int, documents: int, result: ScenarioResult
+) -> None:
+    path = f"doc-{index % documents}.md"
+    started = time.perf_counter()
+    first_byte: float | None = None
+    try:
+        if scenario == "files":
+            response = await client.get("/api/files", params={"path": ""})
+            status = response.status_code
+        elif scenario == "file":
+            response = await client.get("/api/file", params={"path": path})
+            status = response.status_code
+        else:
+            body = {
+                "path": path,
+                "mode": "ask",
+                # Unique messages keep the response cache and single-flight out of the way.
+                "message": f"Summarise section {index}",
+                "agent_id": _AGENT_FOR_SCENARIO[scenario],
+            }
+            async with client.stream("POST", "/api/ai/chat", json=body) as response:
+                status = response.status_code
+                saw_final = False
+                async for line in response.aiter_lines():
+                    if first_byte is None:
+                        first_byte = time.perf_counter()
+                    if line and json.loads(line).get("type") == "final":
+                        saw_final = True
+                if status == 200 and not saw_final:
+                    status = 599  # stream ended without a final event
+    except httpx.HTTPError:
+        status = 0
+    finished = time.perf_counter()
+
+    result.requests += 1
+    result.statuses[str(status)] = result.statuses.get(str(status), 0) + 1
+    if status != 200:
+        result.errors += 1
+        return
+    result.latencies.append(finished - started)
+    if first_byte is not None:
+        result.ttfts.append(first_byte - started)
+
+
+async def _run_scenario(
+    base_url: str,
+    backend: BackgroundServer,
+    scenario: str,
+    concurrency: int,
+    total: int,
+    documents: int,
+) -> ScenarioResult:
+    result = ScenarioResult()
+    lag_task = asyncio.run_coroutine_threadsafe(
+        _monitor_loop_lag(result.loop_lags), backend.loop
+    )
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for index in range(total):
+        queue.put_nowait(index)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+
+        async def worker() -> None:
+            while True:
+                try:
+                    index = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await _one_request(client, scenario, index, documents, result)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        result.duration_s = time.perf_counter() - started
+
+    lag_task.cancel()
+    return result
+
+
+def _configure_environment(args: argparse.Namespace, workspace: Path, llm_url: str) -> None:
+    os.environ.update(
+        {
+            "WORKSPACE_DIR": str(workspace),
+            "SEARCH_INDEX_PATH": str(workspace.parent / "search-index.pickle"),
+            "OPENAI_API_KEY": "bench",
+            "OPENAI_BASE_URL": f"{llm_url}/v1",
+            "OPENAI_AGENTS_DISABLE_TRACING": "1",
+            "GOOGLE_API_KEY": "bench",
+            "AI_RESPONSE_CACHE": "off",
+            "AI_MAX_CONCURRENCY": str(args.max_agent_concurrency),
+            "AI_QUEUE_MAX": str(max(args.concurrency, 32)),
+        }
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Load-test the backend against local fake LLM providers."
+    )
+    parser.add_argument(
+        "--scenario", action="append", choices=SCENARIOS, help="Repeatable; default: all."
+    )
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario.")
+    parser.add_argument("--documents", type=int, default=50)
+    parser.add_argument("--sections", type=int, default=8)
+    parser.add_argument("--ttft-ms", type=float, default=200)
+    parser.add_argument("--tokens-per-sec", type=float, default=200)
+    parser.add_argument("--output-tokens", type=int, default=150)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--max-agent-concurrency", type=int, default=64)
+    parser.add_argument("--output", type=Path, help="Write the JSON report here as well.")
+    args = parser.parse_args(argv)
+
+    llm_config = FakeLLMConfig(
+        ttft=args.ttft_ms / 1000,
+        tokens_per_second=args.tokens_per_sec,
+        output_tokens=args.output_tokens,
+        error_rate=args.error_rate,
+    )
+    scenarios = args.scenario or list(SCENARIOS)
+
+    with tempfile.TemporaryDirectory(prefix="imd-bench-") as tmp:
+        workspace = Path(tmp) / "workspace"
+        workspace.mkdir()
+        _make_workspace(workspace, args.documents, args.sections)
+
+        llm = BackgroundServer(create_openai_app(llm_config)).start()
+        _configure_environment(args, workspace, llm.url)
+
+        # Imported only now: the app reads WORKSPACE_DIR and provider settings at import time.
+        from app.agents import google_adk_agent
+        from app.main import app
+
+        google_adk_agent.genai = fake_genai_module(llm_config)
+        backend = BackgroundServer(app).start()
+        try:
+            results = {
+                scenario: asyncio.run(
+                    _run_scenario(
+                        backend.url,
+                        backend,
+                        scenario,
+                        args.concurrency,
+                        args.requests,
+                        args.documents,
+                    )
+                ).summary()
+                for scenario in scenarios
+            }
+        finally:
+            backend.stop()
+            llm.stop()
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": sys.version.split()[0],
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "documents": args.documents,
+            "sections": args.sections,
+            "llm": asdict(llm_config),
+        },
+        "scenarios": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import math
+import os
+import random
+import re
+import time
+import weakref
+from collections import deque
+from collections.abc import AsyncIterator, Callable
+from dataclasses import dataclass
+
+import httpx
+
+from .exceptions import AgentExecutionError, AgentOverloadedError
+from .telemetry import QUEUED, RETRIES
+
+logger = logging.getLogger("uvicorn.error").getChild(__name__)
+
+_TRANSIENT_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+@dataclass(frozen=True)
+class AdmissionSettings:
+    max_concurrency: int
+    rate_per_second: float
+    burst: int
+    max_queue: int
+    max_wait: float
+    retry_attempts: int
+    retry_base_delay: float
+    retry_max_delay: float
+
+
+def get_admission_settings(agent_id: str) -> AdmissionSettings:
+    """Admission settings for one agent.
+
+    Every setting can be overridden per agent by suffixing the variable with the agent id,
+    e.g. ``AI_MAX_CONCURRENCY_OPENAI_QA`` takes precedence over ``AI_MAX_CONCURRENCY``.
+    A concurrency or rate of 0 disables that limit.
+    """
+    suffix = re.sub(r"[^A-Z0-9]", "_", agent_id.upper())
+
+    def env(name: str, default: str) -> str:
+        return os.getenv(f"{name}_{suffix}") or os.getenv(name) or default
+
+    max_concurrency = int(env("AI_MAX_CONCURRENCY", "4"))
+    return AdmissionSettings(
+        max_concurrency=max_concurrency,
+        rate_per_second=float(env("AI_RATE_LIMIT_RPS", "0")),
+        burst=int(env("AI_RATE_LIMIT_BURST", str(max(max_concurrency, 1)))),
+        max_queue=int(env("AI_QUEUE_MAX", "32")),
+        max_wait=float(env("AI_QUEUE_MAX_WAIT", "15")),
+        retry_attempts=int(env("AI_RETRY_ATTEMPTS", "2")),
+        retry_base_delay=float(env("AI_RETRY_BASE_DELAY", "0.5")),
+        retry_max_delay=float(env("AI_RETRY_MAX_DELAY", "8")),
+    )
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """Whether an agent failure was caused by a retryable upstream condition."""
+    seen: set[int] = set()
+    current: BaseException | None = exc
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        if isinstance(current, (TimeoutError, ConnectionError, httpx.TransportError)):
+            return True
+        status = getattr(current, "status_code", None) or getattr(current, "code", None)
+        if isinstance(status, int) and status in _TRANSIENT_STATUS:
+            return True
+        current = current.__cause__ or current.__context__
+    return False
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations, so concurrent callers queue up in time."""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self._rate = rate
+        self._capacity = float(max(burst, 1))
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take a token and return how many seconds to wait before using it."""
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self._rate
+
+    def refund(self) -> None:
+        self._tokens = min(self._capacity, self._tokens + 1)
+
+
+class _AgentLimiter:
+    """Concurrency slots, bounded FIFO wait queue and rate limit for one agent id."""
+
+    def __init__(self, agent_id: str, settings: AdmissionSettings) -> None:
+        self.agent_id = agent_id
+        self.settings = settings
+        self._active = 0
+        self._waiters: deque[asyncio.Future[None]] = deque()
+        self._bucket = (
+            TokenBucket(settings.rate_per_second, settings.burst)
+            if settings.rate_per_second > 0
+            else None
+        )
+        # Moving average of how long a run holds its slot, used for Retry-After hints.
+        self._avg_hold = 1.0
+
+    def _has_free_slot(self) -> bool:
+        limit = self.settings.max_concurrency
+        return limit <= 0 or (self._active < limit and not self._waiters)
+
+    def _overloaded(self, reason: str, retry_after: float | None = None) -> AgentOverloadedError:
+        if retry_after is None:
+            slots = max(self.settings.max_concurrency, 1)
+            retry_after = self._avg_hold * (len(self._waiters) + 1) / slots
+        retry_after = max(1.0, math.ceil(retry_after))
+        logger.warning(
+            "Shedding AI request agent_id=%s reason=%s active=%d queued=%d retry_after=%s",
+            self.agent_id,
+            reason,
+            self._active,
+            len(self._waiters),
+            retry_after,
+        )
+        return AgentOverloadedError(
+            f"Agent '{self.agent_id}' is busy ({reason}); retry later.", retry_after
+        )
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.settings.max_wait
+        if self._has_free_slot():
+            self._active += 1
+        else:
+            if len(self._waiters) >= self.settings.max_queue:
+                raise self._overloaded("queue full")
+            waiter: asyncio.Future[None] = loop.create_future()
+            self._waiters.append(waiter)
+            QUEUED.inc(agent_id=self.agent_id)
+            try:
+                await asyncio.wait_for(waiter, timeout=self.settings.max_wait)
+            except asyncio.TimeoutError:
+                with contextlib.suppress(ValueError):
+                    self._waiters.remove(waiter)
+                raise self._overloaded("queue timeout") from None
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # The slot was handed over just as we were cancelled; give it back.
+                    self.release(0.0)
+                else:
+                    with contextlib.suppress(ValueError):
+                        self._waiters.remove(waiter)
+                raise
+            finally:
+                QUEUED.dec(agent_id=self.agent_id)
+
+        delay = self._bucket.reserve() if self._bucket is not None else 0.0
+        if delay > deadline - loop.time():
+            self._bucket.refund()
+            self.release(0.0)
+            raise self._overloaded("rate limited", delay)
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.release(0.0)
+                raise
+
+    async def throttle(self) -> None:
+        """Wait for a rate-limit token without shedding; used between retries."""
+        if self._bucket is not None:
+            delay = self._bucket.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    def release(self, held: float) -> None:
+        if held > 0:
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * held
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # Hand the slot straight to the next waiter so newcomers cannot jump the queue.
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+
+class AdmissionLease:
+    """A held concurrency slot; released exactly once."""
+
+    def __init__(self, limiter: _AgentLimiter) -> None:
+        self.limiter = limiter
+        self._acquired_at = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self.limiter.release(time.monotonic() - self._acquired_at)
+
+
+class AdmissionController:
+    """Per-agent admission control for upstream model runs.
+
+    Each agent id gets its own concurrency cap, token-bucket rate limit and bounded wait
+    queue. Requests that cannot be admitted within ``AI_QUEUE_MAX_WAIT`` raise
+    :class:`AgentOverloadedError`, which the API turns into ``429`` with ``Retry-After``.
+    """
+
+    def __init__(
+        self, settings_for: Callable[[str], AdmissionSettings] = get_admission_settings
+    ) -> None:
+        self._settings_for = settings_for
+        self._limiters: dict[str, _AgentLimiter] = {}
+
+    def _limiter(self, agent_id: str) -> _AgentLimiter:
+        limiter = self._limiters.get(agent_id)
+        if limiter is None:
+            limiter = _AgentLimiter(agent_id, self._settings_for(agent_id))
+            self._limiters[agent_id] = limiter
+        return limiter
+
+    async def admit(self, agent_id: str) -> AdmissionLease:
+        limiter = self._limiter(agent_id)
+        await limiter.acquire()
+        return AdmissionLease(limiter)
+
+    def run(
+        self, lease: AdmissionLease, factory: Callable[[], AsyncIterator[bytes]]
+    ) -> AsyncIterator[bytes]:
+        """Stream an upstream run under ``lease``, retrying transient failures.
+
+        A run is only retried if it failed before producing any output, so clients never
+        see duplicated chunks. The lease is released when the stream ends or is dropped.
+        """
+        stream = _run_with_retries(lease, factory)
+        # Release the slot even if the response is discarded before it is iterated.
+        weakref.finalize(stream, lease.release)
+        return stream
+
+
+async def _run_with_retries(
+    lease: AdmissionLease, factory: Callable[[], AsyncIterator[bytes]]
+) -> AsyncIterator[bytes]:
+    limiter = lease.limiter
+    settings = limiter.settings
+    attempt = 0
+    try:
+        while True:
+            stream = factory()
+            started = False
+            try:
+                async for chunk in stream:
+                    started = True
+                    yield chunk
+                return
+            except AgentExecutionError as exc:
+                if started or attempt >= settings.retry_attempts or not is_transient_error(exc):
+                    raise
+                attempt += 1
+                RETRIES.inc(agent_id=limiter.agent_id)
+                # Full jitter keeps retries from a burst of failures from re-synchronising.
+                backoff = settings.retry_base_delay * 2 ** (attempt - 1)
+                delay = random.uniform(0, min(settings.retry_max_delay, backoff))
+                logger.warning(
+                    "Retrying AI run after transient error "
+                    "agent_id=%s attempt=%d delay=%.2fs reason=%s",
+                    limiter.agent_id,
+                    attempt,
+                    delay,
+                    exc,
+                )
+                await asyncio.sleep(delay)
+                await limiter.throttle()
+            finally:
+                aclose = getattr(stream, "aclose", None)
+                if aclose is not None:
+                    with contextlib.suppress(Exception):
+                        await aclose()
+    finally:
+        lease.release()
@@ -0,0 +1,422 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import time
+import uuid
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Literal
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+from ..services import file_service
+from .exceptions import AgentError, AgentOverloadedError
+from .interface import ChatRequest
+from .router import AgentRouterService, agent_router_service
+from .streaming import event_line
+
+logger = logging.getLogger("uvicorn.error").getChild(__name__)
+
+JobStatus = Literal["running", "completed", "cancelled", "failed"]
+
+_DEFAULT_JOBS_DIR = Path(__file__).resolve().parents[3] / ".cache" / "ai-jobs"
+# Results read from disk per round trip when streaming job events.
+_EVENTS_BATCH = 64
+
+
+@dataclass(frozen=True)
+class BatchSettings:
+    jobs_dir: Path
+    concurrency: int
+    max_files: int
+
+
+def get_batch_settings() -> BatchSettings:
+    """Batch job settings.
+
+    ``AI_BATCH_CONCURRENCY`` is the default and maximum number of files a job processes
+    at once; ``AI_BATCH_MAX_FILES`` caps how many files one job may cover.
+    """
+    return BatchSettings(
+        jobs_dir=Path(os.getenv("AI_JOBS_DIR") or _DEFAULT_JOBS_DIR).expanduser(),
+        concurrency=max(int(os.getenv("AI_BATCH_CONCURRENCY", "2")), 1),
+        max_files=int(os.getenv("AI_BATCH_MAX_FILES", "5000")),
+    )
+
+
+class BatchJobSpec(BaseModel):
+    """What a batch job runs: one chat request per matching file."""
+
+    path: str = ""
+    pattern: str = "**/*.md"
+    agent_id: str
+    mode: Literal["ask", "edit"]
+    message: str
+    concurrency: int = 0  # 0: AI_BATCH_CONCURRENCY
+
+
+class BatchJob:
+    """State of one batch job.
+
+    Results stay in ``results.jsonl`` in order of completion; memory only holds their
+    byte offsets and the counters.
+    """
+
+    def __init__(
+        self,
+        job_id: str,
+        spec: BatchJobSpec,
+        files: list[str],
+        status: JobStatus,
+        created_at: float,
+    ) -> None:
+        self.job_id = job_id
+        self.spec = spec
+        self.files = files
+        self.status: JobStatus = status
+        self.created_at = created_at
+        self.offsets: list[int] | None = None  # start of each result line; loaded on demand
+        self.size = 0  # bytes of complete result lines
+        self.done: set[int] = set()
+        self.failed = 0
+        self.changed = asyncio.Condition()
+        self.append_lock = asyncio.Lock()
+        self.task: asyncio.Task[None] | None = None
+
+    def summary(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            **self.spec.model_dump(),
+            "total": len(self.files),
+            "done": len(self.done),
+            "failed": self.failed,
+            "created_at": self.created_at,
+        }
+
+
+class BatchJobManager:
+    """Runs batch jobs through the agent router and persists them for resumption.
+
+    Each job lives in its own directory: ``job.json`` holds the spec, file list and
+    status, and ``results.jsonl`` gets one line per processed file. Jobs still
+    running at shutdown are resumed on the next start, skipping files that already
+    have a result. Edit results are staged in ``results.jsonl`` together with the
+    version of the file they were based on; nothing is written to the workspace.
+    """
+
+    def __init__(
+        self, router: AgentRouterService, settings: BatchSettings | None = None
+    ) -> None:
+        self._router = router
+        self._settings = settings or get_batch_settings()
+        self._jobs: dict[str, BatchJob] = {}
+
+    async def start(self) -> None:
+        """Load persisted jobs and resume the ones that were running."""
+        jobs = await file_service.run_io(self._load_jobs)
+        self._jobs = {job.job_id: job for job in jobs}
+        for job in jobs:
+            if job.status == "running":
+                logger.info("Resuming batch job job_id=%s", job.job_id)
+                await self._start(job)
+
+    async def aclose(self) -> None:
+        """Stop running jobs without marking them finished, so they resume on restart."""
+        tasks = [job.task for job in self._jobs.values() if job.task is not None]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await task
+
+    async def create(self, spec: BatchJobSpec) -> BatchJob:
+        requested = spec.concurrency or self._settings.concurrency
+        spec = spec.model_copy(
+            update={"concurrency": min(max(requested, 1), self._settings.concurrency)}
+        )
+        files = await file_service.aglob_files(spec.path, spec.pattern, self._settings.max_files)
+        if not files:
+            raise HTTPException(status_code=400, detail="No markdown files match")
+        job = BatchJob(uuid.uuid4().hex, spec, files, "running", time.time())
+        job.offsets = []
+        self._jobs[job.job_id] = job
+        await file_service.run_io(self._save_job, job)
+        logger.info(
+            "Created batch job job_id=%s agent_id=%s mode=%s files=%d",
+            job.job_id,
+            spec.agent_id,
+            spec.mode,
+            len(files),
+        )
+        await self._start(job)
+        return job
+
+    def get(self, job_id: str) -> BatchJob:
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job
+
+    def jobs(self) -> list[BatchJob]:
+        return sorted(self._jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    async def cancel(self, job_id: str) -> BatchJob:
+        job = self.get(job_id)
+        if job.status == "running":
+            await self._set_status(job, "cancelled")
+            if job.task is not None:
+                job.task.cancel()
+        return job
+
+    async def resume(self, job_id: str) -> BatchJob:
+        job = self.get(job_id)
+        if job.status in ("cancelled", "failed"):
+            if job.task is not None:
+                with contextlib.suppress(asyncio.CancelledError, Exception):
+                    await job.task
+            # Re-read from disk: a result may have been written as the job was cancelled.
+            await self._load_offsets(job)
+            await self._set_status(job, "running")
+            await self._start(job)
+        return job
+
+    async def events(self, job_id: str, after: int = 0) -> AsyncIterator[bytes]:
+        """JSONL: a ``job`` summary, the ``result`` lines, then a ``done`` summary.
+
+        The stream follows the job live while it runs. The first ``after`` results are
+        skipped, so a client can reconnect without receiving results it already has.
+        Results are read back from ``results.jsonl`` in batches.
+        """
+        job = self.get(job_id)
+        yield event_line({"type": "job", **job.summary()})
+        await self._offsets(job)
+        position = max(after, 0)
+        while True:
+            async with job.changed:
+                if position >= len(job.offsets) and job.status == "running":
+                    await job.changed.wait()
+            while position < len(job.offsets):
+                stop = min(position + _EVENTS_BATCH, len(job.offsets))
+                end = job.offsets[stop] if stop < len(job.offsets) else job.size
+                lines = await file_service.run_io(
+                    self._read_results, job, job.offsets[position], end
+                )
+                for line in lines:
+                    yield line
+                position = stop
+            if job.status != "running" and position >= len(job.offsets):
+                break
+        yield event_line({"type": "done", **job.summary()})
+
+    async def _start(self, job: BatchJob) -> None:
+        await self._offsets(job)
+        if job.task is None or job.task.done():
+            job.task = asyncio.create_task(self._run(job))
+
+    async def _run(self, job: BatchJob) -> None:
+        try:
+            await self._run_files(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Per-file failures are results; this is the job itself (e.g. results.jsonl
+            # cannot be written). Settle it so followers stop waiting and it is not
+            # resumed into the same failure on every start.
+            logger.exception("Batch job failed job_id=%s", job.job_id)
+            if job.status == "running":
+                await self._set_status(job, "failed")
+            return
+        if job.status == "running":
+            await self._set_status(job, "completed")
+            logger.info(
+                "Batch job finished job_id=%s files=%d failed=%d",
+                job.job_id,
+                len(job.files),
+                job.failed,
+            )
+
+    async def _run_files(self, job: BatchJob) -> None:
+        queue: asyncio.Queue[int] = asyncio.Queue()
+        for index in range(len(job.files)):
+            if index not in job.done:
+                queue.put_nowait(index)
+
+        async def worker() -> None:
+            while True:
+                try:
+                    index = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                result = await self._process(job, index)
+                await self._record(job, index, result)
+
+        # A failing worker cancels the others instead of leaving them running unsupervised.
+        async with asyncio.TaskGroup() as group:
+            for _ in range(job.spec.concurrency):
+                group.create_task(worker())
+
+    async def _process(self, job: BatchJob, index: int) -> dict:
+        path = job.files[index]
+        result: dict = {"type": "result", "index": index, "path": path}
+        try:
+            return {**result, **await self._process_file(job, path)}
+        except HTTPException as exc:
+            return {**result, "status": "error", "error": str(exc.detail)}
+        except AgentError as exc:
+            logger.warning(
+                "Batch job file failed job_id=%s path=%s reason=%s", job.job_id, path, exc
+            )
+            return {**result, "status": "error", "error": str(exc)}
+        except Exception as exc:
+            # E.g. a file that is not UTF-8, or an unexpected error inside an agent.
+            logger.exception("Batch job file failed job_id=%s path=%s", job.job_id, path)
+            return {**result, "status": "error", "error": f"{type(exc).__name__}: {exc}"}
+
+    async def _process_file(self, job: BatchJob, path: str) -> dict:
+        file = await file_service.aread_file(path)
+        request = ChatRequest(
+            path=path,
+            content=file["content"],
+            message=job.spec.message,
+            mode=job.spec.mode,
+            agent_id=job.spec.agent_id,
+            coalesce_deltas=False,
+        )
+        while True:
+            try:
+                final = await self._router.complete(request)
+                break
+            except AgentOverloadedError as exc:
+                # Interactive traffic has the capacity right now; wait our turn.
+                await asyncio.sleep(exc.retry_after)
+        if job.spec.mode == "edit":
+            proposed = final.get("proposedContent", "")
+            return {
+                "status": "ok",
+                "proposedContent": proposed,
+                "baseVersion": file["version"],
+                "changed": proposed != file["content"],
+            }
+        return {"status": "ok", "answer": final.get("answer", "")}
+
+    async def _record(self, job: BatchJob, index: int, result: dict) -> None:
+        line = event_line(result)
+        # Appends are serialised so the offsets match the order of lines in the file.
+        async with job.append_lock:
+            await file_service.run_io(self._append_result, job, line)
+            async with job.changed:
+                job.offsets.append(job.size)
+                job.size += len(line)
+                job.done.add(index)
+                if result["status"] != "ok":
+                    job.failed += 1
+                job.changed.notify_all()
+
+    async def _set_status(self, job: BatchJob, status: JobStatus) -> None:
+        async with job.changed:
+            job.status = status
+            job.changed.notify_all()
+        try:
+            await file_service.run_io(self._save_job, job)
+        except OSError:
+            logger.exception("Could not save batch job job_id=%s status=%s", job.job_id, status)
+
+    async def _offsets(self, job: BatchJob) -> list[int]:
+        if job.offsets is None:
+            await self._load_offsets(job)
+        return job.offsets
+
+    async def _load_offsets(self, job: BatchJob) -> None:
+        offsets, size, done, failed = await file_service.run_io(self._scan_results, job)
+        async with job.changed:
+            job.offsets, job.size, job.done, job.failed = offsets, size, done, failed
+
+    # Persistence (runs on the file I/O executor) ------------------------------
+
+    def _job_dir(self, job_id: str) -> Path:
+        return self._settings.jobs_dir / job_id
+
+    def _save_job(self, job: BatchJob) -> None:
+        directory = self._job_dir(job.job_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "job_id": job.job_id,
+            "spec": job.spec.model_dump(),
+            "files": job.files,
+            "status": job.status,
+            "created_at": job.created_at,
+        }
+        tmp = directory / "job.json.tmp"
+        tmp.write_text(json.dumps(payload), encoding="utf-8")
+        os.replace(tmp, directory / "job.json")
+
+    def _append_result(self, job: BatchJob, line: bytes) -> None:
+        with (self._job_dir(job.job_id) / "results.jsonl").open("ab") as fh:
+            fh.write(line)
+
+    def _read_results(self, job: BatchJob, start: int, end: int) -> list[bytes]:
+        with (self._job_dir(job.job_id) / "results.jsonl").open("rb") as fh:
+            fh.seek(start)
+            return fh.read(end - start).splitlines(keepends=True)
+
+    def _scan_results(self, job: BatchJob) -> tuple[list[int], int, set[int], int]:
+        """Offsets and total size of the result lines, the files done and how many failed."""
+        offsets: list[int] = []
+        done: set[int] = set()
+        failed = 0
+        size = 0
+        try:
+            fh = (self._job_dir(job.job_id) / "results.jsonl").open("r+b")
+        except FileNotFoundError:
+            return offsets, size, done, failed
+        with fh:
+            for line in fh:
+                try:
+                    result = json.loads(line) if line.endswith(b"\n") else None
+                    index = result["index"]
+                except (ValueError, KeyError, TypeError):
+                    result = None
+                if result is None:
+                    # A line torn by an unclean shutdown: drop it and anything after it,
+                    # so the offsets stay contiguous and the next append starts clean.
+                    logger.warning(
+                        "Truncating batch job results job_id=%s at byte %d", job.job_id, size
+                    )
+                    fh.truncate(size)
+                    break
+                offsets.append(size)
+                size += len(line)
+                done.add(index)
+                if result.get("status") != "ok":
+                    failed += 1
+        return offsets, size, done, failed
+
+    def _load_jobs(self) -> list[BatchJob]:
+        jobs: list[BatchJob] = []
+        if not self._settings.jobs_dir.is_dir():
+            return jobs
+        for path in self._settings.jobs_dir.glob("*/job.json"):
+            try:
+                payload = json.loads(path.read_text(encoding="utf-8"))
+                jobs.append(
+                    BatchJob(
+                        payload["job_id"],
+                        BatchJobSpec(**payload["spec"]),
+                        payload["files"],
+                        payload["status"],
+                        payload["created_at"],
+                    )
+                )
+            except (OSError, ValueError, KeyError, TypeError) as exc:
+                logger.warning("Skipping unreadable batch job %s reason=%s", path, exc)
+        return jobs
+
+
+batch_jobs = BatchJobManager(agent_router_service)
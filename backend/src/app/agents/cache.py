@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Literal, cast
+
+from .interface import ChatRequest
+
+logger = logging.getLogger("uvicorn.error").getChild(__name__)
+
+CacheBackend = Literal["off", "memory", "disk"]
+
+_DEFAULT_CACHE_DIR = Path(__file__).resolve().parents[3] / ".cache" / "ai-responses"
+
+
+@dataclass(frozen=True)
+class CacheSettings:
+    backend: CacheBackend
+    ttl_seconds: float
+    max_entries: int
+    max_bytes: int
+    directory: Path
+
+
+def get_cache_settings() -> CacheSettings:
+    """Read response cache settings from the environment.
+
+    ``AI_RESPONSE_CACHE`` is ``off`` (default), ``memory`` or ``disk``. The disk backend keeps
+    the in-memory LRU as a hot tier and persists entries under ``AI_RESPONSE_CACHE_DIR``.
+    """
+    backend = os.getenv("AI_RESPONSE_CACHE", "off").strip().lower()
+    if backend not in {"off", "memory", "disk"}:
+        backend = "off"
+    directory = os.getenv("AI_RESPONSE_CACHE_DIR")
+    return CacheSettings(
+        backend=cast(CacheBackend, backend),
+        ttl_seconds=float(os.getenv("AI_RESPONSE_CACHE_TTL", "3600")),
+        max_entries=int(os.getenv("AI_RESPONSE_CACHE_MAX_ENTRIES", "256")),
+        max_bytes=int(os.getenv("AI_RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        directory=Path(directory).expanduser() if directory else _DEFAULT_CACHE_DIR,
+    )
+
+
+def create_response_cache(settings: CacheSettings | None = None) -> ResponseCache | None:
+    settings = settings or get_cache_settings()
+    if settings.backend == "off":
+        return None
+    return ResponseCache(settings)
+
+
+def make_cache_key(request: ChatRequest, model: str) -> str:
+    """Content-addressed key for a request against a given agent model.
+
+    The path is part of the prompt, so identical content at another path is a
+    different request.
+    """
+    content_hash = hashlib.sha256(request.content.encode("utf-8")).hexdigest()
+    passages = [[p.path, p.text] for p in request.related_passages]
+    material = json.dumps(
+        [
+            request.agent_id,
+            model,
+            request.mode,
+            request.path,
+            content_hash,
+            request.message,
+            request.selection,
+            passages,
+        ]
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """LRU + TTL cache of complete JSONL response streams with an optional disk tier."""
+
+    def __init__(self, settings: CacheSettings) -> None:
+        self._settings = settings
+        # key -> (stored_at, payload)
+        self._memory: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._memory_bytes = 0
+        # key -> (stored_at, size) for entries persisted on disk
+        self._disk_index: dict[str, tuple[float, int]] = {}
+        self._disk_bytes = 0
+        self._disk_lock = threading.Lock()
+        # The router builds its cache at import; scanning the directory waits for first use.
+        self._disk_loaded = settings.backend != "disk"
+
+    async def get(self, key: str) -> bytes | None:
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            stored_at, payload = entry
+            if now - stored_at <= self._settings.ttl_seconds:
+                self._memory.move_to_end(key)
+                return payload
+            self._evict_memory(key)
+
+        await self._ensure_disk_index()
+        disk_entry = self._disk_index.get(key)
+        if disk_entry is None:
+            return None
+        if now - disk_entry[0] > self._settings.ttl_seconds:
+            await asyncio.to_thread(self._remove_disk_entry, key)
+            return None
+        try:
+            payload = await asyncio.to_thread(self._path_for(key).read_bytes)
+        except OSError:
+            with self._disk_lock:
+                self._forget_disk_entry(key)
+            return None
+        self._store_memory(key, disk_entry[0], payload)
+        return payload
+
+    async def put(self, key: str, payload: bytes) -> None:
+        stored_at = time.time()
+        self._store_memory(key, stored_at, payload)
+        if self._settings.backend == "disk":
+            try:
+                await self._ensure_disk_index()
+                await asyncio.to_thread(self._write_disk_entry, key, stored_at, payload)
+            except OSError:
+                logger.warning(
+                    "Failed to persist AI response cache entry key=%s", key, exc_info=True
+                )
+
+    async def record(self, key: str, stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """Pass a response stream through, caching it only if it completes."""
+        chunks: list[bytes] = []
+        async for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        if chunks:
+            await self.put(key, b"".join(chunks))
+
+    # Memory tier ---------------------------------------------------------
+
+    def _store_memory(self, key: str, stored_at: float, payload: bytes) -> None:
+        if len(payload) > self._settings.max_bytes:
+            return
+        self._evict_memory(key)
+        self._memory[key] = (stored_at, payload)
+        self._memory_bytes += len(payload)
+        while self._memory and (
+            len(self._memory) > self._settings.max_entries
+            or self._memory_bytes > self._settings.max_bytes
+        ):
+            self._evict_memory(next(iter(self._memory)))
+
+    def _evict_memory(self, key: str) -> None:
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= len(entry[1])
+
+    # Disk tier (called from worker threads) -------------------------------
+
+    async def _ensure_disk_index(self) -> None:
+        if not self._disk_loaded:
+            await asyncio.to_thread(self._load_disk_index)
+
+    def _path_for(self, key: str) -> Path:
+        return self._settings.directory / key[:2] / f"{key}.jsonl"
+
+    def _load_disk_index(self) -> None:
+        with self._disk_lock:
+            if self._disk_loaded:
+                return
+            directory = self._settings.directory
+            directory.mkdir(parents=True, exist_ok=True)
+            for path in directory.glob("*/*.jsonl"):
+                stat = path.stat()
+                self._disk_index[path.stem] = (stat.st_mtime, stat.st_size)
+                self._disk_bytes += stat.st_size
+            self._disk_loaded = True
+
+    def _write_disk_entry(self, key: str, stored_at: float, payload: bytes) -> None:
+        path = self._path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(payload)
+        os.replace(tmp_path, path)
+        os.utime(path, (stored_at, stored_at))
+        with self._disk_lock:
+            self._forget_disk_entry(key)
+            self._disk_index[key] = (stored_at, len(payload))
+            self._disk_bytes += len(payload)
+            self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        if (
+            len(self._disk_index) <= self._settings.max_entries
+            and self._disk_bytes <= self._settings.max_bytes
+        ):
+            return
+        for key in sorted(self._disk_index, key=lambda k: self._disk_index[k][0]):
+            if (
+                len(self._disk_index) <= self._settings.max_entries
+                and self._disk_bytes <= self._settings.max_bytes
+            ):
+                break
+            self._forget_disk_entry(key)
+            self._path_for(key).unlink(missing_ok=True)
+
+    def _remove_disk_entry(self, key: str) -> None:
+        with self._disk_lock:
+            self._forget_disk_entry(key)
+        self._path_for(key).unlink(missing_ok=True)
+
+    def _forget_disk_entry(self, key: str) -> None:
+        entry = self._disk_index.pop(key, None)
+        if entry is not None:
+            self._disk_bytes -= entry[1]
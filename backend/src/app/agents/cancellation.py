@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import os
+import uuid
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Literal
+
+from .streaming import event_line
+
+logger = logging.getLogger("uvicorn.error").getChild(__name__)
+
+DisconnectCheck = Callable[[], Awaitable[bool]]
+CancelReason = Literal["stopped", "disconnected"]
+CANCELLED_LINE = event_line({"type": "cancelled"})
+
+
+class StreamControl:
+    """Cancellation handle for one in-flight chat stream."""
+
+    def __init__(self, request_id: str) -> None:
+        self.request_id = request_id
+        self.reason: CancelReason | None = None
+        self._event = asyncio.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: CancelReason) -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    async def wait(self) -> None:
+        await self._event.wait()
+
+
+class ActiveStreams:
+    """Registry of in-flight chat streams so they can be stopped by request ID."""
+
+    def __init__(self) -> None:
+        self._controls: dict[str, StreamControl] = {}
+
+    def open(self) -> StreamControl:
+        control = StreamControl(uuid.uuid4().hex)
+        self._controls[control.request_id] = control
+        return control
+
+    def close(self, control: StreamControl) -> None:
+        if self._controls.get(control.request_id) is control:
+            del self._controls[control.request_id]
+
+    def cancel(self, request_id: str) -> bool:
+        """Stop the stream with ``request_id``; returns False if it is not running."""
+        control = self._controls.get(request_id)
+        if control is None:
+            return False
+        control.cancel("stopped")
+        return True
+
+
+def disconnect_poll_interval() -> float:
+    """Seconds between client disconnect checks (``AI_DISCONNECT_POLL_MS``, default 250)."""
+    return max(float(os.getenv("AI_DISCONNECT_POLL_MS", "250")), 10) / 1000
+
+
+async def guard_stream(
+    stream: AsyncIterator[bytes],
+    control: StreamControl,
+    is_disconnected: DisconnectCheck | None = None,
+    on_close: Callable[[], None] | None = None,
+) -> AsyncIterator[bytes]:
+    """Forward ``stream`` until it ends, is stopped, or the client goes away.
+
+    The client is polled while waiting for upstream chunks, so a disconnect is noticed
+    even when the model has not produced output yet. On cancellation the source stream
+    is closed, which lets the agent abort its upstream run.
+    """
+    watcher = (
+        asyncio.create_task(_watch_disconnect(control, is_disconnected))
+        if is_disconnected is not None
+        else None
+    )
+    cancelled = asyncio.ensure_future(control.wait())
+    iterator = stream.__aiter__()
+    step: asyncio.Future[bytes] | None = None
+    try:
+        while True:
+            step = asyncio.ensure_future(iterator.__anext__())
+            await asyncio.wait({step, cancelled}, return_when=asyncio.FIRST_COMPLETED)
+            if not step.done():
+                logger.info(
+                    "Cancelling AI stream request_id=%s reason=%s",
+                    control.request_id,
+                    control.reason,
+                )
+                if control.reason == "stopped":
+                    yield CANCELLED_LINE
+                return
+            try:
+                chunk = step.result()
+            except StopAsyncIteration:
+                return
+            yield chunk
+    finally:
+        for task in (step, cancelled, watcher):
+            if task is not None and not task.done():
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError, Exception):
+                    await task
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            with contextlib.suppress(Exception):
+                await aclose()
+        if on_close is not None:
+            on_close()
+
+
+async def _watch_disconnect(control: StreamControl, is_disconnected: DisconnectCheck) -> None:
+    interval = disconnect_poll_interval()
+    while not control.cancelled:
+        if await is_disconnected():
+            control.cancel("disconnected")
+            return
+        await asyncio.sleep(interval)
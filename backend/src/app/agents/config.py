@@ -1,13 +1,74 @@
 from __future__ import annotations
 
+import importlib
+import logging
+import os
+from collections.abc import Iterator, Mapping
 from typing import Type
 
+from .exceptions import AgentConfigurationError
 from .interface import AgentInterface
-from .openai_agent import OpenAIAgent
-from .google_adk_agent import GoogleADKAgent
 
-AGENT_MAPPING: dict[str, Type[AgentInterface]] = {
-    "openai-qa": OpenAIAgent,
-    "openai-editor": OpenAIAgent,
-    "google-adk-qa": GoogleADKAgent,
+logger = logging.getLogger("uvicorn.error").getChild(__name__)
+
+# Providers are referenced by import path so a deployment only pays for the SDKs it uses.
+AGENT_IMPORT_PATHS: dict[str, str] = {
+    "openai-qa": ".openai_agent:OpenAIAgent",
+    "openai-editor": ".openai_agent:OpenAIAgent",
+    "google-adk-qa": ".google_adk_agent:GoogleADKAgent",
+    "auto": ".hedged_agent:HedgedAgent",
 }
+
+
+class LazyAgentRegistry(Mapping[str, Type[AgentInterface]]):
+    """Maps agent ids to agent classes, importing each provider module on first lookup."""
+
+    def __init__(self, import_paths: Mapping[str, str]) -> None:
+        self._import_paths = dict(import_paths)
+        self._resolved: dict[str, Type[AgentInterface]] = {}
+
+    def __getitem__(self, agent_id: str) -> Type[AgentInterface]:
+        agent_cls = self._resolved.get(agent_id)
+        if agent_cls is None:
+            agent_cls = _import_agent_class(self._import_paths[agent_id])
+            self._resolved[agent_id] = agent_cls
+        return agent_cls
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._import_paths)
+
+    def __len__(self) -> int:
+        return len(self._import_paths)
+
+    def __contains__(self, agent_id: object) -> bool:
+        return agent_id in self._import_paths
+
+
+def _import_agent_class(import_path: str) -> Type[AgentInterface]:
+    module_name, _, attribute = import_path.partition(":")
+    try:
+        # Leading-dot paths are relative to this package.
+        module = importlib.import_module(module_name, __package__)
+    except ImportError as exc:
+        raise AgentConfigurationError(
+            f"Agent provider module '{module_name}' could not be imported: {exc}"
+        ) from exc
+    agent_cls = getattr(module, attribute, None)
+    if not isinstance(agent_cls, type) or not issubclass(agent_cls, AgentInterface):
+        raise AgentConfigurationError(f"'{import_path}' is not an AgentInterface class.")
+    logger.debug("Loaded agent provider %s", import_path)
+    return agent_cls
+
+
+def warm_up_agent_ids() -> list[str]:
+    """Agent ids to construct at startup (``AI_WARM_UP_AGENTS``: ids, ``*`` for all).
+
+    Empty by default, so providers load on their first request.
+    """
+    value = os.getenv("AI_WARM_UP_AGENTS", "").strip()
+    if value == "*":
+        return list(AGENT_MAPPING)
+    return [agent_id.strip() for agent_id in value.split(",") if agent_id.strip()]
+
+
+AGENT_MAPPING = LazyAgentRegistry(AGENT_IMPORT_PATHS)
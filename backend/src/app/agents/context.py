@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Literal, cast
+
+from .interface import RelatedPassage
+
+ContextMode = Literal["auto", "full", "sections"]
+
+# Rough chars-per-token ratio for English prose and markdown; good enough for budgeting.
+_CHARS_PER_TOKEN = 4
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_FENCE_LINE_RE = re.compile(r"^\s*(```|~~~)")
+_WORD_RE = re.compile(r"[a-z0-9][a-z0-9_'-]*")
+
+_STOPWORDS = frozenset(
+    """a an and are as at be but by can do does for from how i in is it its me my of on or
+    please so that the this to was what when where which who why will with you your""".split()
+)
+
+
+@dataclass(frozen=True)
+class ContextSettings:
+    mode: ContextMode
+    token_budget: int
+
+
+@dataclass
+class _Section:
+    index: int
+    level: int
+    title: str
+    text: str
+    score: float = 0.0
+
+
+def get_context_settings() -> ContextSettings:
+    """Read ask-mode context settings from the environment.
+
+    ``AI_ASK_CONTEXT_MODE`` is ``auto`` (default: whole document when it fits the budget,
+    relevant sections otherwise), ``full`` or ``sections``. ``AI_ASK_CONTEXT_TOKEN_BUDGET``
+    bounds the estimated tokens spent on document content.
+    """
+    mode = os.getenv("AI_ASK_CONTEXT_MODE", "auto").strip().lower()
+    if mode not in {"auto", "full", "sections"}:
+        mode = "auto"
+    budget = int(os.getenv("AI_ASK_CONTEXT_TOKEN_BUDGET", "6000"))
+    return ContextSettings(mode=cast(ContextMode, mode), token_budget=max(budget, 1))
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / _CHARS_PER_TOKEN)
+
+
+def build_document_context(
+    content: str,
+    message: str,
+    selection: str | None = None,
+    settings: ContextSettings | None = None,
+) -> str:
+    """Return the document text to include in an ask prompt.
+
+    Small documents (or ``full`` mode) are returned unchanged. Larger ones are split by
+    heading, ranked against the question and selection, and reduced to an outline plus the
+    best-scoring sections, kept in document order, within the token budget.
+    """
+    settings = settings or get_context_settings()
+    if settings.mode == "full":
+        return content
+    if settings.mode == "auto" and estimate_tokens(content) <= settings.token_budget:
+        return content
+
+    sections = _split_sections(content)
+    if len(sections) <= 1 and estimate_tokens(content) <= settings.token_budget:
+        return content
+
+    _score_sections(sections, message, selection)
+    outline = _render_outline(sections, settings.token_budget // 5)
+    remaining = settings.token_budget - estimate_tokens(outline)
+
+    # Unrelated sections are dropped; with no matches at all, fall back to document order.
+    candidates = [section for section in sections if section.score > 0] or sections
+    chosen: list[_Section] = []
+    for section in sorted(candidates, key=lambda s: (-s.score, s.index)):
+        if remaining <= 0:
+            break
+        cost = estimate_tokens(section.text)
+        if cost <= remaining:
+            chosen.append(section)
+            remaining -= cost
+        elif not chosen:
+            # Always include the best section, even if it must be truncated.
+            chosen.append(_truncate(section, remaining))
+            remaining = 0
+
+    chosen.sort(key=lambda s: s.index)
+    body = "\n\n".join(section.text.strip() for section in chosen)
+    return (
+        f"Document outline:\n{outline}\n\n"
+        f"Relevant sections ({len(chosen)} of {len(sections)}, in document order):\n\n{body}"
+    )
+
+
+def format_related_passages(passages: list[RelatedPassage]) -> str:
+    """Render retrieved passages from other notes for inclusion in a prompt."""
+    blocks = [
+        f"[{number}] {passage.path}\n{passage.text.strip()}"
+        for number, passage in enumerate(passages, start=1)
+    ]
+    return (
+        "Related notes from the workspace (mention the path when you use one):\n\n"
+        + "\n\n".join(blocks)
+    )
+
+
+def _split_sections(content: str) -> list[_Section]:
+    sections: list[_Section] = []
+    lines: list[str] = []
+    level, title = 0, "(preamble)"
+    in_fence = False
+
+    def flush() -> None:
+        text = "\n".join(lines)
+        if text.strip():
+            sections.append(_Section(index=len(sections), level=level, title=title, text=text))
+
+    for line in content.splitlines():
+        if _FENCE_LINE_RE.match(line):
+            in_fence = not in_fence
+        match = None if in_fence else _HEADING_RE.match(line)
+        if match:
+            flush()
+            lines = []
+            level, title = len(match.group(1)), match.group(2)
+        lines.append(line)
+    flush()
+    return sections
+
+
+def _terms(text: str) -> list[str]:
+    return [w for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS]
+
+
+def _score_sections(sections: list[_Section], message: str, selection: str | None) -> None:
+    """BM25-style scoring with boosts for heading matches and the selected text."""
+    query = Counter(_terms(message) + _terms(selection or ""))
+    section_terms = [Counter(_terms(section.text)) for section in sections]
+    avg_len = sum(sum(t.values()) for t in section_terms) / max(len(sections), 1) or 1.0
+    doc_freq: Counter[str] = Counter()
+    for terms in section_terms:
+        doc_freq.update(terms.keys())
+
+    k1, b = 1.2, 0.75
+    needle = (selection or "").strip()
+    for section, terms in zip(sections, section_terms):
+        length = sum(terms.values())
+        title_terms = set(_terms(section.title))
+        score = 0.0
+        for term, weight in query.items():
+            tf = terms.get(term, 0)
+            if not tf:
+                continue
+            idf = math.log(1 + (len(sections) - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            score += weight * idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_len))
+            if term in title_terms:
+                score += idf
+        if needle and needle in section.text:
+            score += 100.0
+        section.score = score
+
+
+def _render_outline(sections: list[_Section], token_cap: int) -> str:
+    lines: list[str] = []
+    used = 0
+    for section in sections:
+        if section.level == 0:
+            continue
+        line = f"{'  ' * (section.level - 1)}- {section.title}"
+        used += estimate_tokens(line) + 1
+        if used > token_cap:
+            lines.append("- ...")
+            break
+        lines.append(line)
+    return "\n".join(lines) or "- (no headings)"
+
+
+def _truncate(section: _Section, token_budget: int) -> _Section:
+    limit = max(token_budget, 0) * _CHARS_PER_TOKEN
+    text = section.text[:limit].rstrip() + "\n\n[... section truncated ...]"
+    return _Section(section.index, section.level, section.title, text, section.score)
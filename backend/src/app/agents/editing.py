@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import dataclass
+from typing import Literal
+
+from .exceptions import AgentExecutionError, AgentPatchError
+
+EditStrategy = Literal["patch", "full"]
+
+FULL_EDIT_INSTRUCTIONS = (
+    "You are an expert Markdown editor. Always return the FULL UPDATED MARKDOWN "
+    "inside a single fenced code block using the language identifier 'markdown'. "
+    "Do not include any commentary outside the code fence."
+)
+
+PATCH_EDIT_INSTRUCTIONS = (
+    "You are an expert Markdown editor. Describe your changes as one or more "
+    "SEARCH/REPLACE blocks instead of returning the whole document. Use exactly this format:\n"
+    "<<<<<<< SEARCH\n"
+    "<lines copied verbatim from the current document>\n"
+    "=======\n"
+    "<replacement lines>\n"
+    ">>>>>>> REPLACE\n"
+    "Each SEARCH section must match exactly one location in the current document, so "
+    "include enough surrounding lines to make it unique. Blocks are applied in order. "
+    "Do not include any commentary outside the blocks."
+)
+
+_SEARCH_MARKER = "<<<<<<< SEARCH"
+_DIVIDER_MARKER = "======="
+_REPLACE_MARKER = ">>>>>>> REPLACE"
+
+_FENCE_RE = re.compile(r"```(?:markdown|md)?\n([\s\S]*?)\n```", re.IGNORECASE)
+_FENCE_OPEN_RE = re.compile(r"```(?:markdown|md)?\n", re.IGNORECASE)
+_FENCE_CLOSE = "\n```"
+_FENCE_OPEN_MAX = len("```markdown")
+
+
+@dataclass(frozen=True)
+class PatchOperation:
+    search: str
+    replace: str
+
+
+def edit_strategy_for(content: str) -> EditStrategy:
+    """Pick the edit strategy for a document based on environment settings.
+
+    ``AI_EDIT_STRATEGY`` selects ``patch`` (default) or ``full``. Documents shorter than
+    ``AI_EDIT_PATCH_MIN_CHARS`` are always rewritten in full since patches save little there.
+    """
+    strategy = os.getenv("AI_EDIT_STRATEGY", "patch").strip().lower()
+    if strategy != "patch":
+        return "full"
+    min_chars = int(os.getenv("AI_EDIT_PATCH_MIN_CHARS", "4000"))
+    return "patch" if len(content) >= min_chars else "full"
+
+
+def extract_markdown(text: str) -> str:
+    match = _FENCE_RE.search(text)
+    if match:
+        return match.group(1).strip()
+    return text.strip()
+
+
+class FenceStreamParser:
+    """Incrementally extract the body of the first markdown fence from streamed output.
+
+    Follows the same rules as :func:`extract_markdown`, so the concatenated pieces equal the
+    fenced body it returns before stripping. Output outside the fence is dropped.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._state: Literal["before", "inside", "done"] = "before"
+
+    def feed(self, text: str) -> str:
+        """Consume a delta and return the newly available fence body text."""
+        if self._state == "done":
+            return ""
+        self._buffer += text
+        if self._state == "before":
+            match = _FENCE_OPEN_RE.search(self._buffer)
+            if match is None:
+                # Keep only a tail that could still grow into an opening fence.
+                self._buffer = self._buffer[-_FENCE_OPEN_MAX:]
+                return ""
+            self._buffer = self._buffer[match.end() :]
+            self._state = "inside"
+
+        end = self._buffer.find(_FENCE_CLOSE)
+        if end != -1:
+            body, self._buffer = self._buffer[:end], ""
+            self._state = "done"
+            return body
+        # Hold back a trailing newline or backticks that may start the closing fence.
+        held = 0
+        for size in range(len(_FENCE_CLOSE) - 1, 0, -1):
+            if self._buffer.endswith(_FENCE_CLOSE[:size]):
+                held = size
+                break
+        split = len(self._buffer) - held
+        body, self._buffer = self._buffer[:split], self._buffer[split:]
+        return body
+
+
+def parse_patch(text: str) -> list[PatchOperation]:
+    """Parse SEARCH/REPLACE blocks from model output."""
+    operations: list[PatchOperation] = []
+    search: list[str] = []
+    replace: list[str] = []
+    state: Literal["outside", "search", "replace"] = "outside"
+
+    for line in text.splitlines():
+        marker = line.rstrip()
+        if state == "outside":
+            if marker == _SEARCH_MARKER:
+                search, replace = [], []
+                state = "search"
+        elif state == "search":
+            if marker == _DIVIDER_MARKER:
+                state = "replace"
+            else:
+                search.append(line)
+        elif marker == _REPLACE_MARKER:
+            operations.append(PatchOperation("\n".join(search), "\n".join(replace)))
+            state = "outside"
+        else:
+            replace.append(line)
+
+    if state != "outside":
+        raise AgentPatchError("Patch ended inside an unterminated SEARCH/REPLACE block.")
+    return operations
+
+
+def apply_patch(content: str, operations: list[PatchOperation]) -> str:
+    """Apply operations in order, requiring each search text to match exactly once."""
+    if not operations:
+        raise AgentPatchError("Patch contained no SEARCH/REPLACE blocks.")
+    updated = content
+    for index, operation in enumerate(operations, start=1):
+        if not operation.search.strip():
+            raise AgentPatchError(f"Patch block {index} has an empty SEARCH section.")
+        occurrences = updated.count(operation.search)
+        if occurrences != 1:
+            raise AgentPatchError(
+                f"Patch block {index} SEARCH text matched {occurrences} locations; expected 1."
+            )
+        updated = updated.replace(operation.search, operation.replace, 1)
+    return updated
+
+
+def resolve_patch_output(content: str, output: str) -> str:
+    """Turn patch-mode model output into the proposed document.
+
+    Models occasionally ignore the patch format and return a fenced document; that is
+    accepted as a full rewrite. Anything else that cannot be applied raises
+    :class:`AgentPatchError` so the caller can fall back to a full rewrite.
+    """
+    if _SEARCH_MARKER not in output and _FENCE_RE.search(output):
+        return resolve_full_output(output)
+    return apply_patch(content, parse_patch(output)).strip()
+
+
+def resolve_full_output(output: str) -> str:
+    proposed = extract_markdown(output)
+    if not proposed:
+        raise AgentExecutionError("Agent returned an empty edit.")
+    return proposed
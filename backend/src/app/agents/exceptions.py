@@ -12,3 +12,28 @@ class AgentNotFoundError(AgentError):
 
 class AgentExecutionError(AgentError):
     """Raised when an agent fails while processing a request."""
+
+
+class AgentPatchError(AgentExecutionError):
+    """Raised when an edit patch returned by an agent cannot be applied."""
+
+
+class AgentOverloadedError(AgentError):
+    """Raised when an agent has no capacity to admit a request right now."""
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AgentSessionBusyError(AgentError):
+    """Raised when a chat session turn starts while another turn on it is unfinished."""
+
+
+class AgentRequestTooLargeError(AgentError):
+    """Raised before any upstream call when a request exceeds every model's context window."""
+
+    def __init__(self, message: str, tokens: int, limit: int) -> None:
+        super().__init__(message)
+        self.tokens = tokens
+        self.limit = limit
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
-import asyncio
-import json
+import contextlib
+import logging
 import os
 from collections.abc import AsyncIterator
 from typing import Any
@@ -13,8 +13,31 @@ except ImportError:  # pragma: no cover - optional dependency
     genai = None
     genai_types = None
 
-from .exceptions import AgentConfigurationError, AgentExecutionError
-from .interface import AgentInterface, ChatRequest
+from .context import build_document_context, format_related_passages
+from .editing import (
+    PATCH_EDIT_INSTRUCTIONS,
+    edit_strategy_for,
+    resolve_full_output,
+    resolve_patch_output,
+)
+from .exceptions import AgentConfigurationError, AgentExecutionError, AgentPatchError
+from .interface import AgentInterface, ChatRequest, ModelRoute
+from .model_routing import (
+    context_settings_for,
+    parse_model_routes,
+    rewrite_model,
+    routed_model,
+)
+from .sessions import DocumentUpdate, document_update, format_document_update
+from .streaming import (
+    RESET_LINE,
+    CoalescePolicy,
+    delta_lines,
+    event_line,
+    get_coalesce_policy,
+)
+
+logger = logging.getLogger("uvicorn.error").getChild(__name__)
 
 
 class GoogleADKAgent(AgentInterface):
@@ -40,19 +63,90 @@ class GoogleADKAgent(AgentInterface):
 
         self._client = genai.Client(api_key=api_key)
         self._model = os.getenv("GOOGLE_ADK_MODEL", "models/gemini-2.0-flash")
+        self._routes = parse_model_routes(
+            os.getenv("GOOGLE_ADK_MODEL_ROUTES"),
+            self._model,
+            int(os.getenv("GOOGLE_ADK_MAX_INPUT_TOKENS", "1000000")),
+        )
+
+    @property
+    def model(self) -> str:
+        return self._model
+
+    def model_routes(self) -> list[ModelRoute]:
+        return self._routes
 
     async def process_stream(self, request: ChatRequest) -> AsyncIterator[bytes]:
-        system_instruction = _system_instruction_for_mode(request.mode)
-        user_payload = _build_user_payload(request)
+        final_key = "proposedContent" if request.mode == "edit" else "answer"
+        user_payload, update = _build_user_payload(request)
+        history = _session_contents(request)
+        policy = get_coalesce_policy(request.coalesce_deltas)
+        model = routed_model(request, self._model)
+
+        if request.mode == "edit" and edit_strategy_for(request.content) == "patch":
+            collected: list[str] = []
+            async for chunk in self._stream_deltas(
+                PATCH_EDIT_INSTRUCTIONS, user_payload, collected, policy, model=model
+            ):
+                yield chunk
+            try:
+                proposed = resolve_patch_output(request.content, "".join(collected))
+            except AgentPatchError as exc:
+                logger.warning(
+                    "Edit patch rejected, falling back to full rewrite path=%s reason=%s",
+                    request.path,
+                    exc,
+                )
+            else:
+                yield _final_line(final_key, proposed)
+                return
+            # A full rewrite may need a larger model than the patch did.
+            model = rewrite_model(request, self._model)
+            # The SEARCH/REPLACE text streamed so far is not part of the answer.
+            yield RESET_LINE
+
+        collected = []
+        async for chunk in self._stream_deltas(
+            _system_instruction_for_mode(request.mode),
+            user_payload,
+            collected,
+            policy,
+            preview=request.mode == "edit",
+            history=history,
+            model=model,
+        ):
+            yield chunk
+
+        final_text = "".join(collected).strip()
+        if not final_text:
+            raise AgentExecutionError("Google ADK agent returned an empty response.")
+        if request.mode == "edit":
+            final_text = resolve_full_output(final_text)
+        if request.session is not None:
+            request.session.record_turn(user_payload, final_text, update.document, update.seen)
+
+        yield _final_line(final_key, final_text)
 
+    async def _stream_deltas(
+        self,
+        system_instruction: str,
+        user_payload: str,
+        collected: list[str],
+        policy: CoalescePolicy | None,
+        *,
+        preview: bool = False,
+        history: list[dict[str, Any]] | None = None,
+        model: str | None = None,
+    ) -> AsyncIterator[bytes]:
         try:
-            response_stream = self._client.responses.stream(
-                model=self._model,
+            response_stream = await self._client.aio.models.generate_content_stream(
+                model=model or self._model,
                 contents=[
+                    *(history or []),
                     {
                         "role": "user",
                         "parts": [{"text": user_payload}],
-                    }
+                    },
                 ],
                 config=genai_types.GenerateContentConfig(
                     system_instruction=system_instruction
@@ -63,21 +157,18 @@ class GoogleADKAgent(AgentInterface):
                 "Google ADK agent failed to start streaming response."
             ) from exc
 
-        collected: list[str] = []
         async for chunk in _google_stream_to_jsonl(
-            response_stream,
-            collected,
+            response_stream, collected, policy, preview=preview
         ):
             yield chunk
 
-        final_text = "".join(collected).strip()
-        if not final_text:
-            raise AgentExecutionError("Google ADK agent returned an empty response.")
+    async def aclose(self) -> None:
+        await self._client.aio.aclose()
+        self._client.close()
 
-        final_key = "proposedContent" if request.mode == "edit" else "answer"
-        yield (json.dumps({"type": "final", final_key: final_text}) + "\n").encode(
-            "utf-8"
-        )
+
+def _final_line(final_key: str, text: str) -> bytes:
+    return event_line({"type": "final", final_key: text})
 
 
 def _system_instruction_for_mode(mode: str) -> str:
@@ -89,28 +180,72 @@ def _system_instruction_for_mode(mode: str) -> str:
     return "You are a helpful Markdown assistant. Answer concisely using the provided context."
 
 
-def _build_user_payload(request: ChatRequest) -> str:
+def _build_user_payload(request: ChatRequest) -> tuple[str, DocumentUpdate]:
+    """Return the user turn and the document update it carries."""
+    # Edit mode needs the whole document; ask mode only needs the relevant sections.
+    content = request.content
+    if request.mode == "ask":
+        content = build_document_context(
+            request.content, request.message, request.selection, context_settings_for(request)
+        )
+    update = document_update(request.session, request.content, content)
+    if update.kind == "full":
+        document_part = f"File Content:\n```markdown\n{update.text}\n```"
+    else:
+        document_part = f"File Content: {format_document_update(update.kind, update.text)}"
     parts = [
         f"File Path: {request.path}",
-        f"File Content:\n```markdown\n{request.content}\n```",
+        document_part,
         f"User Request: {request.message}",
     ]
     if request.selection:
         parts.append(f"Selection:\n```markdown\n{request.selection}\n```")
-    return "\n\n".join(parts)
+    if request.mode == "ask" and request.related_passages:
+        parts.append(format_related_passages(request.related_passages))
+    return "\n\n".join(parts), update
+
+
+def _session_contents(request: ChatRequest) -> list[dict[str, Any]]:
+    # Earlier turns go first, unchanged, so the provider can reuse the cached prefix.
+    if request.session is None:
+        return []
+    return [
+        {"role": "model" if turn.role == "assistant" else "user", "parts": [{"text": turn.text}]}
+        for turn in request.session.history
+    ]
 
 
 async def _google_stream_to_jsonl(
-    response_stream: Any, collected: list[str]
+    response_stream: AsyncIterator[Any],
+    collected: list[str],
+    policy: CoalescePolicy | None = None,
+    *,
+    preview: bool = False,
 ) -> AsyncIterator[bytes]:
-    for event in response_stream:
-        text = _extract_text(event)
-        if not text:
-            continue
-        collected.append(text)
-        payload = {"type": "delta", "text": text}
-        yield (json.dumps(payload) + "\n").encode("utf-8")
-        await asyncio.sleep(0)
+    texts = _google_stream_texts(response_stream, collected)
+    async for chunk in delta_lines(texts, policy, preview=preview):
+        yield chunk
+
+
+async def _google_stream_texts(
+    response_stream: AsyncIterator[Any], collected: list[str]
+) -> AsyncIterator[str]:
+    # Iterate the async SDK stream so awaiting network reads yields to the event loop.
+    try:
+        async for event in response_stream:
+            text = _extract_text(event)
+            if not text:
+                continue
+            collected.append(text)
+            yield text
+    except Exception as exc:  # pragma: no cover - SDK level errors
+        raise AgentExecutionError("Google ADK agent failed while streaming response.") from exc
+    finally:
+        # Close the HTTP response so an abandoned generation stops immediately.
+        aclose = getattr(response_stream, "aclose", None)
+        if aclose is not None:
+            with contextlib.suppress(Exception):
+                await aclose()
 
 
 def _extract_text(event: Any) -> str | None:
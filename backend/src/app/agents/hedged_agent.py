@@ -0,0 +1,372 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import math
+import os
+import weakref
+from collections import deque
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from typing import Protocol
+
+from ..services import file_service
+from .admission import AdmissionController, AdmissionLease
+from .exceptions import (
+    AgentConfigurationError,
+    AgentError,
+    AgentExecutionError,
+    AgentOverloadedError,
+    AgentRequestTooLargeError,
+)
+from .interface import AgentInterface, ChatRequest
+from .model_routing import plan_route
+from .telemetry import HEDGES, MODEL_ROUTES
+
+logger = logging.getLogger("uvicorn.error").getChild(__name__)
+
+
+@dataclass(frozen=True)
+class HedgeSettings:
+    agent_ids: tuple[str, ...]
+    hedge_delay: float
+    window: int
+
+
+def get_hedge_settings() -> HedgeSettings:
+    """Settings for the ``auto`` agent.
+
+    ``AI_AUTO_AGENTS`` lists the candidate agent ids in order of preference;
+    ``AI_HEDGE_DELAY_MS`` is how long to wait for a first token before hedging.
+    """
+    agent_ids = os.getenv("AI_AUTO_AGENTS", "openai-qa,google-adk-qa")
+    return HedgeSettings(
+        agent_ids=tuple(a.strip() for a in agent_ids.split(",") if a.strip()),
+        hedge_delay=float(os.getenv("AI_HEDGE_DELAY_MS", "1500")) / 1000,
+        window=int(os.getenv("AI_HEDGE_WINDOW", "50")),
+    )
+
+
+class AgentPool(Protocol):
+    """The router's pooled agents and their admission control."""
+
+    @property
+    def admission(self) -> AdmissionController: ...
+
+    def get_agent_instance(self, agent_id: str) -> AgentInterface: ...
+
+
+class LatencyTracker:
+    """Rolling time-to-first-token samples for one provider.
+
+    Failures are recorded as infinite latency, so a provider failing more than 5% of
+    recent requests sorts behind every healthy one. A run cancelled because another
+    provider won is recorded as censored: at least as slow as the winner.
+    """
+
+    def __init__(self, window: int) -> None:
+        self._samples: deque[float] = deque(maxlen=max(window, 1))
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def record_failure(self) -> None:
+        self._samples.append(math.inf)
+
+    def p95(self) -> float | None:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+
+
+@dataclass
+class _Racer:
+    agent_id: str
+    stream: AsyncIterator[bytes]
+    started_at: float
+    first: asyncio.Future[bytes] = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.first = asyncio.ensure_future(self.stream.__anext__())
+
+    async def close(self) -> None:
+        if not self.first.done():
+            self.first.cancel()
+            with contextlib.suppress(BaseException):
+                await self.first
+        aclose = getattr(self.stream, "aclose", None)
+        if aclose is not None:
+            with contextlib.suppress(Exception):
+                await aclose()
+
+
+class HedgedAgent(AgentInterface):
+    """Composite agent that races providers on time-to-first-token.
+
+    The provider with the best recent p95 TTFT is started first. If it has not produced
+    output within the hedge delay, the next provider is started as well; whichever
+    streams first is kept and the other run is cancelled. Providers that fail before
+    producing output are skipped immediately.
+
+    Providers are the router's pooled instances, and each run is admitted under the
+    provider's own agent id, so hedged runs share connection pools, rate limits and
+    retries with direct requests; the router does not admit the composite itself.
+    """
+
+    def __init__(self, pool: AgentPool, settings: HedgeSettings | None = None) -> None:
+        from .config import AGENT_MAPPING  # imported lazily: config registers this class
+
+        self._pool = pool
+        self._settings = settings or get_hedge_settings()
+        self._agents: dict[str, AgentInterface] = {}
+        for agent_id in self._settings.agent_ids:
+            if agent_id not in AGENT_MAPPING:
+                raise AgentConfigurationError(
+                    f"AI_AUTO_AGENTS references unknown agent_id '{agent_id}'."
+                )
+            try:
+                agent_cls = AGENT_MAPPING[agent_id]
+            except AgentConfigurationError as exc:
+                logger.warning("Auto agent skipping agent_id=%s reason=%s", agent_id, exc)
+                continue
+            if agent_cls is HedgedAgent:
+                raise AgentConfigurationError(
+                    f"AI_AUTO_AGENTS lists '{agent_id}'; the auto agent cannot include itself."
+                )
+            try:
+                self._agents[agent_id] = pool.get_agent_instance(agent_id)
+            except AgentConfigurationError as exc:
+                logger.warning("Auto agent skipping agent_id=%s reason=%s", agent_id, exc)
+        if not self._agents:
+            raise AgentConfigurationError("No agent listed in AI_AUTO_AGENTS is configured.")
+        self._latency = {
+            agent_id: LatencyTracker(self._settings.window) for agent_id in self._agents
+        }
+
+    @property
+    def model(self) -> str:
+        return ",".join(f"{agent_id}={agent.model}" for agent_id, agent in self._agents.items())
+
+    def ranked_agent_ids(self) -> list[str]:
+        """Candidates ordered by recent p95 TTFT; unmeasured ones keep configured order."""
+        order = list(self._agents)
+
+        def key(agent_id: str) -> tuple[float, int]:
+            p95 = self._latency[agent_id].p95()
+            return (math.inf if p95 is None else p95, order.index(agent_id))
+
+        return sorted(order, key=key)
+
+    async def _plan_routes(
+        self, request: ChatRequest, candidates: list[str]
+    ) -> dict[str, ChatRequest]:
+        """Route the request to a model of each candidate, as the router does for one agent.
+
+        Candidates the request does not fit are dropped; raises AgentRequestTooLargeError
+        when it fits none of them.
+        """
+        planned: dict[str, ChatRequest] = {}
+        too_large: AgentRequestTooLargeError | None = None
+        for agent_id in candidates:
+            routes = self._agents[agent_id].model_routes()
+            if not routes:
+                planned[agent_id] = request
+                continue
+            try:
+                decision = await file_service.run_io(plan_route, request, routes)
+            except AgentRequestTooLargeError as exc:
+                logger.warning("Auto agent skipping agent_id=%s reason=%s", agent_id, exc)
+                if too_large is None or exc.limit > too_large.limit:
+                    too_large = exc
+                continue
+            logger.info(
+                "Routed auto agent candidate agent_id=%s model=%s tokens=%d limit=%d trimmed=%s",
+                agent_id,
+                decision.model,
+                decision.input_tokens,
+                decision.max_input_tokens,
+                decision.trimmed,
+            )
+            planned[agent_id] = request.model_copy(update={"route": decision})
+        if not planned:
+            raise too_large
+        return planned
+
+    async def _admitted_stream(
+        self, agent_id: str, request: ChatRequest, lease: AdmissionLease | None = None
+    ) -> AsyncIterator[bytes]:
+        # Waiting for a slot counts towards the race, so a saturated provider loses it.
+        admission = self._pool.admission
+        if lease is None:
+            lease = await admission.admit(agent_id)
+        if request.route is not None:
+            MODEL_ROUTES.inc(agent_id=agent_id, model=request.route.model)
+        agent = self._agents[agent_id]
+        stream = admission.run(lease, lambda: agent.process_stream(request))
+        async with contextlib.aclosing(stream):
+            async for chunk in stream:
+                yield chunk
+
+    async def _admit_first(
+        self, candidates: deque[str], rejected: list[AgentOverloadedError]
+    ) -> tuple[str, AdmissionLease]:
+        """Admit the first candidate that gets a slot, hedging the queue wait like a TTFT.
+
+        Candidates that shed the request are appended to ``rejected``; those not
+        admitted when another one wins stay in ``candidates``.
+        """
+        admission = self._pool.admission
+        pending: dict[asyncio.Future[AdmissionLease], str] = {}
+
+        def launch() -> None:
+            agent_id = candidates.popleft()
+            pending[asyncio.ensure_future(admission.admit(agent_id))] = agent_id
+
+        try:
+            launch()
+            while True:
+                timeout = self._settings.hedge_delay if candidates else None
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    launch()
+                    continue
+                for future in [f for f in pending if f in done]:
+                    agent_id = pending.pop(future)
+                    try:
+                        return agent_id, future.result()
+                    except AgentOverloadedError as exc:
+                        rejected.append(exc)
+                if candidates:
+                    launch()
+                elif not pending:
+                    raise AgentOverloadedError(
+                        "Every auto agent candidate is busy; retry later.",
+                        min(exc.retry_after for exc in rejected),
+                    )
+        finally:
+            for future in pending:
+                future.cancel()
+            results = await asyncio.gather(*pending, return_exceptions=True)
+            for result in results:
+                if isinstance(result, AdmissionLease):
+                    result.release()
+            # Not admitted in time, but still eligible as hedges, in their ranked order.
+            candidates.extendleft(reversed(pending.values()))
+
+    async def start(self, request: ChatRequest) -> AsyncIterator[bytes]:
+        """Route the request for each provider, admit a first one and return the hedged stream.
+
+        The router calls this instead of routing and taking a slot itself, so rejections
+        surface before the response starts: :class:`AgentRequestTooLargeError` when the
+        request fits no candidate, and :class:`AgentOverloadedError`, with the shortest
+        ``retry_after``, when every candidate sheds it.
+        """
+        requests = await self._plan_routes(request, self.ranked_agent_ids())
+        candidates = deque(requests)
+        rejected: list[AgentOverloadedError] = []
+        agent_id, lease = await self._admit_first(candidates, rejected)
+        first = self._admitted_stream(agent_id, requests[agent_id], lease)
+        # Release the slot even if the hedged stream is dropped before it is iterated.
+        weakref.finalize(first, lease.release).atexit = False
+        return self._race(requests, agent_id, first, candidates, rejected)
+
+    async def process_stream(self, request: ChatRequest) -> AsyncIterator[bytes]:
+        stream = await self.start(request)
+        async with contextlib.aclosing(stream):
+            async for chunk in stream:
+                yield chunk
+
+    async def _race(
+        self,
+        requests: dict[str, ChatRequest],
+        first_id: str,
+        first: AsyncIterator[bytes],
+        candidates: deque[str],
+        failures: list[BaseException],
+    ) -> AsyncIterator[bytes]:
+        loop = asyncio.get_running_loop()
+        racers: list[_Racer] = []
+        winner: _Racer | None = None
+
+        def launch() -> None:
+            agent_id = candidates.popleft()
+            if racers:
+                logger.info(
+                    "No first token after %.2fs; hedging request onto agent_id=%s",
+                    self._settings.hedge_delay,
+                    agent_id,
+                )
+                HEDGES.inc(agent_id=agent_id)
+            stream = self._admitted_stream(agent_id, requests[agent_id]).__aiter__()
+            racers.append(_Racer(agent_id, stream, loop.time()))
+
+        try:
+            racers.append(_Racer(first_id, first, loop.time()))
+            while winner is None:
+                timeout = self._settings.hedge_delay if candidates else None
+                done, _ = await asyncio.wait(
+                    [racer.first for racer in racers],
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    launch()
+                    continue
+                failed = False
+                for racer in [r for r in racers if r.first in done]:
+                    racers.remove(racer)
+                    try:
+                        racer.first.result()
+                    except (AgentError, StopAsyncIteration) as exc:
+                        # StopAsyncIteration: an empty stream is as useless as an error.
+                        logger.warning(
+                            "Auto agent candidate failed agent_id=%s reason=%r",
+                            racer.agent_id,
+                            exc,
+                        )
+                        if not isinstance(exc, AgentOverloadedError):
+                            self._latency[racer.agent_id].record_failure()
+                        failures.append(exc)
+                        failed = True
+                        continue
+                    if winner is None:
+                        winner = racer
+                    else:
+                        racers.append(racer)
+                if winner is None and failed and candidates:
+                    launch()
+                elif winner is None and not racers:
+                    if all(isinstance(exc, AgentOverloadedError) for exc in failures):
+                        raise AgentOverloadedError(
+                            "Every auto agent candidate is busy; retry later.",
+                            min(exc.retry_after for exc in failures),
+                        )
+                    raise AgentExecutionError(
+                        "All auto agent candidates failed."
+                    ) from failures[-1]
+        finally:
+            winner_ttft = None if winner is None else loop.time() - winner.started_at
+            for racer in racers:
+                if winner_ttft is not None:
+                    # Censored: the loser had no first token yet, so it was at least as
+                    # slow as the winner (and as its own elapsed time).
+                    censored = max(loop.time() - racer.started_at, winner_ttft)
+                    self._latency[racer.agent_id].record(censored)
+                await racer.close()
+
+        self._latency[winner.agent_id].record(winner_ttft)
+        logger.info("Auto agent served by agent_id=%s", winner.agent_id)
+        try:
+            yield winner.first.result()
+            async for chunk in winner.stream:
+                yield chunk
+        finally:
+            await winner.close()
+
+    async def aclose(self) -> None:
+        # The providers belong to the router's pool, which closes them itself.
+        return None
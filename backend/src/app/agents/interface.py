@@ -7,6 +7,83 @@ from typing import Literal
 from pydantic import BaseModel, Field
 
 
+class RelatedPassage(BaseModel):
+    """Excerpt from another workspace note retrieved as supporting context."""
+
+    path: str = Field(..., description="Workspace path of the note the passage came from.")
+    text: str = Field(..., description="Passage text included in the prompt.")
+    score: float = Field(..., description="Retrieval relevance score.")
+
+
+class ChatTurn(BaseModel):
+    """One message of a chat session, as it was sent to or received from the model."""
+
+    role: Literal["user", "assistant"]
+    text: str
+
+
+class SessionContext(BaseModel):
+    """Conversation state for a session turn, loaded and saved by the router.
+
+    Agents read the history and what the model has already seen of the document, and
+    record the new turn here before emitting their final event.
+    """
+
+    session_id: str
+    history: list[ChatTurn] = Field(default_factory=list)
+    sent_document: str | None = Field(
+        None, description="Full document content as of the last completed turn."
+    )
+    sent_context: str | None = Field(
+        None,
+        description=(
+            "Document context the model has been given in this session: the whole document,"
+            " or only the sections sent on the last turn."
+        ),
+    )
+    provider_state: dict[str, str] = Field(
+        default_factory=dict,
+        description="Provider-specific state, e.g. the OpenAI previous_response_id.",
+    )
+    version: int = Field(0, description="Store version this working copy was checked out at.")
+
+    def record_turn(self, user_text: str, answer: str, document: str, context: str) -> None:
+        self.history.append(ChatTurn(role="user", text=user_text))
+        self.history.append(ChatTurn(role="assistant", text=answer))
+        self.sent_document = document
+        self.sent_context = context
+
+
+class ModelRoute(BaseModel):
+    """One model a provider can route to, with the input size it accepts."""
+
+    model: str
+    max_input_tokens: int
+
+
+class RouteDecision(BaseModel):
+    """Model chosen for a request by the router's pre-flight token count."""
+
+    model: str
+    tier: int = Field(..., description="Index of the route, smallest context window first.")
+    input_tokens: int = Field(
+        ..., description="Counted prompt tokens, plus output room for full rewrites."
+    )
+    max_input_tokens: int
+    token_counter: Literal["tiktoken", "estimate"]
+    trimmed: bool = Field(False, description="Whether the document context was cut to fit.")
+    context_budget: int | None = Field(
+        None, description="Token budget for the document context when trimmed."
+    )
+    rewrite_model: str | None = Field(
+        None,
+        description=(
+            "Edits: model for a full rewrite, i.e. the fallback after a failed patch;"
+            " None if the rewrite fits no route."
+        ),
+    )
+
+
 class ChatRequest(BaseModel):
     """Unified request payload passed to concrete agent implementations."""
 
@@ -24,12 +101,51 @@ class ChatRequest(BaseModel):
         None,
         description="Optional selection of the file content provided by the client.",
     )
+    retrieval: bool = Field(
+        False,
+        description="Whether to add relevant passages from other workspace notes to the prompt.",
+    )
+    coalesce_deltas: bool = Field(
+        True,
+        description="Merge token deltas into fewer frames; disable for per-token frames.",
+    )
+    related_passages: list[RelatedPassage] = Field(
+        default_factory=list,
+        description="Passages from other notes, filled in by the router when retrieval is on.",
+    )
+    session_id: str | None = Field(
+        None,
+        description="Client-chosen conversation id; ask turns with the same id share a session.",
+    )
+    session: SessionContext | None = Field(
+        None, description="Session state, filled in by the router when session_id is set."
+    )
+    route: RouteDecision | None = Field(
+        None, description="Model routing decision, filled in by the router before the run."
+    )
 
 
 class AgentInterface(ABC):
     """Strategy interface for agent providers."""
 
+    @property
+    def model(self) -> str:
+        """Identifier of the upstream model; part of response cache keys."""
+        return ""
+
+    def model_routes(self) -> list[ModelRoute]:
+        """Models to route between by request size, smallest first; empty to opt out."""
+        return []
+
     @abstractmethod
     async def process_stream(self, request: ChatRequest) -> AsyncIterator[bytes]:
-        """Stream newline-delimited JSON chunks encoded as bytes."""
+        """Stream newline-delimited JSON chunks encoded as bytes.
+
+        The router closes the stream early when the client disconnects or the request is
+        stopped; implementations must abort their upstream run when that happens.
+        """
         raise NotImplementedError
+
+    async def aclose(self) -> None:
+        """Release long-lived resources such as HTTP connection pools."""
+        return None
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from .context import ContextSettings, build_document_context, estimate_tokens
+from .editing import edit_strategy_for
+from .exceptions import AgentConfigurationError, AgentExecutionError, AgentRequestTooLargeError
+from .interface import ChatRequest, ModelRoute, RouteDecision
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+logger = logging.getLogger("uvicorn.error").getChild(__name__)
+
+# Instructions, labels and the file path around the document and question.
+_PROMPT_OVERHEAD_TOKENS = 200
+# Smallest document budget worth sending when trimming an oversized ask.
+_MIN_TRIM_BUDGET = 500
+
+
+@dataclass(frozen=True)
+class RoutingSettings:
+    oversize: str  # "trim" or "reject"; edits are always rejected
+    count_cache_size: int
+
+
+def get_routing_settings() -> RoutingSettings:
+    """``AI_OVERSIZE_ASK`` decides what happens to asks larger than every route."""
+    oversize = os.getenv("AI_OVERSIZE_ASK", "trim").strip().lower()
+    return RoutingSettings(
+        oversize=oversize if oversize in {"trim", "reject"} else "trim",
+        count_cache_size=int(os.getenv("AI_TOKEN_COUNT_CACHE", "1024")),
+    )
+
+
+def parse_model_routes(
+    value: str | None, default_model: str, default_limit: int
+) -> list[ModelRoute]:
+    """Parse ``model:max_input_tokens`` pairs, smallest first, e.g. ``a:16000,b:1000000``.
+
+    Without a value the provider keeps its single configured model.
+    """
+    if not value or not value.strip():
+        return [ModelRoute(model=default_model, max_input_tokens=default_limit)]
+    routes: list[ModelRoute] = []
+    for item in value.split(","):
+        model, _, limit = item.strip().rpartition(":")
+        if not model or not limit.strip().isdigit():
+            raise AgentConfigurationError(
+                f"Invalid model route '{item.strip()}'; expected model:max_input_tokens."
+            )
+        routes.append(ModelRoute(model=model.strip(), max_input_tokens=int(limit)))
+    return sorted(routes, key=lambda route: route.max_input_tokens)
+
+
+class TokenCounter:
+    """Counts prompt tokens locally, caching results by content hash.
+
+    Uses tiktoken's ``o200k_base`` encoding when installed, otherwise the characters / 4
+    estimate used for context budgeting. Either way the count is an approximation for
+    non-OpenAI models, which is fine for choosing between context windows.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self._max_entries = max(max_entries, 0)
+        self._counts: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.get_encoding("o200k_base")
+            except Exception as exc:  # pragma: no cover - e.g. no network to fetch the BPE
+                logger.warning("tiktoken unavailable, estimating tokens reason=%s", exc)
+
+    @property
+    def method(self) -> str:
+        return "tiktoken" if self._encoding is not None else "estimate"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is None or len(text) < 256:
+            # Short strings are not worth hashing; estimates are fine at that size.
+            return estimate_tokens(text)
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            cached = self._counts.get(key)
+            if cached is not None:
+                self._counts.move_to_end(key)
+                return cached
+        tokens = len(self._encoding.encode(text, disallowed_special=()))
+        with self._lock:
+            self._counts[key] = tokens
+            while len(self._counts) > self._max_entries:
+                self._counts.popitem(last=False)
+        return tokens
+
+
+_counter: TokenCounter | None = None
+
+
+def _get_counter() -> TokenCounter:
+    global _counter
+    if _counter is None:
+        _counter = TokenCounter(get_routing_settings().count_cache_size)
+    return _counter
+
+
+def plan_route(
+    request: ChatRequest,
+    routes: list[ModelRoute],
+    settings: RoutingSettings | None = None,
+) -> RouteDecision:
+    """Pick the smallest route whose context window fits the request.
+
+    Ask prompts are counted as they will be sent (document context, selection, related
+    passages and question), plus the session history replayed before them. A
+    full-rewrite edit also needs room for the rewritten document in its output, so its
+    document counts twice. A patch edit is routed by its own size, and the smallest
+    route that fits a full rewrite is kept as ``rewrite_model`` for its fallback. Asks
+    larger than every route are trimmed to fit (or rejected, per ``AI_OVERSIZE_ASK``);
+    edits are rejected. Raises AgentRequestTooLargeError on rejection. Runs
+    synchronously; CPU-bound on large documents.
+    """
+    settings = settings or get_routing_settings()
+    counter = _get_counter()
+    extra = _PROMPT_OVERHEAD_TOKENS + counter.count(request.message)
+    extra += counter.count(request.selection or "")
+    extra += sum(counter.count(passage.text) for passage in request.related_passages)
+    if request.session is not None:
+        # Providers keep or replay earlier turns; either way they fill the context window.
+        extra += sum(counter.count(turn.text) for turn in request.session.history)
+
+    rewrite_tokens: int | None = None
+    if request.mode == "ask":
+        context = build_document_context(request.content, request.message, request.selection)
+        document_tokens = counter.count(context)
+    else:
+        document_tokens = counter.count(request.content)
+        rewrite_tokens = 2 * document_tokens + extra
+        if edit_strategy_for(request.content) == "full":
+            document_tokens *= 2
+    needed = document_tokens + extra
+
+    for index, route in enumerate(routes):
+        if needed <= route.max_input_tokens:
+            return RouteDecision(
+                model=route.model,
+                tier=index,
+                input_tokens=needed,
+                max_input_tokens=route.max_input_tokens,
+                token_counter=counter.method,
+                rewrite_model=_smallest_fit(routes, rewrite_tokens),
+            )
+
+    largest = routes[-1]
+    budget = largest.max_input_tokens - extra
+    if request.mode == "edit" or settings.oversize == "reject" or budget < _MIN_TRIM_BUDGET:
+        raise AgentRequestTooLargeError(
+            f"Request needs about {needed} tokens; the largest model "
+            f"({largest.model}) accepts {largest.max_input_tokens}.",
+            tokens=needed,
+            limit=largest.max_input_tokens,
+        )
+    # Trim with a budget in estimated tokens, scaled so the counted size fits the route.
+    ratio = document_tokens / max(estimate_tokens(context), 1)
+    context_budget = max(int(budget / max(ratio, 1.0)), _MIN_TRIM_BUDGET)
+    trimmed = build_document_context(
+        request.content,
+        request.message,
+        request.selection,
+        ContextSettings(mode="sections", token_budget=context_budget),
+    )
+    return RouteDecision(
+        model=largest.model,
+        tier=len(routes) - 1,
+        input_tokens=counter.count(trimmed) + extra,
+        max_input_tokens=largest.max_input_tokens,
+        token_counter=counter.method,
+        trimmed=True,
+        context_budget=context_budget,
+    )
+
+
+def _smallest_fit(routes: list[ModelRoute], tokens: int | None) -> str | None:
+    if tokens is None:
+        return None
+    return next((route.model for route in routes if tokens <= route.max_input_tokens), None)
+
+
+def context_settings_for(request: ChatRequest) -> ContextSettings | None:
+    """Context settings that honour a trimmed route; None for the defaults."""
+    if request.route is None or request.route.context_budget is None:
+        return None
+    return ContextSettings(mode="sections", token_budget=request.route.context_budget)
+
+
+def routed_model(request: ChatRequest, default: str) -> str:
+    return request.route.model if request.route is not None else default
+
+
+def rewrite_model(request: ChatRequest, default: str) -> str:
+    """Model for the full rewrite after a patch edit did not apply.
+
+    The patch was routed by its own size; the rewrite also outputs the whole document.
+    Raises AgentExecutionError if no route fits it.
+    """
+    if request.route is None:
+        return default
+    if request.route.rewrite_model is None:
+        raise AgentExecutionError(
+            "The edit patch did not apply, and a full rewrite of this document does not "
+            "fit any configured model."
+        )
+    return request.route.rewrite_model
+
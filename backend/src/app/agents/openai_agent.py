@@ -1,9 +1,8 @@
 from __future__ import annotations
 
-import json
+import logging
 import os
-import re
-from collections.abc import AsyncIterator
+from collections.abc import AsyncIterator, Callable
 from dataclasses import dataclass
 from functools import lru_cache
 from pathlib import Path
@@ -13,6 +12,7 @@ from agents import (
     Agent,
     ModelSettings,
     Runner,
+    TResponseInputItem,
     set_default_openai_client,
     set_default_openai_key,
 )
@@ -22,24 +22,86 @@ from dotenv import load_dotenv
 from openai import AsyncOpenAI
 from openai.types.responses import ResponseTextDeltaEvent
 
-from .exceptions import AgentConfigurationError, AgentExecutionError
-from .interface import AgentInterface, ChatRequest
+from .context import ContextSettings, build_document_context, format_related_passages
+from .editing import (
+    FULL_EDIT_INSTRUCTIONS,
+    PATCH_EDIT_INSTRUCTIONS,
+    edit_strategy_for,
+    resolve_full_output,
+    resolve_patch_output,
+)
+from .exceptions import AgentConfigurationError, AgentExecutionError, AgentPatchError
+from .interface import AgentInterface, ChatRequest, ModelRoute, RelatedPassage, SessionContext
+from .model_routing import (
+    context_settings_for,
+    parse_model_routes,
+    rewrite_model,
+    routed_model,
+)
+from .sessions import DocumentUpdate, document_update, format_document_update
+from .streaming import (
+    RESET_LINE,
+    CoalescePolicy,
+    delta_lines,
+    event_line,
+    get_coalesce_policy,
+    parse_final,
+)
+
+logger = logging.getLogger("uvicorn.error").getChild(__name__)
 
 
 class OpenAIAgent(AgentInterface):
     """Agent implementation backed by the OpenAI Agents SDK."""
 
+    def __init__(self) -> None:
+        # Resolve settings and the shared client up front so misconfiguration
+        # surfaces when the router warms the agent rather than mid-stream.
+        _configure_openai_client()
+        self._routes = parse_model_routes(
+            os.getenv("OPENAI_MODEL_ROUTES"),
+            _get_settings().model,
+            int(os.getenv("OPENAI_MAX_INPUT_TOKENS", "128000")),
+        )
+
+    @property
+    def model(self) -> str:
+        return _get_settings().model
+
+    def model_routes(self) -> list[ModelRoute]:
+        return self._routes
+
     async def process_stream(self, request: ChatRequest) -> AsyncIterator[bytes]:
+        policy = get_coalesce_policy(request.coalesce_deltas)
+        model = routed_model(request, _get_settings().model)
         if request.mode == "edit":
-            stream = _edit(request.path, request.content, request.message)
-            async for chunk in _jsonl_stream(stream, final_key="proposedContent"):
+            async for chunk in _edit(
+                request.path,
+                request.content,
+                request.message,
+                policy,
+                model,
+                lambda: rewrite_model(request, _get_settings().model),
+            ):
                 yield chunk
             return
 
-        stream = _ask(request.path, request.content, request.message)
-        async for chunk in _jsonl_stream(stream, final_key="answer"):
+        stream = _ask(
+            request.path,
+            request.content,
+            request.message,
+            request.selection,
+            request.related_passages,
+            request.session,
+            model,
+            context_settings_for(request),
+        )
+        async for chunk in _jsonl_stream(stream, final_key="answer", policy=policy):
             yield chunk
 
+    async def aclose(self) -> None:
+        await _close_openai_client()
+
 
 # Internal helpers replicate the previous ai_service module while remaining reusable.
 
@@ -75,44 +137,66 @@ def _get_settings() -> _AISettings:
 
 
 @lru_cache(maxsize=1)
-def _configure_openai_client() -> None:
-    """Configure the global Agents SDK client once based on environment settings."""
+def _configure_openai_client() -> AsyncOpenAI:
+    """Configure the global Agents SDK client once based on environment settings.
+
+    A single AsyncOpenAI client is shared by every OpenAI-backed agent so requests
+    reuse its keep-alive connection pool.
+    """
     settings = _get_settings()
     set_default_openai_key(settings.api_key)
-    if settings.base_url:
-        client = AsyncOpenAI(api_key=settings.api_key, base_url=settings.base_url)
-        set_default_openai_client(client)
+    client = AsyncOpenAI(api_key=settings.api_key, base_url=settings.base_url)
+    set_default_openai_client(client)
+    return client
 
 
-@lru_cache(maxsize=1)
-def _get_ask_agent() -> Agent[None]:
+async def _close_openai_client() -> None:
+    """Close the shared client, if one was created, so a later run starts fresh."""
+    if _configure_openai_client.cache_info().currsize == 0:
+        return
+    client = _configure_openai_client()
+    _configure_openai_client.cache_clear()
+    _get_ask_agent.cache_clear()
+    _get_edit_agent.cache_clear()
+    _get_patch_agent.cache_clear()
+    await client.close()
+
+
+@lru_cache(maxsize=8)
+def _get_ask_agent(model: str) -> Agent[None]:
     """Create a reusable agent for answering questions about markdown content."""
     _configure_openai_client()
-    settings = _get_settings()
     return Agent(
         name="Markdown QA",
         instructions=(
             "You are an expert technical writer and editor for Markdown documents. "
             "Answer questions precisely and concisely based on the provided content."
         ),
-        model=settings.model,
+        model=model,
         model_settings=ModelSettings(temperature=0.2),
     )
 
 
-@lru_cache(maxsize=1)
-def _get_edit_agent() -> Agent[None]:
+@lru_cache(maxsize=8)
+def _get_edit_agent(model: str) -> Agent[None]:
     """Create a reusable agent for editing markdown documents."""
     _configure_openai_client()
-    settings = _get_settings()
     return Agent(
         name="Markdown Editor",
-        instructions=(
-            "You are an expert Markdown editor. Always return the FULL UPDATED MARKDOWN "
-            "inside a single fenced code block using the language identifier 'markdown'. "
-            "Do not include any commentary outside the code fence."
-        ),
-        model=settings.model,
+        instructions=FULL_EDIT_INSTRUCTIONS,
+        model=model,
+        model_settings=ModelSettings(temperature=0.1),
+    )
+
+
+@lru_cache(maxsize=8)
+def _get_patch_agent(model: str) -> Agent[None]:
+    """Create a reusable agent that answers edit requests with SEARCH/REPLACE patches."""
+    _configure_openai_client()
+    return Agent(
+        name="Markdown Patch Editor",
+        instructions=PATCH_EDIT_INSTRUCTIONS,
+        model=model,
         model_settings=ModelSettings(temperature=0.1),
     )
 
@@ -132,11 +216,16 @@ def _normalize_output(output: object) -> str:
 class _StreamChunk:
     type: Literal["delta", "final"]
     text: str
+    response_id: str | None = None
 
 
-async def _stream_agent(agent: Agent[None], prompt: str) -> AsyncIterator[_StreamChunk]:
+async def _stream_agent(
+    agent: Agent[None],
+    prompt: str | list[TResponseInputItem],
+    previous_response_id: str | None = None,
+) -> AsyncIterator[_StreamChunk]:
     try:
-        run = Runner.run_streamed(agent, prompt)
+        run = Runner.run_streamed(agent, prompt, previous_response_id=previous_response_id)
     except AgentsException as exc:  # pragma: no cover - defensive: construction errors
         raise AgentExecutionError(f"Agent run failed: {exc}") from exc
     except Exception as exc:  # pragma: no cover - safety net for unexpected errors
@@ -154,50 +243,181 @@ async def _stream_agent(agent: Agent[None], prompt: str) -> AsyncIterator[_Strea
         raise AgentExecutionError(f"Agent run failed: {exc}") from exc
     except Exception as exc:  # pragma: no cover - safety net for unexpected errors
         raise AgentExecutionError("Unexpected error while running the AI agent.") from exc
+    finally:
+        # Reached early when the consumer stops listening; abort the background run.
+        if not run.is_complete:
+            run.cancel()
 
     final_output = _normalize_output(getattr(run, "final_output", None))
-    yield _StreamChunk(type="final", text=final_output)
+    yield _StreamChunk(type="final", text=final_output, response_id=run.last_response_id)
+
+
+async def _ask(
+    path: str,
+    content: str,
+    message: str,
+    selection: str | None = None,
+    related_passages: list[RelatedPassage] | None = None,
+    session: SessionContext | None = None,
+    model: str | None = None,
+    context_settings: ContextSettings | None = None,
+) -> AsyncIterator[_StreamChunk]:
+    agent = _get_ask_agent(model or _get_settings().model)
+    context = build_document_context(content, message, selection, context_settings)
+    update = document_update(session, content, context)
+    document = format_document_update(update.kind, update.text)
+    prompt = f"File: {path}\n\nContent:\n\n{document}\n\n"
+    if selection:
+        prompt += f"Selection:\n\n{selection}\n\n"
+    if related_passages:
+        prompt += f"{format_related_passages(related_passages)}\n\n"
+    prompt += f"Question: {message}"
+    if session is None:
+        async for chunk in _stream_agent(agent, prompt):
+            yield chunk
+        return
 
+    run_input, previous_response_id = _session_input(session, prompt)
+    started = False
+    try:
+        async for chunk in _stream_agent(agent, run_input, previous_response_id):
+            started = True
+            if chunk.type == "final":
+                _record_session_turn(session, prompt, chunk, update)
+            yield chunk
+        return
+    except AgentExecutionError as exc:
+        if started or previous_response_id is None:
+            raise
+        # The stored response may have expired upstream; replay the conversation instead.
+        logger.warning(
+            "Previous response unusable, replaying session history session_id=%s reason=%s",
+            session.session_id,
+            exc,
+        )
+        session.provider_state.pop(_RESPONSE_ID_KEY, None)
 
-async def _ask(path: str, content: str, message: str) -> AsyncIterator[_StreamChunk]:
-    agent = _get_ask_agent()
-    prompt = f"File: {path}\n\nContent:\n\n{content}\n\nQuestion: {message}"
-    async for chunk in _stream_agent(agent, prompt):
+    run_input, _ = _session_input(session, prompt)
+    async for chunk in _stream_agent(agent, run_input):
+        if chunk.type == "final":
+            _record_session_turn(session, prompt, chunk, update)
         yield chunk
 
 
-_FENCE_RE = re.compile(r"```(?:markdown|md)?\n([\s\S]*?)\n```", re.IGNORECASE)
-
-
-def _extract_markdown(text: str) -> str:
-    match = _FENCE_RE.search(text)
-    if match:
-        return match.group(1).strip()
-    return text.strip()
-
-
-async def _edit(path: str, content: str, message: str) -> AsyncIterator[_StreamChunk]:
-    agent = _get_edit_agent()
+_RESPONSE_ID_KEY = "openai_response_id"
+_RESPONSE_TURNS_KEY = "openai_response_turns"
+
+
+def _session_input(
+    session: SessionContext, prompt: str
+) -> tuple[str | list[TResponseInputItem], str | None]:
+    """Continue from the stored response when it covers the whole history, else replay it."""
+    if not session.history:
+        return prompt, None
+    state = session.provider_state
+    if state.get(_RESPONSE_ID_KEY) and state.get(_RESPONSE_TURNS_KEY) == str(len(session.history)):
+        return prompt, state[_RESPONSE_ID_KEY]
+    items: list[TResponseInputItem] = [
+        {"role": turn.role, "content": turn.text} for turn in session.history
+    ]
+    items.append({"role": "user", "content": prompt})
+    return items, None
+
+
+def _record_session_turn(
+    session: SessionContext, prompt: str, chunk: _StreamChunk, update: DocumentUpdate
+) -> None:
+    session.record_turn(prompt, chunk.text, update.document, update.seen)
+    if chunk.response_id:
+        session.provider_state[_RESPONSE_ID_KEY] = chunk.response_id
+        session.provider_state[_RESPONSE_TURNS_KEY] = str(len(session.history))
+    else:
+        session.provider_state.pop(_RESPONSE_ID_KEY, None)
+
+
+async def _edit(
+    path: str,
+    content: str,
+    message: str,
+    policy: CoalescePolicy | None = None,
+    model: str | None = None,
+    fallback_model: Callable[[], str] | None = None,
+) -> AsyncIterator[bytes]:
+    model = model or _get_settings().model
+    if edit_strategy_for(content) == "patch":
+        applied = False
+        stream = _edit_with_patch(path, content, message, model)
+        async for line in _jsonl_stream(stream, final_key="proposedContent", policy=policy):
+            applied = applied or parse_final(line) is not None
+            yield line
+        if applied:
+            return
+        # A full rewrite may need a larger model than the patch did.
+        if fallback_model is not None:
+            model = fallback_model()
+        # The SEARCH/REPLACE text streamed so far is not part of the answer.
+        yield RESET_LINE
+
+    stream = _edit_full(path, content, message, model)
+    async for line in _jsonl_stream(
+        stream, final_key="proposedContent", policy=policy, preview=True
+    ):
+        yield line
+
+
+async def _edit_full(
+    path: str, content: str, message: str, model: str
+) -> AsyncIterator[_StreamChunk]:
+    agent = _get_edit_agent(model)
     prompt = (
         f"File: {path}\n\nCurrent Markdown content:\n\n{content}\n\nInstruction:\n{message}\n\n"
         "Remember to respond ONLY with a single fenced code block containing the full updated markdown."
     )
     async for chunk in _stream_agent(agent, prompt):
         if chunk.type == "final":
-            proposed = _extract_markdown(chunk.text)
-            if not proposed:
-                raise AgentExecutionError("Agent returned an empty edit.")
-            yield _StreamChunk(type="final", text=proposed)
+            yield _StreamChunk(type="final", text=resolve_full_output(chunk.text))
         else:
             yield chunk
 
 
+async def _edit_with_patch(
+    path: str, content: str, message: str, model: str
+) -> AsyncIterator[_StreamChunk]:
+    """Ask for SEARCH/REPLACE blocks; yields no final chunk if the patch does not apply."""
+    agent = _get_patch_agent(model)
+    prompt = (
+        f"File: {path}\n\nCurrent Markdown content:\n\n{content}\n\nInstruction:\n{message}\n\n"
+        "Remember to respond ONLY with SEARCH/REPLACE blocks."
+    )
+    async for chunk in _stream_agent(agent, prompt):
+        if chunk.type != "final":
+            yield chunk
+            continue
+        try:
+            yield _StreamChunk(type="final", text=resolve_patch_output(content, chunk.text))
+        except AgentPatchError as exc:
+            logger.warning(
+                "Edit patch rejected, falling back to full rewrite path=%s reason=%s", path, exc
+            )
+
+
 async def _jsonl_stream(
-    stream: AsyncIterator[_StreamChunk], *, final_key: str
+    stream: AsyncIterator[_StreamChunk],
+    *,
+    final_key: str,
+    policy: CoalescePolicy | None = None,
+    preview: bool = False,
 ) -> AsyncIterator[bytes]:
-    async for chunk in stream:
-        if chunk.type == "delta":
-            payload = {"type": "delta", "text": chunk.text}
-        else:
-            payload = {"type": "final", final_key: chunk.text}
-        yield (json.dumps(payload) + "\n").encode("utf-8")
+    final: list[str] = []
+
+    async def deltas() -> AsyncIterator[str]:
+        async for chunk in stream:
+            if chunk.type == "delta":
+                yield chunk.text
+            else:
+                final.append(chunk.text)
+
+    async for line in delta_lines(deltas(), policy, preview=preview):
+        yield line
+    for text in final:
+        yield event_line({"type": "final", final_key: text})
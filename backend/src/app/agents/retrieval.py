@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import dataclass
+
+from ..services import search_service
+from .context import estimate_tokens
+from .interface import ChatRequest, RelatedPassage
+
+_BLOCK_SPLIT_RE = re.compile(r"\n\s*\n")
+_PASSAGE_CHARS = 800
+
+
+@dataclass(frozen=True)
+class RetrievalSettings:
+    top_k: int
+    token_budget: int
+
+
+def get_retrieval_settings() -> RetrievalSettings:
+    """Read cross-document retrieval limits from the environment."""
+    return RetrievalSettings(
+        top_k=int(os.getenv("AI_RETRIEVAL_TOP_K", "4")),
+        token_budget=int(os.getenv("AI_RETRIEVAL_TOKEN_BUDGET", "1500")),
+    )
+
+
+def retrieve_passages(
+    request: ChatRequest, settings: RetrievalSettings | None = None
+) -> list[RelatedPassage]:
+    """Pick the passages from other notes that best match the question, within budget.
+
+    Candidate notes come from the workspace search index; each is cut into paragraph-sized
+    passages and the best passage per note is kept. Blocking file I/O: call off the loop.
+    """
+    settings = settings or get_retrieval_settings()
+    query = " ".join(filter(None, [request.message, request.selection]))
+    documents, weights = search_service.related_documents(
+        query, limit=settings.top_k * 2, exclude_path=request.path
+    )
+    if not weights:
+        return []
+
+    candidates: list[RelatedPassage] = []
+    for path, doc_score in documents:
+        text = search_service.read_indexed_text(path)
+        if not text:
+            continue
+        best = max(_passages(text), key=lambda p: _passage_score(p, weights), default=None)
+        if best is None:
+            continue
+        score = doc_score * (1 + _passage_score(best, weights))
+        candidates.append(RelatedPassage(path=path, text=best, score=round(score, 4)))
+
+    chosen: list[RelatedPassage] = []
+    remaining = settings.token_budget
+    for passage in sorted(candidates, key=lambda p: -p.score):
+        if len(chosen) >= settings.top_k:
+            break
+        cost = estimate_tokens(passage.text)
+        if cost <= remaining:
+            chosen.append(passage)
+            remaining -= cost
+    return chosen
+
+
+def _passages(text: str) -> list[str]:
+    """Merge paragraphs into passages of roughly ``_PASSAGE_CHARS`` characters."""
+    passages: list[str] = []
+    current = ""
+    for block in _BLOCK_SPLIT_RE.split(text):
+        block = block.strip()
+        if not block:
+            continue
+        if current and len(current) + len(block) > _PASSAGE_CHARS:
+            passages.append(current)
+            current = ""
+        current = f"{current}\n\n{block}" if current else block
+        while len(current) > _PASSAGE_CHARS * 2:
+            passages.append(current[:_PASSAGE_CHARS])
+            current = current[_PASSAGE_CHARS:]
+    if current:
+        passages.append(current)
+    return passages
+
+
+def _passage_score(passage: str, weights: dict[str, float]) -> float:
+    terms = set(search_service.tokenize(passage))
+    return sum(weight for term, weight in weights.items() if term in terms)
@@ -1,32 +1,350 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
+import logging
+import os
+import weakref
+from collections.abc import AsyncIterator, Callable, Iterable, Mapping
 from typing import Type
 
 from fastapi.responses import StreamingResponse
 
+from ..services import file_service
+from ..services.metrics_service import RequestTimings
+from .admission import AdmissionController
+from .cancellation import ActiveStreams, DisconnectCheck, guard_stream
+from .cache import ResponseCache, create_response_cache, make_cache_key
 from .config import AGENT_MAPPING
-from .exceptions import AgentNotFoundError
-from .interface import AgentInterface, ChatRequest
+from .exceptions import (
+    AgentError,
+    AgentExecutionError,
+    AgentNotFoundError,
+    AgentOverloadedError,
+    AgentRequestTooLargeError,
+    AgentSessionBusyError,
+)
+from .hedged_agent import HedgedAgent
+from .interface import AgentInterface, ChatRequest, RelatedPassage, SessionContext
+from .model_routing import plan_route
+from .retrieval import retrieve_passages
+from .sessions import SessionStore
+from .singleflight import SingleFlight
+from .streaming import event_line, parse_final
+from .telemetry import (
+    CACHE_HITS,
+    COALESCED,
+    MODEL_ROUTES,
+    REQUESTS,
+    instrument_stream,
+    observe_stages,
+)
+
+logger = logging.getLogger("uvicorn.error").getChild(__name__)
 
 
 class AgentRouterService:
-    """Routes chat requests to the configured agent implementation."""
+    """Routes chat requests to the configured agent implementation.
+
+    Agent instances are long-lived: each agent_id is constructed once, reused for
+    every request, and closed when the application shuts down. Ask-mode responses
+    are optionally served from a content-addressed cache, and identical concurrent
+    requests share a single upstream run. Upstream runs are admitted per agent_id
+    (concurrency cap, rate limit, bounded queue). Live streams are registered by
+    request ID and abort their upstream run when stopped or when the client disconnects.
+    Ask requests carrying a session_id continue a server-side conversation instead;
+    those are never cached or coalesced.
+    """
 
-    def __init__(self, registry: dict[str, Type[AgentInterface]] | None = None) -> None:
-        self._registry: dict[str, Type[AgentInterface]] = registry or AGENT_MAPPING
+    def __init__(
+        self,
+        registry: Mapping[str, Type[AgentInterface]] | None = None,
+        cache: ResponseCache | None = None,
+        admission: AdmissionController | None = None,
+        sessions: SessionStore | None = None,
+    ) -> None:
+        self._registry: Mapping[str, Type[AgentInterface]] = registry or AGENT_MAPPING
+        self._instances: dict[str, AgentInterface] = {}
+        self._load_lock = asyncio.Lock()
+        self._cache = cache if cache is not None else create_response_cache()
+        self._single_flight = (
+            SingleFlight() if os.getenv("AI_SINGLE_FLIGHT", "true").lower() != "false" else None
+        )
+        self._active = ActiveStreams()
+        self._admission = admission or AdmissionController()
+        self._sessions = sessions or SessionStore()
+
+    @property
+    def admission(self) -> AdmissionController:
+        return self._admission
 
     def get_agent_instance(self, agent_id: str) -> AgentInterface:
+        agent = self._instances.get(agent_id)
+        if agent is not None:
+            return agent
         agent_cls = self._registry.get(agent_id)
         if agent_cls is None:
             raise AgentNotFoundError(
                 f"Unknown agent_id '{agent_id}'. Available agents: {list(self._registry)}"
             )
-        return agent_cls()
+        agent = agent_cls(self) if issubclass(agent_cls, HedgedAgent) else agent_cls()
+        self._instances[agent_id] = agent
+        return agent
+
+    async def aget_agent_instance(self, agent_id: str) -> AgentInterface:
+        """Like get_agent_instance, but loads a new provider off the event loop."""
+        agent = self._instances.get(agent_id)
+        if agent is not None:
+            return agent
+        # Importing a provider SDK can take a second. A thread keeps the loop from being
+        # blocked outright, but imports hold the GIL, so live streams still stutter (a few
+        # hundred ms); AI_WARM_UP_AGENTS moves the import to startup.
+        async with self._load_lock:
+            return await asyncio.to_thread(self.get_agent_instance, agent_id)
+
+    def warm_up(self, agent_ids: Iterable[str] | None = None) -> None:
+        """Eagerly construct agents (all registered by default), skipping misconfigured ones."""
+        for agent_id in self._registry if agent_ids is None else agent_ids:
+            try:
+                self.get_agent_instance(agent_id)
+            except AgentError as exc:
+                logger.warning("Skipping agent warm-up agent_id=%s reason=%s", agent_id, exc)
+
+    async def aclose(self) -> None:
+        """Close all pooled agent instances."""
+        instances, self._instances = self._instances, {}
+        for agent_id, agent in instances.items():
+            try:
+                await agent.aclose()
+            except Exception:  # pragma: no cover - best-effort shutdown
+                logger.exception("Failed to close agent agent_id=%s", agent_id)
+
+    def cancel(self, request_id: str) -> bool:
+        """Stop a live stream by request ID; returns False if no such stream is running."""
+        return self._active.cancel(request_id)
+
+    async def route_request(
+        self,
+        request: ChatRequest,
+        is_disconnected: DisconnectCheck | None = None,
+        timings: RequestTimings | None = None,
+    ) -> StreamingResponse:
+        timings = timings or RequestTimings()
+        with timings.stage("agent"):
+            agent = await self.aget_agent_instance(request.agent_id)
+        if request.retrieval and request.mode == "ask" and not request.related_passages:
+            with timings.stage("retrieval"):
+                passages = await file_service.run_io(retrieve_passages, request)
+            request = request.model_copy(update={"related_passages": passages})
+        headers: dict[str, str] = {}
+        session: SessionContext | None = None
+        if request.session_id and request.mode == "ask":
+            session = self._sessions.checkout(request.session_id, request.agent_id, request.path)
+            request = request.model_copy(update={"session": session})
+            headers["X-AI-Session-Id"] = session.session_id
+        request = await self._preflight(request, agent, timings)
+        if request.route is not None:
+            headers["X-AI-Model"] = request.route.model
+        key = make_cache_key(request, _model_for(request, agent))
+        cacheable = self._cache is not None and request.mode == "ask" and session is None
+        single_flight = self._single_flight if session is None else None
+
+        if cacheable:
+            with timings.stage("cache"):
+                cached = await self._cache.get(key)
+            if cached is not None:
+                logger.info("AI response cache hit agent_id=%s key=%s", request.agent_id, key)
+                CACHE_HITS.inc(agent_id=request.agent_id)
+                headers["X-AI-Cache"] = "HIT"
+                headers["Server-Timing"] = timings.server_timing()
+                return StreamingResponse(
+                    instrument_stream(_replay(cached), request, timings),
+                    media_type="application/jsonl",
+                    headers=headers,
+                )
+            logger.info("AI response cache miss agent_id=%s key=%s", request.agent_id, key)
+            headers["X-AI-Cache"] = "MISS"
+
+        # Joining an in-flight run costs no upstream capacity, so only new runs queue. The
+        # auto agent routes, admits and retries each provider it races under that
+        # provider's own agent id, so it is not admitted or retried as a whole.
+        lease = None
+        hedged: AsyncIterator[bytes] | None = None
+        if single_flight is None or not single_flight.in_flight(key):
+            try:
+                with timings.stage("queue"):
+                    if isinstance(agent, HedgedAgent):
+                        hedged = await agent.start(request)
+                    else:
+                        lease = await self._admission.admit(request.agent_id)
+            except (AgentOverloadedError, AgentRequestTooLargeError):
+                REQUESTS.inc(agent_id=request.agent_id, mode=request.mode, outcome="rejected")
+                observe_stages(request.agent_id, timings)
+                raise
+
+        end_turn = None
+        if session is not None:
+            try:
+                end_turn = self._sessions.begin_turn(session)
+            except AgentSessionBusyError:
+                if lease is not None:
+                    lease.release()
+                hedged = None  # dropping the unstarted hedged stream releases its slot
+                REQUESTS.inc(agent_id=request.agent_id, mode=request.mode, outcome="rejected")
+                raise
+
+        def start_stream() -> AsyncIterator[bytes]:
+            stream = hedged or self._admission.run(lease, lambda: agent.process_stream(request))
+            if request.related_passages:
+                stream = _attach_sources(stream, request.related_passages)
+            if cacheable:
+                stream = self._cache.record(key, stream)
+            if session is not None:
+                stream = _save_session(
+                    stream,
+                    lambda: self._sessions.save(request.agent_id, request.path, session),
+                    end_turn,
+                )
+                # Like admission leases: a body that never starts still ends the turn.
+                weakref.finalize(stream, end_turn).atexit = False
+            return stream
+
+        if single_flight is None:
+            stream = start_stream()
+        else:
+            stream, joined = single_flight.join(key, start_stream)
+            if joined:
+                # An identical run started while this request was queued.
+                if lease is not None:
+                    lease.release()
+                hedged = None
+                logger.info(
+                    "Coalesced AI request onto in-flight stream agent_id=%s key=%s",
+                    request.agent_id,
+                    key,
+                )
+                COALESCED.inc(agent_id=request.agent_id)
+                headers["X-AI-Coalesced"] = "true"
+
+        control = self._active.open()
+        headers["X-AI-Request-Id"] = control.request_id
+        headers["Server-Timing"] = timings.server_timing()
+        stream = guard_stream(
+            stream, control, is_disconnected, on_close=lambda: self._active.close(control)
+        )
+        # The guard only unregisters once iterated; a body that never starts (the client
+        # left before the response was sent) is unregistered when it is collected.
+        weakref.finalize(stream, self._active.close, control).atexit = False
+        stream = instrument_stream(stream, request, timings, control)
+        return StreamingResponse(stream, media_type="application/jsonl", headers=headers)
+
+    async def _preflight(
+        self, request: ChatRequest, agent: AgentInterface, timings: RequestTimings
+    ) -> ChatRequest:
+        """Count prompt tokens and pick the agent's model for this request's size.
+
+        Oversized requests are trimmed or rejected here, before they take an admission
+        slot or cost an upstream round trip.
+        """
+        routes = agent.model_routes()
+        if not routes:
+            return request
+        try:
+            with timings.stage("preflight"):
+                decision = await file_service.run_io(plan_route, request, routes)
+        except AgentRequestTooLargeError:
+            REQUESTS.inc(agent_id=request.agent_id, mode=request.mode, outcome="rejected")
+            observe_stages(request.agent_id, timings)
+            raise
+        MODEL_ROUTES.inc(agent_id=request.agent_id, model=decision.model)
+        logger.info(
+            "Routed AI request agent_id=%s model=%s tokens=%d limit=%d trimmed=%s",
+            request.agent_id,
+            decision.model,
+            decision.input_tokens,
+            decision.max_input_tokens,
+            decision.trimmed,
+        )
+        return request.model_copy(update={"route": decision})
+
+    async def complete(self, request: ChatRequest) -> dict:
+        """Run a request to completion and return its final event payload.
+
+        Used by background work such as batch jobs: the run goes through the same
+        cache and admission control as interactive chats but is not streamed anywhere.
+        """
+        timings = RequestTimings()
+        with timings.stage("agent"):
+            agent = await self.aget_agent_instance(request.agent_id)
+        request = await self._preflight(request, agent, timings)
+        key = make_cache_key(request, _model_for(request, agent))
+        cacheable = self._cache is not None and request.mode == "ask"
+        if cacheable:
+            with timings.stage("cache"):
+                cached = await self._cache.get(key)
+            if cached is not None:
+                CACHE_HITS.inc(agent_id=request.agent_id)
+                stream = instrument_stream(_replay(cached), request, timings)
+                return await _final_payload(stream)
+        try:
+            with timings.stage("queue"):
+                if isinstance(agent, HedgedAgent):
+                    stream = await agent.start(request)
+                else:
+                    lease = await self._admission.admit(request.agent_id)
+                    stream = self._admission.run(lease, lambda: agent.process_stream(request))
+        except (AgentOverloadedError, AgentRequestTooLargeError):
+            REQUESTS.inc(agent_id=request.agent_id, mode=request.mode, outcome="rejected")
+            observe_stages(request.agent_id, timings)
+            raise
+        if cacheable:
+            stream = self._cache.record(key, stream)
+        return await _final_payload(instrument_stream(stream, request, timings))
+
+
+def _model_for(request: ChatRequest, agent: AgentInterface) -> str:
+    return request.route.model if request.route is not None else agent.model
+
+
+async def _final_payload(stream: AsyncIterator[bytes]) -> dict:
+    final: dict | None = None
+    async with contextlib.aclosing(stream):
+        async for chunk in stream:
+            final = parse_final(chunk) or final
+    if final is None:
+        raise AgentExecutionError("Agent stream ended without a final event.")
+    return final
+
+
+async def _replay(payload: bytes) -> AsyncIterator[bytes]:
+    for line in payload.splitlines(keepends=True):
+        yield line
+
+
+async def _save_session(
+    stream: AsyncIterator[bytes], save: Callable[[], None], end_turn: Callable[[], None]
+) -> AsyncIterator[bytes]:
+    """Store the session once the turn has completed; failed turns leave it untouched."""
+    try:
+        async for chunk in stream:
+            if parse_final(chunk) is not None:
+                save()
+            yield chunk
+    finally:
+        end_turn()
+
 
-    def route_request(self, request: ChatRequest) -> StreamingResponse:
-        agent = self.get_agent_instance(request.agent_id)
-        stream = agent.process_stream(request)
-        return StreamingResponse(stream, media_type="application/jsonl")
+async def _attach_sources(
+    stream: AsyncIterator[bytes], passages: list[RelatedPassage]
+) -> AsyncIterator[bytes]:
+    """Cite the retrieved notes in the final event."""
+    sources = [{"path": p.path, "score": p.score} for p in passages]
+    async for chunk in stream:
+        payload = parse_final(chunk)
+        if payload is not None:
+            payload["sources"] = sources
+            chunk = event_line(payload)
+        yield chunk
 
 
 agent_router_service = AgentRouterService()
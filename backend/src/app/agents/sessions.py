@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import difflib
+import os
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Literal
+
+from .context import estimate_tokens
+from .exceptions import AgentSessionBusyError
+from .interface import SessionContext
+
+DocumentUpdateKind = Literal["full", "delta", "unchanged"]
+
+
+@dataclass(frozen=True)
+class SessionSettings:
+    ttl_seconds: float
+    max_sessions: int
+    max_delta_ratio: float
+    max_turns: int
+    history_tokens: int
+
+
+def get_session_settings() -> SessionSettings:
+    """Chat session settings.
+
+    Sessions idle for ``AI_SESSION_TTL`` seconds are dropped, at most ``AI_SESSION_MAX``
+    are kept (least recently used first out). A document diff is only sent while it is
+    smaller than ``AI_SESSION_MAX_DELTA_RATIO`` times the document context. History keeps
+    the last ``AI_SESSION_MAX_TURNS`` turns within ``AI_SESSION_HISTORY_TOKENS`` estimated
+    tokens.
+    """
+    return SessionSettings(
+        ttl_seconds=float(os.getenv("AI_SESSION_TTL", "1800")),
+        max_sessions=int(os.getenv("AI_SESSION_MAX", "256")),
+        max_delta_ratio=float(os.getenv("AI_SESSION_MAX_DELTA_RATIO", "0.5")),
+        max_turns=int(os.getenv("AI_SESSION_MAX_TURNS", "20")),
+        history_tokens=int(os.getenv("AI_SESSION_HISTORY_TOKENS", "16000")),
+    )
+
+
+@dataclass
+class _StoredSession:
+    agent_id: str
+    path: str
+    context: SessionContext
+    updated_at: float
+
+
+class SessionStore:
+    """Bounded, TTL-evicted in-memory store of chat sessions.
+
+    Turns work on a copy of the stored session, which is only saved back once the turn
+    completes, so failed or cancelled turns leave the session untouched. One turn per
+    session runs at a time; see :meth:`begin_turn`.
+    """
+
+    def __init__(self, settings: SessionSettings | None = None) -> None:
+        self._settings = settings or get_session_settings()
+        self._sessions: OrderedDict[str, _StoredSession] = OrderedDict()
+        self._versions: dict[str, int] = {}
+        self._turns: dict[str, object] = {}
+
+    def checkout(self, session_id: str, agent_id: str, path: str) -> SessionContext:
+        """Working copy of a session; a new one if unknown, expired or for another file."""
+        self._evict_expired()
+        stored = self._sessions.get(session_id)
+        version = self._versions.get(session_id, 0)
+        if stored is None or stored.agent_id != agent_id or stored.path != path:
+            return SessionContext(session_id=session_id, version=version)
+        return stored.context.model_copy(deep=True)
+
+    def begin_turn(self, context: SessionContext) -> Callable[[], None]:
+        """Claim the session for the turn working on ``context``; returns its release.
+
+        Raises AgentSessionBusyError while another turn on the session is unfinished, or
+        when one completed after ``context`` was checked out: saving this turn would
+        silently overwrite it. The release is idempotent.
+        """
+        session_id = context.session_id
+        if session_id in self._turns or self._versions.get(session_id, 0) != context.version:
+            raise AgentSessionBusyError(
+                f"Session '{session_id}' has another turn in progress; retry once it finishes."
+            )
+        turn = object()
+        self._turns[session_id] = turn
+
+        def release() -> None:
+            if self._turns.get(session_id) is turn:
+                del self._turns[session_id]
+
+        return release
+
+    def save(self, agent_id: str, path: str, context: SessionContext) -> None:
+        context.version += 1
+        self._versions[context.session_id] = context.version
+        self._trim_history(context)
+        self._sessions[context.session_id] = _StoredSession(
+            agent_id=agent_id, path=path, context=context, updated_at=time.monotonic()
+        )
+        self._sessions.move_to_end(context.session_id)
+        while len(self._sessions) > self._settings.max_sessions:
+            self._forget(self._sessions.popitem(last=False)[0])
+
+    def _trim_history(self, context: SessionContext) -> None:
+        """Drop the oldest turns beyond the turn and token limits."""
+        history = context.history
+        start = max(0, len(history) - 2 * self._settings.max_turns)
+        tokens = sum(estimate_tokens(turn.text) for turn in history[start:])
+        while start < len(history) and tokens > self._settings.history_tokens:
+            tokens -= sum(estimate_tokens(turn.text) for turn in history[start : start + 2])
+            start += 2
+        if start:
+            context.history = history[start:]
+            # The document went out with a dropped turn; the next turn resends it.
+            context.sent_document = None
+            context.sent_context = None
+
+    def _forget(self, session_id: str) -> None:
+        # Versions of sessions with a turn running are kept so that turn can still save.
+        if session_id not in self._turns:
+            self._versions.pop(session_id, None)
+
+    def _evict_expired(self) -> None:
+        cutoff = time.monotonic() - self._settings.ttl_seconds
+        while self._sessions:
+            session_id, stored = next(iter(self._sessions.items()))
+            if stored.updated_at >= cutoff:
+                break
+            del self._sessions[session_id]
+            self._forget(session_id)
+
+
+@dataclass(frozen=True)
+class DocumentUpdate:
+    """What a session turn sends in place of the document, and what the model then has."""
+
+    kind: DocumentUpdateKind
+    text: str
+    # Full document content of this turn.
+    document: str
+    # What the model has seen of the document once this turn is sent.
+    seen: str
+
+
+def document_update(
+    session: SessionContext | None,
+    document: str,
+    context: str,
+    settings: SessionSettings | None = None,
+) -> DocumentUpdate:
+    """Decide how much of the document a session turn has to send.
+
+    ``document`` is the full content and ``context`` the part of it chosen for this
+    question (the whole document unless it was cut to sections). A diff is taken between
+    full documents, and only when the model was given the whole document before: a diff
+    between two different section selections would describe edits nobody made. Returns
+    ``unchanged`` when the model already has what it needs, ``delta`` with a unified diff
+    of the document when the change is small, and ``full`` with ``context`` otherwise.
+    """
+    full = DocumentUpdate("full", context, document, context)
+    if session is None or session.sent_document is None or session.sent_context is None:
+        return full
+    if session.sent_context != session.sent_document:
+        # The model only saw sections: resend the selection unless nothing changed.
+        if session.sent_document == document and session.sent_context == context:
+            return DocumentUpdate("unchanged", "", document, context)
+        return full
+    if session.sent_document == document:
+        return DocumentUpdate("unchanged", "", document, document)
+    settings = settings or get_session_settings()
+    diff = "".join(
+        difflib.unified_diff(
+            session.sent_document.splitlines(keepends=True),
+            document.splitlines(keepends=True),
+            fromfile="previous",
+            tofile="current",
+            n=2,
+        )
+    )
+    if len(diff) > len(context) * settings.max_delta_ratio:
+        return full
+    return DocumentUpdate("delta", diff, document, document)
+
+
+def format_document_update(kind: DocumentUpdateKind, text: str) -> str:
+    """Prompt text standing in for the document on a session turn."""
+    if kind == "unchanged":
+        return "(Unchanged since the previous turn.)"
+    if kind == "delta":
+        return (
+            "Changed since the previous turn. Unified diff against the version you saw:\n\n"
+            f"{text}"
+        )
+    return text
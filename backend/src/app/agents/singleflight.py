@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import weakref
+from collections.abc import AsyncIterator, Callable
+
+from .exceptions import AgentExecutionError
+
+
+class _Flight:
+    """One upstream stream whose chunks are buffered and fanned out to subscribers."""
+
+    def __init__(self, source: AsyncIterator[bytes], on_done: Callable[[], None]) -> None:
+        self.chunks: list[bytes] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._on_done = on_done
+        self._task = asyncio.create_task(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[bytes]) -> None:
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = AgentExecutionError("Upstream agent run was cancelled.")
+            raise
+        except Exception as exc:
+            self.error = exc
+        finally:
+            self.done = True
+            self._on_done()
+            self._notify()
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                with contextlib.suppress(Exception):
+                    await aclose()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def subscribe(self) -> AsyncIterator[bytes]:
+        """Return a stream replaying buffered chunks, then following the live stream.
+
+        The subscriber counts from this call rather than from its first read, so a
+        caller that has joined but not started iterating keeps the upstream run alive.
+        It stops counting once its stream ends, is closed or is discarded unread.
+        """
+        self.subscribers += 1
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self._unsubscribe()
+
+        stream = self._follow(release)
+        # Closing a generator that never started skips its finally block.
+        weakref.finalize(stream, release).atexit = False
+        return stream
+
+    async def _follow(self, release: Callable[[], None]) -> AsyncIterator[bytes]:
+        index = 0
+        try:
+            while True:
+                while index < len(self.chunks):
+                    yield self.chunks[index]
+                    index += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            release()
+
+    def _unsubscribe(self) -> None:
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.done:
+            # Nobody is listening any more; stop paying for the upstream run.
+            self._on_done()
+            self._task.cancel()
+
+
+class SingleFlight:
+    """Coalesces identical concurrent streams so only one upstream run executes per key."""
+
+    def __init__(self) -> None:
+        self._flights: dict[str, _Flight] = {}
+
+    def in_flight(self, key: str) -> bool:
+        flight = self._flights.get(key)
+        return flight is not None and not flight.done
+
+    def join(
+        self, key: str, factory: Callable[[], AsyncIterator[bytes]]
+    ) -> tuple[AsyncIterator[bytes], bool]:
+        """Return a subscriber stream for ``key`` and whether it joined an existing flight."""
+        flight = self._flights.get(key)
+        if flight is not None and not flight.done:
+            return flight.subscribe(), True
+
+        def forget() -> None:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+        flight = _Flight(factory(), forget)
+        self._flights[key] = flight
+        return flight.subscribe(), False
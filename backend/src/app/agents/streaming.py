@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import math
+import os
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from json.encoder import encode_basestring_ascii
+
+from .editing import FenceStreamParser
+
+_DELTA_PREFIX = b'{"type": "delta", "text": '
+
+
+def delta_line(text: str) -> bytes:
+    """Encode a delta event; byte-for-byte what ``json.dumps`` would produce."""
+    return _DELTA_PREFIX + encode_basestring_ascii(text).encode("ascii") + b"}\n"
+
+
+def event_line(payload: dict) -> bytes:
+    """Encode any other JSONL event (final, stats, ...)."""
+    return (json.dumps(payload) + "\n").encode("utf-8")
+
+
+def parse_final(line: bytes) -> dict | None:
+    """Return the payload if ``line`` is a ``final`` event, otherwise None.
+
+    Quotes inside JSON strings are escaped, so a line without a literal ``"final"``
+    token cannot be a final event and is rejected without being parsed.
+    """
+    if b'"final"' not in line:
+        return None
+    payload = json.loads(line)
+    return payload if payload.get("type") == "final" else None
+
+
+# Tells clients to discard the delta text received so far: the run starts over, e.g. when
+# an edit patch did not apply and the document is rewritten in full instead.
+RESET_LINE = event_line({"type": "reset"})
+
+
+@dataclass(frozen=True)
+class CoalescePolicy:
+    """Flush buffered deltas once they are ``flush_interval`` seconds old or ``flush_chars`` long."""
+
+    flush_interval: float
+    flush_chars: int
+
+
+def get_coalesce_policy(enabled: bool = True) -> CoalescePolicy | None:
+    """Coalescing policy from ``AI_STREAM_FLUSH_MS`` / ``AI_STREAM_FLUSH_CHARS``.
+
+    Returns ``None`` (one frame per upstream delta) when the request opted out or both
+    thresholds are zero.
+    """
+    if not enabled:
+        return None
+    interval_ms = float(os.getenv("AI_STREAM_FLUSH_MS", "16"))
+    flush_chars = int(os.getenv("AI_STREAM_FLUSH_CHARS", "512"))
+    if interval_ms <= 0 and flush_chars <= 0:
+        return None
+    return CoalescePolicy(flush_interval=max(interval_ms, 0) / 1000, flush_chars=flush_chars)
+
+
+async def coalesce_deltas(
+    deltas: AsyncIterator[str], policy: CoalescePolicy | None
+) -> AsyncIterator[str]:
+    """Merge small text deltas so each flushed frame carries more text.
+
+    A buffer is flushed when it reaches the size threshold or when its oldest delta has
+    waited ``flush_interval``, even if the upstream is momentarily silent.
+    """
+    if policy is None:
+        async for text in deltas:
+            yield text
+        return
+
+    loop = asyncio.get_running_loop()
+    iterator = deltas.__aiter__()
+    buffer: list[str] = []
+    buffered_chars = 0
+    deadline = 0.0
+    pending: asyncio.Future[str] | None = None
+    try:
+        while True:
+            if not buffer:
+                # Nothing to flush on a timer, so wait for upstream directly.
+                future, pending = pending, None
+                try:
+                    text = await (future if future is not None else iterator.__anext__())
+                except StopAsyncIteration:
+                    return
+            else:
+                if pending is None:
+                    pending = asyncio.ensure_future(iterator.__anext__())
+                timeout = deadline - loop.time()
+                if timeout > 0:
+                    await asyncio.wait({pending}, timeout=None if math.isinf(timeout) else timeout)
+                if not pending.done():
+                    yield "".join(buffer)
+                    buffer, buffered_chars = [], 0
+                    continue
+                future, pending = pending, None
+                try:
+                    text = future.result()
+                except StopAsyncIteration:
+                    break
+
+            if not buffer:
+                # A zero interval disables time-based flushing; only the size threshold applies.
+                deadline = loop.time() + (policy.flush_interval or math.inf)
+            buffer.append(text)
+            buffered_chars += len(text)
+            if buffered_chars >= policy.flush_chars > 0 or loop.time() >= deadline:
+                yield "".join(buffer)
+                buffer, buffered_chars = [], 0
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await pending
+
+
+async def delta_lines(
+    deltas: AsyncIterator[str], policy: CoalescePolicy | None, *, preview: bool = False
+) -> AsyncIterator[bytes]:
+    """Encode coalesced deltas as JSONL.
+
+    With ``preview`` (full-rewrite edits), each delta is followed by a ``proposed_delta``
+    event carrying the markdown that has arrived inside the fenced block so far, so
+    clients can render the proposed document before the ``final`` event.
+    """
+    parser = FenceStreamParser() if preview else None
+    async for text in coalesce_deltas(deltas, policy):
+        yield delta_line(text)
+        if parser is not None:
+            proposed = parser.feed(text)
+            if proposed:
+                yield event_line({"type": "proposed_delta", "text": proposed})
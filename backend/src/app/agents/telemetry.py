@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections.abc import AsyncIterator
+
+from ..services.metrics_service import RequestTimings, registry
+from .cancellation import CANCELLED_LINE, StreamControl
+from .context import estimate_tokens
+from .interface import ChatRequest
+from .streaming import event_line, parse_final
+
+REQUESTS = registry.counter(
+    "ai_requests_total",
+    "AI chat requests by agent, mode and outcome (ok, error, cancelled, rejected).",
+    ("agent_id", "mode", "outcome"),
+)
+STAGE_SECONDS = registry.histogram(
+    "ai_stage_seconds",
+    "Duration of /api/ai/chat stages: file, agent, retrieval, preflight, cache, queue, ttft, "
+    "stream.",
+    ("agent_id", "stage"),
+)
+OUTPUT_CHARS = registry.histogram(
+    "ai_output_chars",
+    "Characters in the final answer or proposed content.",
+    ("agent_id",),
+    buckets=(100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000),
+)
+TOKENS_PER_SECOND = registry.histogram(
+    "ai_output_tokens_per_second",
+    "Estimated output tokens per second after the first token.",
+    ("agent_id",),
+    buckets=(5, 10, 20, 40, 80, 160, 320, 640, 1280),
+)
+STREAMS_IN_FLIGHT = registry.gauge(
+    "ai_streams_in_flight", "AI chat responses currently streaming.", ("agent_id",)
+)
+QUEUED = registry.gauge(
+    "ai_queued_requests", "Requests waiting for an admission slot.", ("agent_id",)
+)
+CACHE_HITS = registry.counter(
+    "ai_cache_hits_total", "Requests answered from the response cache.", ("agent_id",)
+)
+COALESCED = registry.counter(
+    "ai_coalesced_requests_total",
+    "Requests that joined an identical in-flight upstream run.",
+    ("agent_id",),
+)
+RETRIES = registry.counter(
+    "ai_retries_total", "Upstream runs retried after a transient error.", ("agent_id",)
+)
+MODEL_ROUTES = registry.counter(
+    "ai_model_routes_total",
+    "Requests routed to each model by the pre-flight token count.",
+    ("agent_id", "model"),
+)
+HEDGES = registry.counter(
+    "ai_hedges_total", "Hedge runs started by the auto agent, by hedge target.", ("agent_id",)
+)
+
+
+def stats_enabled() -> bool:
+    return os.getenv("AI_STREAM_STATS", "true").lower() != "false"
+
+
+def observe_stages(agent_id: str, timings: RequestTimings) -> None:
+    for stage, seconds in timings.stages.items():
+        STAGE_SECONDS.observe(seconds, agent_id=agent_id, stage=stage)
+
+
+def _final_text(payload: dict) -> str:
+    text = payload.get("answer", payload.get("proposedContent", ""))
+    return text if isinstance(text, str) else ""
+
+
+async def instrument_stream(
+    stream: AsyncIterator[bytes],
+    request: ChatRequest,
+    timings: RequestTimings,
+    control: StreamControl | None = None,
+) -> AsyncIterator[bytes]:
+    """Time a response stream, record metrics and append a ``stats`` event on success."""
+    agent_id = request.agent_id
+    stream_started = time.perf_counter()
+    first_at: float | None = None
+    final_text: str | None = None
+    outcome = "error"
+    STREAMS_IN_FLIGHT.inc(agent_id=agent_id)
+    try:
+        async for chunk in stream:
+            if first_at is None:
+                first_at = time.perf_counter()
+                timings.record("ttft", first_at - timings.started_at)
+            final = parse_final(chunk)
+            if final is not None:
+                final_text = _final_text(final)
+            elif chunk == CANCELLED_LINE:
+                outcome = "cancelled"
+            yield chunk
+
+        finished = time.perf_counter()
+        timings.record("stream", finished - stream_started)
+        if outcome == "cancelled" or (control is not None and control.cancelled):
+            outcome = "cancelled"
+            return
+        if final_text is None:
+            return
+        outcome = "ok"
+        tokens = estimate_tokens(final_text)
+        generation = finished - (first_at or finished)
+        tokens_per_second = tokens / generation if generation > 0 else None
+        OUTPUT_CHARS.observe(len(final_text), agent_id=agent_id)
+        if tokens_per_second is not None:
+            TOKENS_PER_SECOND.observe(tokens_per_second, agent_id=agent_id)
+        if stats_enabled():
+            yield event_line(
+                {
+                    "type": "stats",
+                    "ttft_ms": round(timings.stages.get("ttft", 0.0) * 1000, 1),
+                    "duration_ms": round(timings.elapsed() * 1000, 1),
+                    "output_chars": len(final_text),
+                    "output_tokens": tokens,
+                    "tokens_per_second": (
+                        round(tokens_per_second, 1) if tokens_per_second is not None else None
+                    ),
+                    "stages_ms": {
+                        stage: round(seconds * 1000, 1)
+                        for stage, seconds in timings.stages.items()
+                    },
+                    "route": (
+                        request.route.model_dump(exclude={"context_budget", "rewrite_model"})
+                        if request.route is not None
+                        else None
+                    ),
+                }
+            )
+    except (GeneratorExit, asyncio.CancelledError):
+        if outcome != "ok":
+            outcome = "cancelled"
+        raise
+    finally:
+        STREAMS_IN_FLIGHT.dec(agent_id=agent_id)
+        REQUESTS.inc(agent_id=agent_id, mode=request.mode, outcome=outcome)
+        observe_stages(agent_id, timings)
@@ -3,13 +3,22 @@ from __future__ import annotations
 import logging
 from typing import Literal
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from ..agents import AgentRouterService, ChatRequest, agent_router_service
-from ..agents.exceptions import AgentError, AgentNotFoundError
+from ..agents.batch import BatchJobManager, BatchJobSpec, batch_jobs
+from ..agents.config import AGENT_MAPPING
+from ..agents.exceptions import (
+    AgentError,
+    AgentNotFoundError,
+    AgentOverloadedError,
+    AgentRequestTooLargeError,
+    AgentSessionBusyError,
+)
 from ..services import file_service
+from ..services.metrics_service import RequestTimings
 
 router = APIRouter()
 # Use uvicorn.error logger so INFO statements surface with the default run-backend command.
@@ -22,11 +31,15 @@ class ChatBody(BaseModel):
   message: str
   agent_id: str = "openai-qa"
   selection: str | None = None
+  retrieval: bool = False
+  coalesce_deltas: bool = True
+  session_id: str | None = None
 
 
 @router.post("/ai/chat")
 async def chat(
     body: ChatBody,
+    request: Request,
     router_service: AgentRouterService = Depends(lambda: agent_router_service),
 ) -> StreamingResponse:
   logger.info(
@@ -38,8 +51,10 @@ async def chat(
       body.selection is not None,
   )
 
+  timings = RequestTimings()
   # Load current content to provide context
-  file = file_service.read_file(body.path)
+  with timings.stage("file"):
+    file = await file_service.aread_file(body.path)
   content = file["content"]
   logger.debug(
       "Loaded file content path=%s content_len=%d",
@@ -54,6 +69,9 @@ async def chat(
       mode=body.mode,
       agent_id=body.agent_id,
       selection=body.selection,
+      retrieval=body.retrieval,
+      coalesce_deltas=body.coalesce_deltas,
+      session_id=body.session_id,
   )
 
   if body.mode not in {"ask", "edit"}:
@@ -66,7 +84,9 @@ async def chat(
     raise HTTPException(status_code=400, detail="Invalid mode")
 
   try:
-    response = router_service.route_request(chat_request)
+    response = await router_service.route_request(
+        chat_request, is_disconnected=request.is_disconnected, timings=timings
+    )
   except AgentNotFoundError as exc:
     logger.warning(
         "Unknown agent requested path=%s agent_id=%s",
@@ -74,6 +94,24 @@ async def chat(
         body.agent_id,
     )
     raise HTTPException(status_code=400, detail=str(exc))
+  except AgentOverloadedError as exc:
+    raise HTTPException(
+        status_code=429,
+        detail=str(exc),
+        headers={"Retry-After": str(int(exc.retry_after))},
+    )
+  except AgentRequestTooLargeError as exc:
+    logger.warning(
+        "AI request too large path=%s mode=%s agent_id=%s tokens=%d limit=%d",
+        body.path,
+        body.mode,
+        body.agent_id,
+        exc.tokens,
+        exc.limit,
+    )
+    raise HTTPException(status_code=413, detail=str(exc))
+  except AgentSessionBusyError as exc:
+    raise HTTPException(status_code=409, detail=str(exc))
   except AgentError as exc:
     logger.exception(
         "Agent error path=%s mode=%s agent_id=%s",
@@ -84,3 +122,75 @@ async def chat(
     raise HTTPException(status_code=500, detail=str(exc))
 
   return response
+
+
+@router.post("/ai/chat/{request_id}/stop")
+async def stop_chat(
+    request_id: str,
+    router_service: AgentRouterService = Depends(lambda: agent_router_service),
+) -> dict:
+  """Stop generating for a live chat stream identified by its X-AI-Request-Id."""
+  if not router_service.cancel(request_id):
+    raise HTTPException(status_code=404, detail="No active chat stream with that request id")
+  logger.info("Stop requested for AI chat request_id=%s", request_id)
+  return {"ok": True}
+
+
+class BatchJobBody(BaseModel):
+  path: str = ""
+  pattern: str = "**/*.md"
+  mode: Literal["ask", "edit"] = "ask"
+  message: str
+  agent_id: str = "openai-qa"
+  concurrency: int | None = None
+
+
+@router.post("/ai/jobs")
+async def create_job(
+    body: BatchJobBody,
+    jobs: BatchJobManager = Depends(lambda: batch_jobs),
+) -> dict:
+  """Start a batch job running one chat request per matching markdown file."""
+  if body.agent_id not in AGENT_MAPPING:
+    raise HTTPException(status_code=400, detail=f"Unknown agent_id '{body.agent_id}'")
+  spec = BatchJobSpec(
+      path=body.path,
+      pattern=body.pattern,
+      agent_id=body.agent_id,
+      mode=body.mode,
+      message=body.message,
+      concurrency=body.concurrency or 0,
+  )
+  job = await jobs.create(spec)
+  return job.summary()
+
+
+@router.get("/ai/jobs")
+def list_jobs(jobs: BatchJobManager = Depends(lambda: batch_jobs)) -> list[dict]:
+  return [job.summary() for job in jobs.jobs()]
+
+
+@router.get("/ai/jobs/{job_id}")
+def get_job(job_id: str, jobs: BatchJobManager = Depends(lambda: batch_jobs)) -> dict:
+  return jobs.get(job_id).summary()
+
+
+@router.get("/ai/jobs/{job_id}/events")
+def job_events(
+    job_id: str,
+    after: int = Query(default=0, ge=0),
+    jobs: BatchJobManager = Depends(lambda: batch_jobs),
+) -> StreamingResponse:
+  """Stream per-file results as JSONL, following the job until it finishes."""
+  jobs.get(job_id)  # 404 before the stream starts
+  return StreamingResponse(jobs.events(job_id, after), media_type="application/jsonl")
+
+
+@router.post("/ai/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, jobs: BatchJobManager = Depends(lambda: batch_jobs)) -> dict:
+  return (await jobs.cancel(job_id)).summary()
+
+
+@router.post("/ai/jobs/{job_id}/resume")
+async def resume_job(job_id: str, jobs: BatchJobManager = Depends(lambda: batch_jobs)) -> dict:
+  return (await jobs.resume(job_id)).summary()
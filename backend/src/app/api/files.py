@@ -1,28 +1,163 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Query
-from pydantic import BaseModel
+import zlib
+from collections.abc import AsyncIterator
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import APIRouter, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 
 from ..services import file_service
+from ..services.watch_service import workspace_watcher
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+# Raw responses smaller than this are sent uncompressed.
+_COMPRESS_MIN_BYTES = 1024
 
 router = APIRouter()
 
 
 @router.get("/files")
-def get_files(path: str = Query(default="")):
-    return file_service.list_dir(path)
+async def get_files(path: str = Query(default="")):
+    return await file_service.alist_dir(path)
+
+
+@router.get("/watch")
+async def watch_workspace(request: Request) -> StreamingResponse:
+    """Server-sent events with batches of workspace changes (see README)."""
+    return StreamingResponse(
+        workspace_watcher.stream(request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/tree")
+async def get_tree(
+    request: Request,
+    path: str = Query(default=""),
+    depth: int | None = Query(default=None, ge=0),
+):
+    snapshot = await file_service.atree(path, depth)
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), snapshot.etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(snapshot.to_dict(), headers=headers)
+
+
+def _etag_matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    candidates = {value.strip().removeprefix("W/") for value in header.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def _not_modified(request: Request, version: file_service.FileVersion) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match takes precedence over If-Modified-Since.
+        return _etag_matches(if_none_match, version.etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return int(version.modified_at) <= since
+
+
+def _validator_headers(version: file_service.FileVersion, etag: str | None = None) -> dict:
+    return {
+        "ETag": etag or version.etag,
+        "Last-Modified": formatdate(version.modified_at, usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+
+
+def _negotiate_encoding(request: Request) -> str | None:
+    accepted = {
+        token.split(";")[0].strip().lower()
+        for token in request.headers.get("accept-encoding", "").split(",")
+    }
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+async def _compress(chunks: AsyncIterator[bytes], encoding: str) -> AsyncIterator[bytes]:
+    if encoding == "br":
+        compressor = brotli.Compressor()
+        process, finish = compressor.process, compressor.finish
+    else:
+        gzip = zlib.compressobj(6, zlib.DEFLATED, 31)
+        process, finish = gzip.compress, gzip.flush
+    # Compression is CPU work on up to 64 KiB per chunk; keep it off the event loop too.
+    async for chunk in chunks:
+        if out := await file_service.run_io(process, chunk):
+            yield out
+    yield await file_service.run_io(finish)
 
 
 @router.get("/file")
-def get_file(path: str = Query(...)):
-    return file_service.read_file(path)
+async def get_file(
+    request: Request,
+    path: str = Query(...),
+    raw: bool = Query(default=False, description="Stream the file as text/markdown."),
+):
+    conditional = "if-none-match" in request.headers or "if-modified-since" in request.headers
+    if conditional or raw:
+        version = await file_service.afile_version(path)
+        if _not_modified(request, version):
+            return Response(status_code=304, headers=_validator_headers(version))
+
+    if not raw:
+        data, version = await file_service.aread_file_with_version(path)
+        return JSONResponse(data, headers=_validator_headers(version))
+
+    chunks = file_service.aiter_file_bytes(path)
+    headers = _validator_headers(version)
+    headers["Vary"] = "Accept-Encoding"
+    encoding = _negotiate_encoding(request) if version.size >= _COMPRESS_MIN_BYTES else None
+    if encoding is not None:
+        # Compressed bytes differ from the identity representation, so the ETag is weak.
+        headers["ETag"] = f"W/{version.etag}"
+        headers["Content-Encoding"] = encoding
+        chunks = _compress(chunks, encoding)
+    return StreamingResponse(chunks, media_type="text/markdown; charset=utf-8", headers=headers)
 
 
 class UpdateFileBody(BaseModel):
     content: str
+    base_version: str | None = None
 
 
 @router.put("/file")
-def put_file(path: str = Query(...), payload: UpdateFileBody | None = None):
+async def put_file(path: str = Query(...), payload: UpdateFileBody | None = None):
     content = payload.content if payload else ""
-    return file_service.write_file(path, content)
+    base_version = payload.base_version if payload else None
+    return await file_service.awrite_file(path, content, base_version=base_version)
+
+
+class TextEditBody(BaseModel):
+    start: int = Field(..., ge=0, description="UTF-16 code unit offset into the base content.")
+    end: int = Field(..., ge=0, description="Exclusive UTF-16 code unit end offset.")
+    text: str = ""
+
+
+class PatchFileBody(BaseModel):
+    base_version: str
+    edits: list[TextEditBody]
+
+
+@router.patch("/file")
+async def patch_file(payload: PatchFileBody, path: str = Query(...)):
+    edits = [file_service.TextEdit(e.start, e.end, e.text) for e in payload.edits]
+    return await file_service.apatch_file(path, payload.base_version, edits)
@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from ..services import metrics_service
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    return PlainTextResponse(
+        metrics_service.registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, Query
+
+from ..services import file_service, search_service
+
+router = APIRouter()
+
+
+@router.get("/search")
+async def search(
+    q: str = Query(..., description='Terms, "quoted phrases" and prefix* queries.'),
+    path: str = Query(default="", description="Restrict results to this workspace subtree."),
+    limit: int = Query(default=20, ge=1, le=200),
+):
+    return await file_service.run_io(search_service.search, q, limit=limit, path=path)
@@ -1,15 +1,45 @@
 from __future__ import annotations
 
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from .agents import agent_router_service
+from .agents.batch import batch_jobs
+from .agents.config import warm_up_agent_ids
 from .api.files import router as files_router
 from .api.ai import router as ai_router
+from .api.search import router as search_router
+from .api.metrics import router as metrics_router
+from .services import file_service, search_service
+from .services.watch_service import workspace_watcher
 
 # Environment-driven settings (simple)
 UI_ORIGIN = os.getenv("UI_ORIGIN", "http://localhost:5173")
 
-app = FastAPI(title="AI Markdown Editor API")
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    file_service.ensure_workspace()
+    # The index then follows saves and watcher batches instead of rescanning on queries.
+    await search_service.start_indexing()
+    # Agents load on first use; AI_WARM_UP_AGENTS builds selected ones (and their HTTP
+    # clients) up front instead. Either way they are released on shutdown.
+    agent_router_service.warm_up(warm_up_agent_ids())
+    await batch_jobs.start()
+    try:
+        yield
+    finally:
+        # Running batch jobs stop here and resume on the next start.
+        await batch_jobs.aclose()
+        await agent_router_service.aclose()
+        await workspace_watcher.aclose()
+        await file_service.run_io(file_service.flush_pending_writes)
+        await file_service.run_io(search_service.search_index.close)
+        file_service.shutdown_io_executor()
+
+
+app = FastAPI(title="AI Markdown Editor API", lifespan=lifespan)
 
 # CORS: allow only the local UI in dev
 app.add_middleware(
@@ -22,6 +52,8 @@ app.add_middleware(
 
 app.include_router(files_router, prefix="/api")
 app.include_router(ai_router, prefix="/api")
+app.include_router(search_router, prefix="/api")
+app.include_router(metrics_router, prefix="/api")
 
 
 @app.get("/api/health")
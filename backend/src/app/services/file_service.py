@@ -1,16 +1,42 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
+import functools
+import hashlib
+import logging
 import os
+import tempfile
+import threading
+import time
+from collections.abc import AsyncIterator, Callable, Generator
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
+from typing import TypeVar
 from fastapi import HTTPException
 
+logger = logging.getLogger("uvicorn.error").getChild(__name__)
+
+T = TypeVar("T")
+
 # Workspace root is limited to WORKSPACE_DIR
 WORKSPACE_DIR = Path(os.getenv("WORKSPACE_DIR", Path.home() / "workspace")).resolve()
 
-# Ensure the workspace directory exists
-WORKSPACE_DIR.mkdir(parents=True, exist_ok=True)
+
+def ensure_workspace() -> None:
+    """Create the workspace directory; called at startup rather than on import."""
+    WORKSPACE_DIR.mkdir(parents=True, exist_ok=True)
+
+
+# Callbacks invoked with (rel_path, content) once a write_file has reached the disk.
+_write_hooks: list[Callable[[str, str], None]] = []
+
+
+def add_write_hook(hook: Callable[[str, str], None]) -> None:
+    """Register a callback run after every successful write, e.g. to update indexes."""
+    _write_hooks.append(hook)
 
 
 def _safe_join(rel_path: str) -> Path:
@@ -23,43 +49,648 @@ def _safe_join(rel_path: str) -> Path:
     return candidate
 
 
-def list_dir(rel_path: str = "") -> list[dict]:
+@dataclass(frozen=True)
+class _DirListing:
+    mtime_ns: int
+    # (name, is_dir) sorted directories first, then by lowercase name
+    names: tuple[tuple[str, bool], ...]
+
+
+@dataclass(frozen=True)
+class _DirSnapshot:
+    etag: str
+    # (name, is_dir, size, mtime) in listing order
+    entries: tuple[tuple[str, bool, int, float], ...]
+
+
+# Directory listings keyed by absolute path, reused until the directory's mtime changes.
+_dir_listings: dict[Path, _DirListing] = {}
+
+
+def _list_names(base: Path) -> _DirListing:
+    """Return the cached names in ``base``, rescanning only if its mtime changed.
+
+    Adding, removing or renaming entries bumps the directory mtime; writes made through
+    write_file also drop the parent's listing explicitly.
+    """
+    try:
+        dir_mtime = os.stat(base).st_mtime_ns
+    except FileNotFoundError:
+        _dir_listings.pop(base, None)
+        raise HTTPException(status_code=404, detail="Path not found")
+    listing = _dir_listings.get(base)
+    if listing is not None and listing.mtime_ns == dir_mtime:
+        return listing
+
+    names: list[tuple[str, bool]] = []
+    with os.scandir(base) as it:
+        for entry in it:
+            try:
+                is_dir = entry.is_dir()
+                if not is_dir and not (entry.name.endswith(".md") and entry.is_file()):
+                    # Only expose markdown files for files; directories are allowed
+                    continue
+            except OSError:
+                continue
+            names.append((entry.name, is_dir))
+    names.sort(key=_listing_order)
+    listing = _DirListing(mtime_ns=dir_mtime, names=tuple(names))
+    _dir_listings[base] = listing
+    return listing
+
+
+def _listing_order(entry: tuple[str, bool]) -> tuple[bool, str]:
+    # Directories first, then case-insensitive by name.
+    return (not entry[1], entry[0].lower())
+
+
+def _snapshot_dir(base: Path) -> _DirSnapshot:
+    """List ``base`` with current sizes and mtimes, and an ETag covering them.
+
+    Only the names are cached: editing a file in place does not touch the directory
+    mtime, so every entry is re-stat'ed on each call to pick up edits made outside the app.
+    Buffered write-behind saves are listed as they will be once flushed.
+    """
+    names = _list_names(base).names
+    buffered = _write_behind.pending_in(base)
+    if buffered:
+        listed = {name for name, _ in names}
+        new_files = [(name, False) for name in buffered if name not in listed]
+        names = tuple(sorted(names + tuple(new_files), key=_listing_order))
+    entries: list[tuple[str, bool, int, float]] = []
+    for name, is_dir in names:
+        pending = buffered.get(name)
+        if pending is not None:
+            entries.append((name, False, len(pending.data), pending.modified_at))
+            continue
+        try:
+            stat = os.stat(base / name)
+        except OSError:
+            continue
+        entries.append((name, is_dir, stat.st_size, stat.st_mtime))
+    etag = hashlib.sha1(repr(entries).encode("utf-8")).hexdigest()
+    return _DirSnapshot(etag=etag, entries=tuple(entries))
+
+
+def _entry_dict(rel_path: str, entry: tuple[str, bool, int, float]) -> dict:
+    name, is_dir, size, mtime = entry
+    return {
+        "name": name,
+        "path": str((Path(rel_path) / name).as_posix()),
+        "is_dir": is_dir,
+        "size": size,
+        "modified_at": datetime.fromtimestamp(mtime).isoformat(),
+    }
+
+
+def _resolve_dir(rel_path: str) -> Path:
     base = _safe_join(rel_path)
     if not base.exists():
         raise HTTPException(status_code=404, detail="Path not found")
     if not base.is_dir():
         raise HTTPException(status_code=400, detail="Not a directory")
+    return base
+
+
+def list_dir(rel_path: str = "") -> list[dict]:
+    base = _resolve_dir(rel_path)
+    return [_entry_dict(rel_path, entry) for entry in _snapshot_dir(base).entries]
+
+
+@dataclass(frozen=True)
+class TreeSnapshot:
+    path: str
+    etag: str
+    # Listing of every expanded directory, keyed by workspace-relative path
+    directories: dict[str, _DirSnapshot]
+
+    def to_dict(self) -> dict:
+        """Build the response body from the listings; no file system access."""
+
+        def build(directory_rel: str) -> list[dict]:
+            nodes: list[dict] = []
+            for entry in self.directories[directory_rel].entries:
+                node = _entry_dict(directory_rel, entry)
+                if node["path"] in self.directories:
+                    node["children"] = build(node["path"])
+                nodes.append(node)
+            return nodes
+
+        return {"path": self.path, "children": build(self.path)}
+
 
-    items: list[dict] = []
-    for entry in sorted(base.iterdir(), key=lambda p: (not p.is_dir(), p.name.lower())):
-        if entry.is_file() and not entry.name.endswith(".md"):
-            # Only expose markdown files for files; directories are allowed
+_EMPTY_DIR = _DirSnapshot(etag="", entries=())
+
+
+def tree(rel_path: str = "", depth: int | None = None) -> TreeSnapshot:
+    """Snapshot the subtree under ``rel_path`` with an ETag covering every listed directory.
+
+    ``depth`` limits how many directory levels are expanded (``None`` for all, ``0`` for
+    just the direct entries). Hidden directories are listed but never expanded. The ETag
+    is known before any response body is built, so a matching If-None-Match skips it.
+    """
+    base = _resolve_dir(rel_path)
+    digest = hashlib.sha1(f"{rel_path}|{depth}".encode("utf-8"))
+    directories: dict[str, _DirSnapshot] = {}
+
+    def walk(directory: Path, directory_rel: str, level: int) -> None:
+        snapshot = _snapshot_dir(directory)
+        digest.update(snapshot.etag.encode("ascii"))
+        directories[directory_rel] = snapshot
+        if depth is not None and level >= depth:
+            return
+        for name, is_dir, _, _ in snapshot.entries:
+            if is_dir and not name.startswith("."):
+                child_rel = str((Path(directory_rel) / name).as_posix())
+                try:
+                    walk(directory / name, child_rel, level + 1)
+                except (HTTPException, OSError):
+                    # Vanished or unreadable between listing and descent.
+                    directories[child_rel] = _EMPTY_DIR
+
+    walk(base, rel_path, 0)
+    return TreeSnapshot(path=rel_path, etag=f'"{digest.hexdigest()}"', directories=directories)
+
+
+def glob_files(rel_path: str = "", pattern: str = "**/*.md", limit: int | None = None) -> list[str]:
+    """Markdown files under ``rel_path`` matching ``pattern``, sorted, as workspace paths.
+
+    Hidden files and directories are skipped, as are matches that resolve outside the
+    workspace. Raises 400 if more than ``limit`` files match.
+    """
+    if not pattern or Path(pattern).is_absolute() or ".." in Path(pattern).parts:
+        raise HTTPException(status_code=400, detail="Invalid pattern")
+    base = _resolve_dir(rel_path)
+    matches: list[str] = []
+    for candidate in base.glob(pattern):
+        relative = candidate.relative_to(base)
+        if any(part.startswith(".") for part in relative.parts):
             continue
-        stat = entry.stat()
-        items.append(
-            {
-                "name": entry.name,
-                "path": str((Path(rel_path) / entry.name).as_posix()),
-                "is_dir": entry.is_dir(),
-                "size": stat.st_size,
-                "modified_at": datetime.fromtimestamp(stat.st_mtime).isoformat(),
-            }
-        )
-    return items
+        if candidate.suffix != ".md" or not candidate.is_file():
+            continue
+        try:
+            candidate.resolve().relative_to(WORKSPACE_DIR)
+        except ValueError:
+            continue
+        matches.append(candidate.relative_to(WORKSPACE_DIR).as_posix())
+        if limit is not None and len(matches) > limit:
+            raise HTTPException(
+                status_code=400, detail=f"More than {limit} files match; narrow the path or pattern"
+            )
+    matches.sort()
+    return matches
 
 
-def read_file(rel_path: str) -> dict:
+@dataclass(frozen=True)
+class FileVersion:
+    path: Path
+    version: str  # sha256 of the file bytes
+    modified_at: float
+    size: int
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.version}"'
+
+
+# Content hashes keyed by absolute path, valid while (mtime_ns, size) are unchanged.
+_version_cache: dict[Path, tuple[int, int, str]] = {}
+
+
+def _resolve_file(rel_path: str) -> Path:
     p = _safe_join(rel_path)
+    if _write_behind.get(p) is not None:
+        return p
     if not p.exists() or not p.is_file() or not p.name.endswith(".md"):
         raise HTTPException(status_code=404, detail="File not found")
-    return {"path": rel_path, "content": p.read_text(encoding="utf-8")}
+    return p
+
+
+def _remember_version(p: Path, stat: os.stat_result, data: bytes) -> FileVersion:
+    version = hashlib.sha256(data).hexdigest()
+    _version_cache[p] = (stat.st_mtime_ns, stat.st_size, version)
+    return FileVersion(path=p, version=version, modified_at=stat.st_mtime, size=stat.st_size)
+
+
+def file_version(rel_path: str) -> FileVersion:
+    """Validators for a file, hashing its content only when mtime or size changed."""
+    p = _resolve_file(rel_path)
+    pending = _write_behind.get(p)
+    if pending is not None:
+        return pending.file_version(p)
+    stat = p.stat()
+    cached = _version_cache.get(p)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return FileVersion(path=p, version=cached[2], modified_at=stat.st_mtime, size=stat.st_size)
+    return _remember_version(p, stat, p.read_bytes())
+
+
+def read_file_with_version(rel_path: str) -> tuple[dict, FileVersion]:
+    p = _resolve_file(rel_path)
+    pending = _write_behind.get(p)
+    if pending is not None:
+        # Buffered writes are newer than the disk copy.
+        return {"path": rel_path, "content": pending.content, "version": pending.version}, (
+            pending.file_version(p)
+        )
+    with p.open("rb") as fh:
+        stat = os.fstat(fh.fileno())
+        data = fh.read()
+    version = _remember_version(p, stat, data)
+    # Match read_text's universal-newline decoding so clients see the same content.
+    content = data.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+    return {"path": rel_path, "content": content, "version": version.version}, version
+
+
+def read_file(rel_path: str) -> dict:
+    return read_file_with_version(rel_path)[0]
+
+
+def iter_file_bytes(rel_path: str, chunk_size: int = 64 * 1024) -> Generator[bytes, None, None]:
+    """Yield the raw bytes of a markdown file in chunks for streaming responses."""
+    p = _resolve_file(rel_path)
+    pending = _write_behind.get(p)
+
+    def chunks() -> Generator[bytes, None, None]:
+        if pending is not None:
+            for start in range(0, len(pending.data), chunk_size):
+                yield pending.data[start : start + chunk_size]
+            return
+        with p.open("rb") as fh:
+            while chunk := fh.read(chunk_size):
+                yield chunk
+
+    return chunks()
+
+
+@dataclass(frozen=True)
+class TextEdit:
+    """Replace ``content[start:end]`` with ``text``; offsets are UTF-16 code units."""
+
+    start: int
+    end: int
+    text: str
+
+
+# Read once at import (umask can only be queried by setting it, which is not thread-safe).
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# Serializes read-check-write sequences per file across worker threads.
+_path_locks: dict[Path, threading.Lock] = {}
+_path_locks_guard = threading.Lock()
 
 
-def write_file(rel_path: str, content: str) -> dict:
+def _lock_for(p: Path) -> threading.Lock:
+    with _path_locks_guard:
+        return _path_locks.setdefault(p, threading.Lock())
+
+
+def _validate_write_target(rel_path: str) -> Path:
     p = _safe_join(rel_path)
     if not p.parent.exists():
         raise HTTPException(status_code=400, detail="Parent directory does not exist")
     if not p.name.endswith(".md"):
         raise HTTPException(status_code=400, detail="Only .md files are allowed")
-    p.write_text(content, encoding="utf-8")
-    return {"ok": True}
+    return p
+
+
+def _check_base_version(p: Path, rel_path: str, base_version: str) -> None:
+    exists = p.exists() or _write_behind.get(p) is not None
+    current = file_version(rel_path).version if exists else None
+    if current != base_version:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "File changed since base version", "version": current},
+        )
+
+
+def _atomic_write(p: Path, data: bytes) -> os.stat_result:
+    """Write via a temp file in the same directory and rename it over the target."""
+    result = _atomic_write_many([(p, data)])[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def _atomic_write_many(items: list[tuple[Path, bytes]]) -> list[os.stat_result | Exception]:
+    """Atomically replace several files, batching the fsyncs.
+
+    Every temp file is written first, then all are fsynced, renamed into place and each
+    distinct parent directory is fsynced once so the renames are durable.
+    """
+    results: list[os.stat_result | Exception | None] = [None] * len(items)
+    staged: list[tuple[int, Path, str, int]] = []
+    for index, (p, data) in enumerate(items):
+        fd, tmp_name = tempfile.mkstemp(dir=p.parent, prefix=f".{p.name}.", suffix=".tmp")
+        try:
+            _write_all(fd, data)
+            try:
+                os.fchmod(fd, p.stat().st_mode & 0o777)
+            except FileNotFoundError:
+                os.fchmod(fd, 0o666 & ~_UMASK)
+        except OSError as exc:
+            os.close(fd)
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_name)
+            results[index] = exc
+            continue
+        staged.append((index, p, tmp_name, fd))
+
+    directories: set[Path] = set()
+    for index, p, tmp_name, fd in staged:
+        try:
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.replace(tmp_name, p)
+            results[index] = p.stat()
+            directories.add(p.parent)
+        except OSError as exc:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_name)
+            results[index] = exc
+
+    for directory in directories:
+        with contextlib.suppress(OSError):
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+    return results  # type: ignore[return-value]
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def _after_write(p: Path, rel_path: str, content: str) -> None:
+    # A file created within the same mtime tick would not show up in the cached listing.
+    _dir_listings.pop(p.parent, None)
+    for hook in _write_hooks:
+        try:
+            hook(rel_path, content)
+        except Exception:  # pragma: no cover - hooks must never fail a save
+            logger.exception("Write hook failed path=%s", rel_path)
+
+
+def _commit_write(p: Path, rel_path: str, content: str) -> dict:
+    data = content.encode("utf-8")
+    if _write_behind.enabled:
+        # Hooks run from the flusher, once the content and its mtime are on disk.
+        pending = _write_behind.submit(p, rel_path, content, data)
+        return {"ok": True, "version": pending.version}
+    stat = _atomic_write(p, data)
+    version = _remember_version(p, stat, data)
+    _after_write(p, rel_path, content)
+    return {"ok": True, "version": version.version}
+
+
+@dataclass
+class _PendingWrite:
+    rel_path: str
+    content: str
+    data: bytes
+    version: str
+    modified_at: float
+    due: float
+
+    def file_version(self, p: Path) -> FileVersion:
+        return FileVersion(
+            path=p, version=self.version, modified_at=self.modified_at, size=len(self.data)
+        )
+
+
+class _WriteBehind:
+    """Coalesces bursts of writes to the same file and flushes them on a background thread.
+
+    The first write to a clean file starts a window of ``delay`` seconds; later writes in
+    that window only replace the buffered content, so each burst costs one disk write.
+    Reads consult the buffer first, so callers always see the latest content.
+    """
+
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self._pending: dict[Path, _PendingWrite] = {}
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._stopping = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.delay > 0
+
+    def get(self, p: Path) -> _PendingWrite | None:
+        return self._pending.get(p)
+
+    def pending_in(self, directory: Path) -> dict[str, _PendingWrite]:
+        """Buffered writes to files directly inside ``directory``, keyed by file name."""
+        if not self._pending:
+            return {}
+        with self._cond:
+            return {p.name: w for p, w in self._pending.items() if p.parent == directory}
+
+    def submit(self, p: Path, rel_path: str, content: str, data: bytes) -> _PendingWrite:
+        now = time.time()
+        with self._cond:
+            previous = self._pending.get(p)
+            due = previous.due if previous is not None else time.monotonic() + self.delay
+            pending = _PendingWrite(
+                rel_path=rel_path,
+                content=content,
+                data=data,
+                version=hashlib.sha256(data).hexdigest(),
+                modified_at=now,
+                due=due,
+            )
+            self._pending[p] = pending
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="file-write-behind", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify()
+        return pending
+
+    def flush_all(self) -> None:
+        """Write every buffered file now; used on shutdown."""
+        with self._cond:
+            batch = list(self._pending.items())
+        self._flush(batch)
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush_all()
+        self._stopping = False
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    now = time.monotonic()
+                    due = [(p, w) for p, w in self._pending.items() if w.due <= now]
+                    if due:
+                        break
+                    timeout = min((w.due for w in self._pending.values()), default=now + 60) - now
+                    self._cond.wait(timeout=max(timeout, 0.001))
+                if self._stopping:
+                    return
+            self._flush(due)
+
+    def _flush(self, batch: list[tuple[Path, _PendingWrite]]) -> None:
+        if not batch:
+            return
+        for p, _ in batch:
+            _lock_for(p).acquire()
+        try:
+            results = _atomic_write_many([(p, pending.data) for p, pending in batch])
+            written: list[tuple[Path, _PendingWrite]] = []
+            with self._cond:
+                for (p, pending), result in zip(batch, results):
+                    if isinstance(result, Exception):
+                        logger.error(
+                            "Buffered write failed, retrying path=%s error=%s",
+                            pending.rel_path,
+                            result,
+                        )
+                        pending.due = time.monotonic() + max(self.delay, 1.0)
+                        continue
+                    _remember_version(p, result, pending.data)
+                    written.append((p, pending))
+                    # A newer write may have been buffered while this one was flushing.
+                    if self._pending.get(p) is pending:
+                        del self._pending[p]
+            for p, pending in written:
+                _after_write(p, pending.rel_path, pending.content)
+        finally:
+            for p, _ in batch:
+                _lock_for(p).release()
+
+
+# Optional write-behind buffering for autosave bursts; disabled unless a delay is set.
+_write_behind = _WriteBehind(float(os.getenv("WRITE_BEHIND_DELAY_MS", "0")) / 1000)
+
+
+def flush_pending_writes() -> None:
+    """Stop the write-behind thread and persist every buffered write."""
+    _write_behind.stop()
+
+
+def write_file(rel_path: str, content: str, base_version: str | None = None) -> dict:
+    p = _validate_write_target(rel_path)
+    with _lock_for(p):
+        if base_version is not None:
+            _check_base_version(p, rel_path, base_version)
+        return _commit_write(p, rel_path, content)
+
+
+def patch_file(rel_path: str, base_version: str, edits: list[TextEdit]) -> dict:
+    """Apply text edits to the file if it is still at ``base_version`` (409 otherwise)."""
+    p = _validate_write_target(rel_path)
+    with _lock_for(p):
+        _check_base_version(p, rel_path, base_version)
+        content = read_file(rel_path)["content"]
+        return _commit_write(p, rel_path, apply_text_edits(content, edits))
+
+
+def apply_text_edits(content: str, edits: list[TextEdit]) -> str:
+    units = content.encode("utf-16-le")
+    length = len(units) // 2
+    ordered = sorted(edits, key=lambda e: (e.start, e.end))
+    previous_end = 0
+    for edit in ordered:
+        if not 0 <= edit.start <= edit.end <= length or edit.start < previous_end:
+            raise HTTPException(status_code=422, detail="Edits are out of range or overlap")
+        previous_end = edit.end
+    for edit in reversed(ordered):
+        units = units[: edit.start * 2] + edit.text.encode("utf-16-le") + units[edit.end * 2 :]
+    try:
+        return units.decode("utf-16-le")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=422, detail="Edit splits a surrogate pair")
+
+
+# Async API -----------------------------------------------------------------
+#
+# Routes run on the event loop, so every blocking filesystem call goes through a bounded
+# executor; a slow or network-mounted workspace then delays only file requests, never
+# active AI streams.
+
+FILE_IO_WORKERS = int(os.getenv("FILE_IO_WORKERS", "8"))
+_io_executor: ThreadPoolExecutor | None = None
+
+
+def _get_io_executor() -> ThreadPoolExecutor:
+    global _io_executor
+    if _io_executor is None:
+        _io_executor = ThreadPoolExecutor(
+            max_workers=FILE_IO_WORKERS, thread_name_prefix="file-io"
+        )
+    return _io_executor
+
+
+async def run_io(func: Callable[..., T], *args, **kwargs) -> T:
+    """Run a blocking file operation on the bounded file I/O executor."""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs)
+    return await loop.run_in_executor(_get_io_executor(), call)
+
+
+async def alist_dir(rel_path: str = "") -> list[dict]:
+    return await run_io(list_dir, rel_path)
+
+
+async def aglob_files(
+    rel_path: str = "", pattern: str = "**/*.md", limit: int | None = None
+) -> list[str]:
+    return await run_io(glob_files, rel_path, pattern, limit)
+
+
+async def atree(rel_path: str = "", depth: int | None = None) -> TreeSnapshot:
+    return await run_io(tree, rel_path, depth)
+
+
+async def afile_version(rel_path: str) -> FileVersion:
+    return await run_io(file_version, rel_path)
+
+
+async def aread_file_with_version(rel_path: str) -> tuple[dict, FileVersion]:
+    return await run_io(read_file_with_version, rel_path)
+
+
+async def aread_file(rel_path: str) -> dict:
+    return await run_io(read_file, rel_path)
+
+
+async def awrite_file(rel_path: str, content: str, base_version: str | None = None) -> dict:
+    return await run_io(write_file, rel_path, content, base_version=base_version)
+
+
+async def apatch_file(rel_path: str, base_version: str, edits: list[TextEdit]) -> dict:
+    return await run_io(patch_file, rel_path, base_version, edits)
+
+
+async def aiter_file_bytes(rel_path: str, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    chunks = await run_io(iter_file_bytes, rel_path, chunk_size)
+    try:
+        while (chunk := await run_io(next, chunks, None)) is not None:
+            yield chunk
+    finally:
+        await run_io(chunks.close)
+
+
+def shutdown_io_executor() -> None:
+    global _io_executor
+    executor, _io_executor = _io_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
@@ -0,0 +1,509 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import heapq
+import logging
+import math
+import os
+import pickle
+import re
+import threading
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from fastapi import HTTPException
+
+from . import file_service
+from .watch_service import workspace_watcher
+
+logger = logging.getLogger("uvicorn.error").getChild(__name__)
+
+_INDEX_VERSION = 1
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_QUERY_RE = re.compile(r'"([^"]+)"|(\S+)')
+_SNIPPET_CHARS = 160
+
+# How long index changes may stay in memory before they are persisted.
+SEARCH_SAVE_DELAY = float(os.getenv("SEARCH_SAVE_DELAY", "30"))
+
+
+def _default_index_path() -> Path:
+    digest = hashlib.sha1(str(file_service.WORKSPACE_DIR).encode("utf-8")).hexdigest()[:12]
+    cache_dir = Path(__file__).resolve().parents[3] / ".cache"
+    return cache_dir / f"search-index-{digest}.pickle"
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+@dataclass
+class _Document:
+    mtime_ns: int
+    size: int
+    length: int
+    terms: list[str]
+
+
+@dataclass
+class _Clause:
+    """One AND-ed query element: a plain term, a ``prefix*`` or a ``"quoted phrase"``."""
+
+    kind: str
+    tokens: list[str]
+    matched_terms: set[str] = field(default_factory=set)
+
+
+class SearchIndex:
+    """Positional inverted index over the workspace's markdown files with BM25 ranking.
+
+    On first use the persisted index is reconciled with the workspace by comparing each
+    file's mtime and size, so restarts only re-tokenize files that changed. After that
+    it is kept current by writes through ``file_service.write_file`` and by workspace
+    watcher batches, so queries never walk the tree. Changes are persisted by a
+    background timer at most every ``save_delay`` seconds.
+    """
+
+    def __init__(self, root: Path, index_path: Path, save_delay: float = SEARCH_SAVE_DELAY) -> None:
+        self._root = root
+        self._index_path = index_path
+        self._save_delay = save_delay
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._docs: dict[str, _Document] = {}
+        self._postings: dict[str, dict[str, list[int]]] = {}
+        self._total_length = 0
+        self._vocabulary: list[str] | None = None
+        self._loaded = False
+        self._ready = False
+        self._dirty = False
+        self._save_timer: threading.Timer | None = None
+
+    # Maintenance ---------------------------------------------------------
+
+    @property
+    def ready(self) -> bool:
+        """Whether the initial reconciliation with the workspace has completed."""
+        return self._ready
+
+    def ensure_ready(self) -> None:
+        """Load and reconcile the index on first use; later calls return immediately."""
+        if self._ready:
+            return
+        with self._lock:
+            if not self._ready:
+                self.refresh()
+
+    def refresh(self) -> int:
+        """Re-index files whose mtime or size changed and drop deleted ones.
+
+        Walks the whole workspace; the index runs it once at startup and relies on
+        writes and watcher batches afterwards.
+        """
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            seen: set[str] = set()
+            changed = 0
+            for rel_path, stat in _walk_markdown(self._root):
+                seen.add(rel_path)
+                changed += self._index_if_changed(rel_path, stat)
+            for rel_path in [p for p in self._docs if p not in seen]:
+                self._remove_document(rel_path)
+                changed += 1
+            self._ready = True
+            return changed
+
+    def apply_changes(self, changes: list[dict]) -> None:
+        """Workspace watcher listener: re-index created, modified and moved files."""
+        with self._lock:
+            if not self._ready:
+                return  # the initial refresh will see these files as they are now
+            for change in changes:
+                kind, rel_path, is_dir = change["kind"], change["path"], change["is_dir"]
+                if kind == "renamed":
+                    self._forget(change["old_path"], is_dir)
+                if kind == "deleted":
+                    self._forget(rel_path, is_dir)
+                elif is_dir:
+                    # Files inside a renamed directory are not reported one by one.
+                    for child_path, stat in _walk_markdown(self._root, rel_path):
+                        self._index_if_changed(child_path, stat)
+                else:
+                    try:
+                        stat = (self._root / rel_path).stat()
+                    except OSError:
+                        self._remove_document(rel_path)
+                        continue
+                    self._index_if_changed(rel_path, stat)
+
+    def update_document(self, rel_path: str, content: str) -> None:
+        """Index freshly written content without waiting for the watcher."""
+        path = (self._root / rel_path).resolve()
+        try:
+            stat = path.stat()
+        except OSError:
+            return
+        normalized = path.relative_to(self._root).as_posix()
+        with self._lock:
+            if self._ready:
+                self._index_document(normalized, content, stat.st_mtime_ns, stat.st_size)
+
+    def close(self) -> None:
+        """Persist changes that are still waiting for the save timer."""
+        with self._lock:
+            timer, self._save_timer = self._save_timer, None
+        if timer is not None:
+            timer.cancel()
+        if self._dirty:
+            self.save()
+
+    def save(self) -> None:
+        with self._save_lock:
+            with self._lock:
+                payload = {
+                    "version": _INDEX_VERSION,
+                    "root": str(self._root),
+                    "docs": self._docs,
+                    "postings": self._postings,
+                }
+                data = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+                self._dirty = False
+            # Only the serialization needs the index lock; searches go on during the write.
+            self._index_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self._index_path.with_suffix(".tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, self._index_path)
+
+    def _mark_dirty(self) -> None:
+        self._dirty = True
+        if self._save_timer is None:
+            timer = threading.Timer(self._save_delay, self._save_later)
+            timer.daemon = True
+            self._save_timer = timer
+            timer.start()
+
+    def _save_later(self) -> None:
+        with self._lock:
+            self._save_timer = None
+            if not self._dirty:
+                return
+        try:
+            self.save()
+        except OSError:
+            logger.exception("Failed to persist the search index path=%s", self._index_path)
+            with self._lock:
+                self._mark_dirty()
+
+    def _load(self) -> None:
+        self._loaded = True
+        try:
+            with self._index_path.open("rb") as fh:
+                payload = pickle.load(fh)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return
+        if payload.get("version") != _INDEX_VERSION or payload.get("root") != str(self._root):
+            return
+        self._docs = payload["docs"]
+        self._postings = payload["postings"]
+        self._total_length = sum(doc.length for doc in self._docs.values())
+        self._vocabulary = None
+
+    def _index_if_changed(self, rel_path: str, stat: os.stat_result) -> bool:
+        doc = self._docs.get(rel_path)
+        if doc and doc.mtime_ns == stat.st_mtime_ns and doc.size == stat.st_size:
+            return False
+        try:
+            text = (self._root / rel_path).read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError):
+            return False
+        self._index_document(rel_path, text, stat.st_mtime_ns, stat.st_size)
+        return True
+
+    def _forget(self, rel_path: str, is_dir: bool) -> None:
+        if not is_dir:
+            self._remove_document(rel_path)
+            return
+        prefix = f"{rel_path}/"
+        for doc_path in [p for p in self._docs if p.startswith(prefix)]:
+            self._remove_document(doc_path)
+
+    def _index_document(self, rel_path: str, text: str, mtime_ns: int, size: int) -> None:
+        self._remove_document(rel_path)
+        tokens = tokenize(text)
+        positions: dict[str, list[int]] = {}
+        for position, token in enumerate(tokens):
+            positions.setdefault(token, []).append(position)
+        for term, term_positions in positions.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                self._vocabulary = None
+            postings[rel_path] = term_positions
+        self._docs[rel_path] = _Document(mtime_ns, size, len(tokens), list(positions))
+        self._total_length += len(tokens)
+        self._mark_dirty()
+
+    def _remove_document(self, rel_path: str) -> None:
+        doc = self._docs.pop(rel_path, None)
+        if doc is None:
+            return
+        for term in doc.terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(rel_path, None)
+            if not postings:
+                del self._postings[term]
+                self._vocabulary = None
+        self._total_length -= doc.length
+        self._mark_dirty()
+
+    # Querying ------------------------------------------------------------
+
+    def search(self, query: str, limit: int = 20, path_prefix: str = "") -> dict:
+        clauses = _parse_query(query)
+        if not clauses:
+            return {"query": query, "total": 0, "results": []}
+
+        with self._lock:
+            candidates: set[str] | None = None
+            for clause in clauses:
+                matches = self._match_clause(clause)
+                candidates = matches if candidates is None else candidates & matches
+                if not candidates:
+                    break
+            candidates = {p for p in candidates or () if p.startswith(path_prefix)}
+            scored = sorted(
+                ((self._score(path, clauses), path) for path in candidates),
+                key=lambda item: (-item[0], item[1]),
+            )
+        results = [
+            {"path": path, "score": round(score, 4), **_snippet(self._root / path, clauses)}
+            for score, path in scored[:limit]
+        ]
+        return {"query": query, "total": len(scored), "results": results}
+
+    def rank_related(
+        self, text: str, limit: int, exclude: str | None = None
+    ) -> tuple[list[tuple[str, float]], dict[str, float]]:
+        """OR-ranked BM25 lookup for free text, used for retrieval rather than user search.
+
+        Returns the best documents and the idf weight of every query term that was used.
+        Terms present in more than half of the documents carry little signal and are skipped.
+        """
+        with self._lock:
+            total_docs = len(self._docs)
+            if not total_docs:
+                return [], {}
+            avg_length = self._total_length / total_docs or 1.0
+            weights: dict[str, float] = {}
+            for term in set(tokenize(text)):
+                postings = self._postings.get(term)
+                if not postings or (total_docs >= 4 and len(postings) > total_docs / 2):
+                    continue
+                df = len(postings)
+                weights[term] = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+
+            k1, b = 1.2, 0.75
+            scores: dict[str, float] = {}
+            for term, idf in weights.items():
+                for path, positions in self._postings[term].items():
+                    if path == exclude:
+                        continue
+                    tf = len(positions)
+                    length = self._docs[path].length
+                    scores[path] = scores.get(path, 0.0) + idf * tf * (k1 + 1) / (
+                        tf + k1 * (1 - b + b * length / avg_length)
+                    )
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return best, weights
+
+    def _expand_prefix(self, prefix: str) -> list[str]:
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        vocabulary = self._vocabulary
+        start = bisect_left(vocabulary, prefix)
+        terms = []
+        for term in vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def _match_clause(self, clause: _Clause) -> set[str]:
+        if clause.kind == "prefix":
+            clause.matched_terms = set(self._expand_prefix(clause.tokens[0]))
+            matches: set[str] = set()
+            for term in clause.matched_terms:
+                matches.update(self._postings[term])
+            return matches
+
+        clause.matched_terms = set(clause.tokens)
+        postings = [self._postings.get(token) for token in clause.tokens]
+        if any(p is None for p in postings):
+            return set()
+        docs = set.intersection(*(set(p) for p in postings))  # type: ignore[arg-type]
+        if clause.kind == "phrase" and len(clause.tokens) > 1:
+            docs = {path for path in docs if _has_phrase(postings, path)}  # type: ignore[arg-type]
+        return docs
+
+    def _score(self, path: str, clauses: list[_Clause]) -> float:
+        k1, b = 1.2, 0.75
+        total_docs = len(self._docs) or 1
+        avg_length = self._total_length / total_docs or 1.0
+        length = self._docs[path].length
+        score = 0.0
+        for clause in clauses:
+            for term in clause.matched_terms:
+                postings = self._postings.get(term, {})
+                tf = len(postings.get(path, ()))
+                if not tf:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length))
+        return score
+
+
+def _walk_markdown(root: Path, start: str = ""):
+    stack = [root / start if start else root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = os.scandir(directory)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(Path(entry.path))
+                    elif entry.name.endswith(".md") and entry.is_file():
+                        rel_path = Path(entry.path).relative_to(root).as_posix()
+                        yield rel_path, entry.stat()
+                except OSError:
+                    continue
+
+
+def _parse_query(query: str) -> list[_Clause]:
+    clauses: list[_Clause] = []
+    for phrase, word in _QUERY_RE.findall(query):
+        if phrase:
+            tokens = tokenize(phrase)
+            if tokens:
+                clauses.append(_Clause("phrase", tokens))
+            continue
+        is_prefix = word.endswith("*")
+        tokens = tokenize(word)
+        if not tokens:
+            continue
+        if is_prefix and len(tokens) == 1:
+            clauses.append(_Clause("prefix", tokens))
+        else:
+            clauses.extend(_Clause("term", [token]) for token in tokens)
+    return clauses
+
+
+def _has_phrase(postings: list[dict[str, list[int]]], path: str) -> bool:
+    following = [set(p[path]) for p in postings[1:]]
+    return any(
+        all(start + offset + 1 in positions for offset, positions in enumerate(following))
+        for start in postings[0][path]
+    )
+
+
+def _snippet(path: Path, clauses: list[_Clause]) -> dict:
+    """Build a short excerpt around the first match, with highlight offsets into it."""
+    try:
+        text = path.read_text(encoding="utf-8")
+    except (OSError, UnicodeDecodeError):
+        return {"snippet": "", "highlights": []}
+
+    patterns = []
+    for clause in clauses:
+        if clause.kind == "phrase":
+            patterns.append(r"\W+".join(re.escape(token) for token in clause.tokens) + r"\b")
+        elif clause.kind == "prefix":
+            patterns.append(re.escape(clause.tokens[0]) + r"\w*")
+        else:
+            patterns.append(re.escape(clause.tokens[0]) + r"\b")
+    matcher = re.compile(r"\b(?:" + "|".join(patterns) + ")", re.IGNORECASE)
+
+    first = matcher.search(text)
+    center = first.start() if first else 0
+    start = max(0, center - _SNIPPET_CHARS // 3)
+    end = min(len(text), start + _SNIPPET_CHARS)
+    excerpt = text[start:end]
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(text) else ""
+    snippet = " ".join(excerpt.split())
+    snippet = f"{prefix}{snippet}{suffix}"
+    highlights = [[m.start(), m.end()] for m in matcher.finditer(snippet)]
+    return {"snippet": snippet, "highlights": highlights}
+
+
+search_index = SearchIndex(
+    file_service.WORKSPACE_DIR,
+    Path(os.getenv("SEARCH_INDEX_PATH") or _default_index_path()).expanduser(),
+)
+file_service.add_write_hook(search_index.update_document)
+
+_initial_refresh: asyncio.Task[None] | None = None
+
+
+async def start_indexing() -> None:
+    """Follow workspace changes and reconcile the index in the background at startup."""
+    global _initial_refresh
+    await workspace_watcher.add_listener(search_index.apply_changes)
+    _initial_refresh = asyncio.create_task(_refresh_in_background())
+
+
+async def _refresh_in_background() -> None:
+    try:
+        await file_service.run_io(search_index.ensure_ready)
+    except Exception:
+        logger.exception("Initial search index refresh failed")
+
+
+def search(query: str, limit: int = 20, path: str = "") -> dict:
+    if not query.strip():
+        raise HTTPException(status_code=400, detail="Query must not be empty")
+    prefix = ""
+    if path:
+        prefix = _safe_relative(path).rstrip("/") + "/"
+        if prefix == "./":
+            prefix = ""
+    search_index.ensure_ready()
+    return search_index.search(query, limit=limit, path_prefix=prefix)
+
+
+def related_documents(
+    text: str, limit: int, exclude_path: str | None = None
+) -> tuple[list[tuple[str, float]], dict[str, float]]:
+    """Rank notes related to ``text`` for retrieval.
+
+    Never waits for the startup reconciliation: until the index is ready, nothing is
+    returned and the request is answered without cross-document context.
+    """
+    if not search_index.ready:
+        return [], {}
+    exclude = None
+    if exclude_path:
+        exclude = _safe_relative(exclude_path)
+    return search_index.rank_related(text, limit, exclude)
+
+
+def read_indexed_text(rel_path: str) -> str | None:
+    try:
+        return (file_service.WORKSPACE_DIR / rel_path).read_text(encoding="utf-8")
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def _safe_relative(rel_path: str) -> str:
+    return file_service._safe_join(rel_path).relative_to(file_service.WORKSPACE_DIR).as_posix()
@@ -0,0 +1,466 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import stat
+import threading
+import time
+import uuid
+from collections import deque
+from collections.abc import AsyncIterator, Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+from fastapi import HTTPException
+
+from . import file_service
+
+try:
+    import watchfiles
+except ImportError:  # pragma: no cover - optional dependency
+    watchfiles = None
+
+logger = logging.getLogger("uvicorn.error").getChild(__name__)
+
+# "auto" uses native notifications (inotify on Linux) when watchfiles is installed.
+WATCH_BACKEND = os.getenv("WATCH_BACKEND", "auto").lower()
+WATCH_DEBOUNCE_MS = int(os.getenv("WATCH_DEBOUNCE_MS", "200"))
+WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", "1.0"))
+WATCH_KEEPALIVE = float(os.getenv("WATCH_KEEPALIVE", "15"))
+# Seconds the watcher keeps running after the last client leaves.
+WATCH_IDLE_GRACE = float(os.getenv("WATCH_IDLE_GRACE", "60"))
+
+# Change batches kept for clients reconnecting with Last-Event-ID.
+_HISTORY_BATCHES = 256
+# Batches buffered per client before it is told to resync instead.
+_SUBSCRIBER_MAX_BATCHES = 256
+# How long a write through file_service is remembered for echo tagging.
+_SELF_WRITE_TTL = 60.0
+
+
+@dataclass(frozen=True)
+class _Entry:
+    is_dir: bool
+    ino: int
+    # Always 0 for directories: only their creation, deletion and renames are reported.
+    mtime_ns: int
+    size: int
+
+
+def _tracked(name: str, is_dir: bool) -> bool:
+    return not name.startswith(".") and (is_dir or name.endswith(".md"))
+
+
+def _child(rel: str, name: str) -> str:
+    return f"{rel}/{name}" if rel else name
+
+
+def _stat_entry(path: Path) -> _Entry | None:
+    try:
+        st = os.stat(path, follow_symlinks=False)
+    except OSError:
+        return None
+    if stat.S_ISDIR(st.st_mode):
+        return _Entry(True, st.st_ino, 0, 0)
+    if stat.S_ISREG(st.st_mode):
+        return _Entry(False, st.st_ino, st.st_mtime_ns, st.st_size)
+    return None
+
+
+def _scan(
+    root: Path,
+    rel: str,
+    out: dict[str, _Entry],
+    listings: dict[str, tuple[int, tuple[tuple[str, bool], ...]]],
+) -> None:
+    """Add every tracked entry below directory ``rel`` to ``out``.
+
+    Directory listings are reused while the directory's mtime is unchanged, so a scan
+    of an idle tree costs one stat per entry and no directory reads.
+    """
+    directory = root / rel if rel else root
+    try:
+        dir_mtime = os.stat(directory).st_mtime_ns
+    except OSError:
+        return
+    cached = listings.get(rel)
+    if cached is not None and cached[0] == dir_mtime:
+        children = cached[1]
+    else:
+        found: list[tuple[str, bool]] = []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if _tracked(entry.name, is_dir):
+                        found.append((entry.name, is_dir))
+        except OSError:
+            return
+        children = tuple(found)
+        listings[rel] = (dir_mtime, children)
+    for name, _ in children:
+        child_rel = _child(rel, name)
+        entry = _stat_entry(root / child_rel)
+        if entry is None:
+            continue
+        out[child_rel] = entry
+        if entry.is_dir:
+            _scan(root, child_rel, out, listings)
+
+
+def _diff(old: dict[str, _Entry], new: dict[str, _Entry]) -> list[dict]:
+    """Changes between two snapshots; a delete plus create of one inode is a rename."""
+    created = sorted(path for path in new if path not in old)
+    deleted = {path for path in old if path not in new}
+    by_inode = {old[path].ino: path for path in deleted}
+    changes: list[dict] = []
+    moved_dirs: list[tuple[str, str]] = []
+    for path in created:
+        entry = new[path]
+        source = by_inode.get(entry.ino)
+        if source is not None and old[source].is_dir == entry.is_dir and source in deleted:
+            deleted.discard(source)
+            # Entries inside a renamed directory moved with it; report only the directory.
+            if any(
+                source.startswith(f"{old_dir}/") and path.startswith(f"{new_dir}/")
+                for old_dir, new_dir in moved_dirs
+            ):
+                continue
+            if entry.is_dir:
+                moved_dirs.append((source, path))
+            changes.append(
+                {"kind": "renamed", "path": path, "old_path": source, "is_dir": entry.is_dir}
+            )
+        else:
+            changes.append({"kind": "created", "path": path, "is_dir": entry.is_dir})
+    for path in sorted(deleted):
+        changes.append({"kind": "deleted", "path": path, "is_dir": old[path].is_dir})
+    for path, entry in new.items():
+        previous = old.get(path)
+        if previous is not None and previous != entry and not entry.is_dir:
+            changes.append({"kind": "modified", "path": path, "is_dir": False})
+    return changes
+
+
+class _Subscriber:
+    def __init__(self) -> None:
+        self.batches: deque[tuple[int, bytes]] = deque()
+        self.ready = asyncio.Event()
+        self.overflowed = False
+
+    def push(self, seq: int, payload: bytes) -> None:
+        if len(self.batches) >= _SUBSCRIBER_MAX_BATCHES:
+            self.batches.clear()
+            self.overflowed = True
+        else:
+            self.batches.append((seq, payload))
+        self.ready.set()
+
+
+class WorkspaceWatcher:
+    """Publishes create/modify/delete/rename events for the workspace as SSE.
+
+    The watcher runs while at least one client or in-process listener (such as the
+    search index) is subscribed, and for ``WATCH_IDLE_GRACE`` seconds after the last
+    one leaves, so a client that reconnects keeps its epoch and replays what it missed
+    instead of having to resync. It uses native
+    file system notifications through watchfiles when available and otherwise
+    rescans mtimes every ``WATCH_POLL_INTERVAL`` seconds. Bursts are debounced and
+    coalesced into one batch, and each batch is diffed against a snapshot, so a
+    create-then-delete never reaches clients. Writes made through file_service are
+    remembered by content hash, so their echoes are tagged ``origin: "self"``.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self._root = root
+        self._snapshot: dict[str, _Entry] = {}
+        self._listings: dict[str, tuple[int, tuple[tuple[str, bool], ...]]] = {}
+        self._subscribers: set[_Subscriber] = set()
+        self._listeners: list[Callable[[list[dict]], None]] = []
+        self._history: deque[tuple[int, bytes]] = deque(maxlen=_HISTORY_BATCHES)
+        self._epoch = ""
+        self._seq = 0
+        self._task: asyncio.Task[None] | None = None
+        self._stop: asyncio.Event | None = None
+        self._idle_stop: asyncio.Task[None] | None = None
+        self._lifecycle = asyncio.Lock()
+        self._self_writes: dict[str, list[tuple[str, float]]] = {}
+        self._self_writes_lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def note_write(self, rel_path: str, content: str) -> None:
+        """file_service write hook: remember the version we wrote (any thread)."""
+        if not self.running:
+            return
+        rel_path = Path(rel_path).as_posix()
+        version = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        now = time.monotonic()
+        with self._self_writes_lock:
+            recent = [item for item in self._self_writes.get(rel_path, []) if item[1] > now]
+            recent.append((version, now + _SELF_WRITE_TTL))
+            self._self_writes[rel_path] = recent[-8:]
+
+    def _is_self_write(self, rel_path: str, version: str) -> bool:
+        now = time.monotonic()
+        with self._self_writes_lock:
+            recent = [item for item in self._self_writes.get(rel_path, []) if item[1] > now]
+            matched = any(item[0] == version for item in recent)
+            if recent:
+                self._self_writes[rel_path] = recent
+            else:
+                self._self_writes.pop(rel_path, None)
+        return matched
+
+    async def stream(self, last_event_id: str | None = None) -> AsyncIterator[bytes]:
+        """SSE stream of ``changes`` batches, with ``resync`` when events were missed."""
+        subscriber = await self._subscribe()
+        try:
+            yield b"retry: 2000\n\n"
+            replay = self._replay_after(last_event_id)
+            if replay is None:
+                yield _sse("resync", {"reason": "history unavailable"}, self._event_id(self._seq))
+            else:
+                for seq, payload in replay:
+                    yield _sse_raw("changes", payload, self._event_id(seq))
+            while True:
+                try:
+                    await asyncio.wait_for(subscriber.ready.wait(), timeout=WATCH_KEEPALIVE)
+                except TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                subscriber.ready.clear()
+                if subscriber.overflowed:
+                    subscriber.overflowed = False
+                    yield _sse("resync", {"reason": "client too slow"}, self._event_id(self._seq))
+                while subscriber.batches:
+                    seq, payload = subscriber.batches.popleft()
+                    yield _sse_raw("changes", payload, self._event_id(seq))
+        finally:
+            await self._unsubscribe(subscriber)
+
+    async def add_listener(self, listener: Callable[[list[dict]], None]) -> None:
+        """Call ``listener`` with every change batch for as long as the app runs.
+
+        Listeners run on the file I/O executor after SSE clients have been notified,
+        one batch at a time and in order.
+        """
+        async with self._lifecycle:
+            self._listeners.append(listener)
+            if not self.running:
+                await self._start_task()
+
+    async def aclose(self) -> None:
+        async with self._lifecycle:
+            self._cancel_idle_stop()
+            await self._stop_task()
+
+    def _event_id(self, seq: int) -> str:
+        return f"{self._epoch}:{seq}"
+
+    def _replay_after(self, last_event_id: str | None) -> list[tuple[int, bytes]] | None:
+        """Batches after ``last_event_id``; None if they are no longer available."""
+        if not last_event_id:
+            return []
+        epoch, _, seq_text = last_event_id.partition(":")
+        if epoch != self._epoch or not seq_text.isdigit():
+            return None
+        last_seq = int(seq_text)
+        if last_seq >= self._seq:
+            return []
+        if not self._history or self._history[0][0] > last_seq + 1:
+            return None
+        return [item for item in self._history if item[0] > last_seq]
+
+    async def _subscribe(self) -> _Subscriber:
+        async with self._lifecycle:
+            self._cancel_idle_stop()
+            if not self.running:
+                await self._start_task()
+            subscriber = _Subscriber()
+            self._subscribers.add(subscriber)
+            return subscriber
+
+    async def _unsubscribe(self, subscriber: _Subscriber) -> None:
+        async with self._lifecycle:
+            self._subscribers.discard(subscriber)
+            if self._subscribers or self._listeners:
+                return
+            if WATCH_IDLE_GRACE > 0:
+                self._cancel_idle_stop()
+                self._idle_stop = asyncio.create_task(self._stop_when_idle())
+            else:
+                await self._stop_task()
+
+    async def _stop_when_idle(self) -> None:
+        await asyncio.sleep(WATCH_IDLE_GRACE)
+        async with self._lifecycle:
+            self._idle_stop = None
+            if not self._subscribers and not self._listeners:
+                await self._stop_task()
+
+    def _cancel_idle_stop(self) -> None:
+        task, self._idle_stop = self._idle_stop, None
+        if task is not None:
+            task.cancel()
+
+    async def _start_task(self) -> None:
+        self._listings = {}
+        snapshot: dict[str, _Entry] = {}
+        await file_service.run_io(_scan, self._root, "", snapshot, self._listings)
+        self._snapshot = snapshot
+        self._epoch = uuid.uuid4().hex[:12]
+        self._seq = 0
+        self._history.clear()
+        self._stop = asyncio.Event()
+        use_native = watchfiles is not None and WATCH_BACKEND in {"auto", "inotify", "native"}
+        loop = self._watch_native() if use_native else self._watch_polling()
+        self._task = asyncio.create_task(loop)
+        logger.info(
+            "Workspace watcher started backend=%s entries=%d",
+            "native" if use_native else "poll",
+            len(snapshot),
+        )
+
+    async def _stop_task(self) -> None:
+        task, self._task = self._task, None
+        if task is None:
+            return
+        if self._stop is not None:
+            self._stop.set()
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            await task
+        logger.info("Workspace watcher stopped")
+
+    async def _watch_native(self) -> None:
+        try:
+            async for changes in watchfiles.awatch(
+                self._root,
+                debounce=max(WATCH_DEBOUNCE_MS, 1),
+                step=50,
+                stop_event=self._stop,
+                recursive=True,
+            ):
+                dirty = {self._relative(path) for _, path in changes}
+                await self._publish_dirty({path for path in dirty if path is not None})
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # e.g. the inotify watch limit was reached; scanning still works.
+            logger.exception("Native workspace watcher failed; falling back to polling")
+            await self._watch_polling()
+
+    async def _watch_polling(self) -> None:
+        while True:
+            await asyncio.sleep(WATCH_POLL_INTERVAL)
+            fresh: dict[str, _Entry] = {}
+            await file_service.run_io(_scan, self._root, "", fresh, self._listings)
+            changes = _diff(self._snapshot, fresh)
+            self._snapshot = fresh
+            await self._publish(changes)
+
+    def _relative(self, path: str) -> str | None:
+        try:
+            relative = Path(path).relative_to(self._root)
+        except ValueError:
+            return None
+        if any(part.startswith(".") for part in relative.parts):
+            return None
+        return relative.as_posix()
+
+    async def _publish_dirty(self, dirty: set[str]) -> None:
+        """Re-stat the changed paths (and subtrees of directories) and publish the diff."""
+        if not dirty:
+            return
+        if "" in dirty:
+            dirty = {""}
+        else:
+            # A path below another dirty path is covered by that path's rescan.
+            dirty = {p for p in dirty if not any(p.startswith(f"{q}/") for q in dirty)}
+
+        def rescan() -> dict[str, _Entry]:
+            fresh: dict[str, _Entry] = {}
+            for rel in dirty:
+                if rel == "":
+                    _scan(self._root, "", fresh, {})
+                    continue
+                entry = _stat_entry(self._root / rel)
+                if entry is None or not _tracked(Path(rel).name, entry.is_dir):
+                    continue
+                fresh[rel] = entry
+                if entry.is_dir:
+                    _scan(self._root, rel, fresh, {})
+            return fresh
+
+        fresh = await file_service.run_io(rescan)
+        old = {
+            path: entry
+            for path, entry in self._snapshot.items()
+            if _covered(path, dirty)
+        }
+        for path in old:
+            del self._snapshot[path]
+        self._snapshot.update(fresh)
+        await self._publish(_diff(old, fresh))
+
+    async def _publish(self, changes: list[dict]) -> None:
+        if not changes:
+            return
+        await file_service.run_io(self._tag_changes, changes)
+        self._seq += 1
+        payload = json.dumps({"changes": changes}).encode("utf-8")
+        self._history.append((self._seq, payload))
+        for subscriber in self._subscribers:
+            subscriber.push(self._seq, payload)
+        for listener in self._listeners:
+            try:
+                await file_service.run_io(listener, changes)
+            except Exception:
+                logger.exception("Workspace change listener failed")
+
+    def _tag_changes(self, changes: list[dict]) -> None:
+        """Add the new content version and whether the change was our own write."""
+        for change in changes:
+            change["origin"] = "external"
+            if change["is_dir"] or change["kind"] == "deleted":
+                continue
+            try:
+                version = file_service.file_version(change["path"]).version
+            except (HTTPException, OSError):
+                continue  # gone again already
+            change["version"] = version
+            if self._is_self_write(change["path"], version):
+                change["origin"] = "self"
+
+
+def _covered(path: str, dirty: set[str]) -> bool:
+    if "" in dirty or path in dirty:
+        return True
+    parts = path.split("/")
+    return any("/".join(parts[:index]) in dirty for index in range(1, len(parts)))
+
+
+def _sse(event: str, data: dict, event_id: str) -> bytes:
+    return _sse_raw(event, json.dumps(data).encode("utf-8"), event_id)
+
+
+def _sse_raw(event: str, data: bytes, event_id: str) -> bytes:
+    return b"id: %s\nevent: %s\ndata: %s\n\n" % (
+        event_id.encode("ascii"),
+        event.encode("ascii"),
+        data,
+    )
+
+
+workspace_watcher = WorkspaceWatcher(file_service.WORKSPACE_DIR)
+file_service.add_write_hook(workspace_watcher.note_write)
@@ -0,0 +1,12 @@
+from __future__ import annotations
+
+import os
+import tempfile
+
+# Module-level settings are read at import time, so point them at scratch locations
+# before any test imports the app.
+_scratch = tempfile.mkdtemp(prefix="imd-tests-")
+os.environ.setdefault("WORKSPACE_DIR", os.path.join(_scratch, "workspace"))
+os.environ.setdefault("SEARCH_INDEX_PATH", os.path.join(_scratch, "search-index.pickle"))
+os.environ.setdefault("AI_JOBS_DIR", os.path.join(_scratch, "ai-jobs"))
+os.makedirs(os.environ["WORKSPACE_DIR"], exist_ok=True)
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator
+from dataclasses import replace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.agents import agent_router_service
+from app.agents.admission import AdmissionController, AdmissionSettings, TokenBucket
+from app.agents.exceptions import AgentExecutionError, AgentOverloadedError
+from app.main import app
+from app.services import file_service
+
+SETTINGS = AdmissionSettings(
+    max_concurrency=1,
+    rate_per_second=0,
+    burst=1,
+    max_queue=8,
+    max_wait=5,
+    retry_attempts=2,
+    retry_base_delay=0,
+    retry_max_delay=0,
+)
+
+
+def _controller(**overrides) -> AdmissionController:
+    return AdmissionController(lambda agent_id: replace(SETTINGS, **overrides))
+
+
+def test_full_queue_sheds_with_a_retry_after_hint():
+    admission = _controller(max_concurrency=2, max_queue=1)
+
+    async def main() -> None:
+        held = [await admission.admit("a"), await admission.admit("a")]
+        admission._limiter("a")._avg_hold = 4.0
+        queued = asyncio.create_task(admission.admit("a"))
+        await asyncio.sleep(0)
+        with pytest.raises(AgentOverloadedError, match="queue full") as info:
+            await admission.admit("a")
+        # Two slots, one request already waiting: about one average hold time.
+        assert info.value.retry_after == 4
+        held[0].release()
+        (await queued).release()
+        held[1].release()
+
+    asyncio.run(main())
+
+
+def test_queue_wait_is_bounded():
+    admission = _controller(max_wait=0.05)
+
+    async def main() -> None:
+        lease = await admission.admit("a")
+        with pytest.raises(AgentOverloadedError, match="queue timeout"):
+            await admission.admit("a")
+        lease.release()
+        # The timed-out waiter left the queue, so the slot is free again.
+        (await asyncio.wait_for(admission.admit("a"), 1)).release()
+
+    asyncio.run(main())
+
+
+def test_released_slots_go_to_waiters_in_order():
+    admission = _controller()
+    order: list[str] = []
+
+    async def wait_turn(name: str) -> None:
+        lease = await admission.admit("a")
+        order.append(name)
+        await asyncio.sleep(0)
+        lease.release()
+
+    async def main() -> None:
+        lease = await admission.admit("a")
+        waiters = [asyncio.create_task(wait_turn(name)) for name in ("b", "c")]
+        await asyncio.sleep(0)
+        lease.release()
+        # Arrives after the release, but before "b" has run: it must not jump the queue.
+        waiters.append(asyncio.create_task(wait_turn("d")))
+        await asyncio.gather(*waiters)
+
+    asyncio.run(main())
+    assert order == ["b", "c", "d"]
+
+
+def test_rate_limit_sheds_when_the_wait_exceeds_max_wait():
+    admission = _controller(max_concurrency=0, rate_per_second=0.5, burst=1, max_wait=1)
+
+    async def main() -> None:
+        (await admission.admit("a")).release()
+        with pytest.raises(AgentOverloadedError, match="rate limited") as info:
+            await admission.admit("a")
+        assert info.value.retry_after == 2
+
+    asyncio.run(main())
+
+
+def test_token_bucket_spaces_out_reservations():
+    bucket = TokenBucket(rate=10, burst=2)
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+
+def _transient_error() -> AgentExecutionError:
+    try:
+        raise TimeoutError("upstream timed out")
+    except TimeoutError as exc:
+        error = AgentExecutionError("Agent run failed.")
+        error.__cause__ = exc
+        return error
+
+
+def test_only_runs_without_output_are_retried():
+    admission = _controller()
+    calls: list[str] = []
+
+    def factory(output: bool):
+        def start() -> AsyncIterator[bytes]:
+            async def run() -> AsyncIterator[bytes]:
+                calls.append("run")
+                if output:
+                    yield b"chunk\n"
+                raise _transient_error()
+
+            return run()
+
+        return start
+
+    async def consume(output: bool) -> list[bytes]:
+        lease = await admission.admit("a")
+        return [chunk async for chunk in admission.run(lease, factory(output))]
+
+    with pytest.raises(AgentExecutionError):
+        asyncio.run(consume(output=False))
+    assert len(calls) == 3  # the first attempt plus AI_RETRY_ATTEMPTS
+
+    calls.clear()
+    with pytest.raises(AgentExecutionError):
+        asyncio.run(consume(output=True))
+    # A retry would repeat the chunk the client already has.
+    assert len(calls) == 1
+
+
+def test_overloaded_chat_returns_429(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_service, "WORKSPACE_DIR", tmp_path)
+    (tmp_path / "note.md").write_text("# Note\n", encoding="utf-8")
+
+    async def overloaded(request, is_disconnected=None, timings=None):
+        raise AgentOverloadedError("Agent 'openai-qa' is busy (queue full); retry later.", 3)
+
+    monkeypatch.setattr(agent_router_service, "route_request", overloaded)
+    with TestClient(app) as client:
+        response = client.post("/api/ai/chat", json={"path": "note.md", "message": "hi"})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+from app.agents.batch import BatchJobManager, BatchJobSpec, BatchSettings
+from app.agents.interface import ChatRequest
+from app.services import file_service
+
+
+class FakeRouter:
+    async def complete(self, request: ChatRequest) -> dict:
+        if request.path == "broken.md":
+            raise RuntimeError("agent bug")
+        return {"type": "final", "answer": f"summary of {request.path}"}
+
+
+def _manager(tmp_path, monkeypatch) -> BatchJobManager:
+    workspace = tmp_path / "workspace"
+    workspace.mkdir()
+    monkeypatch.setattr(file_service, "WORKSPACE_DIR", workspace)
+    (workspace / "a.md").write_text("# A\n", encoding="utf-8")
+    (workspace / "broken.md").write_text("# Broken\n", encoding="utf-8")
+    (workspace / "latin1.md").write_bytes("caf\xe9\n".encode("latin-1"))
+    settings = BatchSettings(jobs_dir=tmp_path / "jobs", concurrency=2, max_files=10)
+    return BatchJobManager(FakeRouter(), settings)
+
+
+async def _events(manager: BatchJobManager, job_id: str, after: int = 0) -> list[dict]:
+    return [json.loads(line) async for line in manager.events(job_id, after)]
+
+
+def test_file_failures_become_results(tmp_path, monkeypatch):
+    manager = _manager(tmp_path, monkeypatch)
+    spec = BatchJobSpec(agent_id="echo", mode="ask", message="Summarise")
+
+    async def main() -> None:
+        job = await manager.create(spec)
+        events = await asyncio.wait_for(_events(manager, job.job_id), 5)
+        assert events[-1]["status"] == "completed"
+        results = {e["path"]: e["status"] for e in events if e["type"] == "result"}
+        assert results == {"a.md": "ok", "broken.md": "error", "latin1.md": "error"}
+        assert not hasattr(job, "results")
+        assert len(job.offsets) == 3
+
+        # Reconnecting with ``after`` reads the remaining results back from disk.
+        tail = await _events(manager, job.job_id, after=2)
+        assert [e["type"] for e in tail] == ["job", "result", "done"]
+        assert tail[1] == [e for e in events if e["type"] == "result"][2]
+
+    asyncio.run(main())
+
+
+def test_job_fails_instead_of_hanging_when_results_cannot_be_written(tmp_path, monkeypatch):
+    manager = _manager(tmp_path, monkeypatch)
+
+    def disk_full(job, line):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(manager, "_append_result", disk_full)
+
+    async def main() -> None:
+        job = await manager.create(BatchJobSpec(agent_id="echo", mode="ask", message="Hi"))
+        events = await asyncio.wait_for(_events(manager, job.job_id), 5)
+        assert events[-1] == {**events[-1], "type": "done", "status": "failed", "done": 0}
+
+    asyncio.run(main())
+
+    restarted = BatchJobManager(FakeRouter(), manager._settings)
+    asyncio.run(restarted.start())
+    assert [job.status for job in restarted.jobs()] == ["failed"]
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import asyncio
+
+from app.agents.cache import CacheSettings, ResponseCache, make_cache_key
+from app.agents.interface import ChatRequest
+
+
+def test_cache_key_includes_path():
+    # The prompt names the file, so the same content at another path needs its own answer.
+    first = ChatRequest(path="a.md", content="# Same\n", message="Which file is this?")
+    second = first.model_copy(update={"path": "b.md"})
+
+    assert make_cache_key(first, "model") != make_cache_key(second, "model")
+    assert make_cache_key(first, "model") == make_cache_key(first.model_copy(), "model")
+
+
+def test_disk_index_is_loaded_on_first_use(tmp_path):
+    settings = CacheSettings(
+        backend="disk",
+        ttl_seconds=3600,
+        max_entries=16,
+        max_bytes=1024 * 1024,
+        directory=tmp_path / "cache",
+    )
+    key = "ab" + "0" * 62
+    payload = b'{"type": "final", "answer": "cached"}\n'
+    asyncio.run(ResponseCache(settings).put(key, payload))
+
+    cache = ResponseCache(settings)
+    # Constructing the cache (at router import) must not scan the directory.
+    assert not cache._disk_index
+    assert asyncio.run(cache.get(key)) == payload
+    assert key in cache._disk_index
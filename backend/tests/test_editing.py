@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from collections.abc import AsyncIterator
+
+import pytest
+
+from app.agents import openai_agent
+from app.agents.editing import apply_patch, parse_patch, resolve_patch_output
+from app.agents.exceptions import AgentPatchError
+from app.agents.streaming import RESET_LINE
+
+DOCUMENT = "# Title\n\nFirst paragraph.\n\nSecond paragraph.\n"
+
+
+def _patch(search: str, replace: str) -> str:
+    return f"<<<<<<< SEARCH\n{search}\n=======\n{replace}\n>>>>>>> REPLACE\n"
+
+
+def test_unique_match_is_applied():
+    output = "Here you go:\n" + _patch("Second paragraph.", "Second, edited.")
+
+    proposed = resolve_patch_output(DOCUMENT, output)
+    assert proposed == "# Title\n\nFirst paragraph.\n\nSecond, edited."
+
+
+def test_ambiguous_match_is_rejected():
+    with pytest.raises(AgentPatchError, match="matched 2 locations"):
+        apply_patch(DOCUMENT, parse_patch(_patch("paragraph.", "para.")))
+
+
+def test_empty_search_is_rejected():
+    with pytest.raises(AgentPatchError, match="empty SEARCH"):
+        apply_patch(DOCUMENT, parse_patch(_patch("", "Prepended.")))
+
+
+def test_unterminated_block_is_rejected():
+    with pytest.raises(AgentPatchError, match="unterminated"):
+        parse_patch("<<<<<<< SEARCH\nFirst paragraph.\n=======\nFirst.\n")
+
+
+def test_fenced_full_document_is_accepted():
+    output = "```markdown\n# Title\n\nRewritten.\n```"
+
+    assert resolve_patch_output(DOCUMENT, output) == "# Title\n\nRewritten."
+
+
+def test_malformed_patch_falls_back_to_a_full_rewrite(monkeypatch):
+    monkeypatch.setenv("AI_EDIT_STRATEGY", "patch")
+    monkeypatch.setenv("AI_EDIT_PATCH_MIN_CHARS", "0")
+    monkeypatch.setattr(openai_agent, "_get_patch_agent", lambda model: ("patch", model))
+    monkeypatch.setattr(openai_agent, "_get_edit_agent", lambda model: ("full", model))
+    outputs = {
+        "patch": _patch("Missing paragraph.", "Third."),
+        "full": "```markdown\n# Title\n\nRewritten.\n```",
+    }
+    runs: list[tuple[str, str]] = []
+
+    async def fake_stream_agent(agent, prompt, previous_response_id=None):
+        runs.append(agent)
+        output = outputs[agent[0]]
+        yield openai_agent._StreamChunk(type="delta", text=output)
+        yield openai_agent._StreamChunk(type="final", text=output)
+
+    monkeypatch.setattr(openai_agent, "_stream_agent", fake_stream_agent)
+
+    async def main() -> list[bytes]:
+        stream: AsyncIterator[bytes] = openai_agent._edit(
+            "note.md", DOCUMENT, "edit", None, "small", lambda: "large"
+        )
+        return [line async for line in stream]
+
+    lines = asyncio.run(main())
+    assert runs == [("patch", "small"), ("full", "large")]
+    assert RESET_LINE in lines
+    events = [json.loads(line) for line in lines]
+    finals = [event for event in events if event["type"] == "final"]
+    assert finals == [{"type": "final", "proposedContent": "# Title\n\nRewritten."}]
+    # Only the rewrite follows the reset.
+    after_reset = events[lines.index(RESET_LINE) + 1 :]
+    assert "SEARCH" not in "".join(event.get("text", "") for event in after_reset)
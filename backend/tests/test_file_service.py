@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import file_service
+
+
+def _touch_in_place(path, text: str) -> None:
+    # Rewrite without replacing the inode so the directory mtime is left alone.
+    stat = os.stat(path.parent)
+    with open(path, "r+", encoding="utf-8") as f:
+        f.write(text)
+    os.utime(path.parent, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def test_external_in_place_edit_is_listed(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_service, "WORKSPACE_DIR", tmp_path)
+    note = tmp_path / "note.md"
+    note.write_text("short\n", encoding="utf-8")
+
+    assert file_service.list_dir("")[0]["size"] == 6
+    first = file_service.tree("")
+
+    _touch_in_place(note, "a much longer line\n")
+
+    assert file_service.list_dir("")[0]["size"] == 19
+    assert file_service.tree("").etag != first.etag
+
+
+def test_tree_not_modified_skips_the_body(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_service, "WORKSPACE_DIR", tmp_path)
+    (tmp_path / "notes").mkdir()
+    (tmp_path / "notes" / "a.md").write_text("a\n", encoding="utf-8")
+
+    with TestClient(app) as client:
+        response = client.get("/api/tree")
+        assert response.status_code == 200
+        assert response.json()["children"][0]["children"][0]["path"] == "notes/a.md"
+        etag = response.headers["etag"]
+
+        def no_body(self):
+            raise AssertionError("the body must not be built for a 304")
+
+        monkeypatch.setattr(file_service.TreeSnapshot, "to_dict", no_body)
+        response = client.get("/api/tree", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+
+def test_slow_disk_read_does_not_delay_other_streams(monkeypatch):
+    def slow_read_file(rel_path: str) -> dict:
+        time.sleep(1.0)
+        return {"path": rel_path, "content": ""}
+
+    monkeypatch.setattr(file_service, "read_file", slow_read_file)
+
+    async def other_stream():
+        for _ in range(40):
+            await asyncio.sleep(0.01)
+            yield time.perf_counter()
+
+    async def main() -> float:
+        reads = [asyncio.create_task(file_service.aread_file("slow.md")) for _ in range(4)]
+        await asyncio.sleep(0)
+        gaps = []
+        last = time.perf_counter()
+        async for at in other_stream():
+            gaps.append(at - last)
+            last = at
+        assert not any(read.done() for read in reads)
+        await asyncio.gather(*reads)
+        return max(gaps)
+
+    assert asyncio.run(main()) < 0.2
+
+
+def _patch(client: TestClient, base_version: str, *edits: tuple[int, int, str]):
+    body = {
+        "base_version": base_version,
+        "edits": [{"start": start, "end": end, "text": text} for start, end, text in edits],
+    }
+    return client.patch("/api/file", params={"path": "note.md"}, json=body)
+
+
+def test_patch_offsets_are_utf16_code_units(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_service, "WORKSPACE_DIR", tmp_path)
+    (tmp_path / "note.md").write_text("a\U0001F600b\n", encoding="utf-8")
+
+    with TestClient(app) as client:
+        version = client.get("/api/file", params={"path": "note.md"}).json()["version"]
+        # The emoji is two UTF-16 code units, so "b" starts at offset 3.
+        response = _patch(client, version, (3, 4, "c"), (0, 0, "\U0001F389"))
+        assert response.status_code == 200
+        assert (tmp_path / "note.md").read_text(encoding="utf-8") == "\U0001F389a\U0001F600c\n"
+        assert response.json()["version"] != version
+
+
+def test_patch_against_a_stale_version_conflicts(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_service, "WORKSPACE_DIR", tmp_path)
+    (tmp_path / "note.md").write_text("one\n", encoding="utf-8")
+
+    with TestClient(app) as client:
+        base = client.get("/api/file", params={"path": "note.md"}).json()["version"]
+        current = client.put(
+            "/api/file", params={"path": "note.md"}, json={"content": "two\n"}
+        ).json()["version"]
+        response = _patch(client, base, (0, 3, "three"))
+        assert response.status_code == 409
+        assert response.json()["detail"]["version"] == current
+    assert (tmp_path / "note.md").read_text(encoding="utf-8") == "two\n"
+
+
+def test_invalid_patch_edits_are_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_service, "WORKSPACE_DIR", tmp_path)
+    (tmp_path / "note.md").write_text("a\U0001F600b\n", encoding="utf-8")
+
+    with TestClient(app) as client:
+        version = client.get("/api/file", params={"path": "note.md"}).json()["version"]
+        assert _patch(client, version, (0, 2, "x"), (1, 3, "y")).status_code == 422
+        assert _patch(client, version, (0, 9, "x")).status_code == 422
+        # Offset 2 falls between the emoji's surrogates.
+        assert _patch(client, version, (2, 2, "x")).status_code == 422
+    assert (tmp_path / "note.md").read_text(encoding="utf-8") == "a\U0001F600b\n"
+
+
+def test_buffered_writes_are_visible_before_the_flush(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_service, "WORKSPACE_DIR", tmp_path)
+    monkeypatch.setattr(file_service, "_write_behind", file_service._WriteBehind(60))
+    (tmp_path / "old.md").write_text("old\n", encoding="utf-8")
+
+    file_service.write_file("new.md", "hello\n")
+    file_service.write_file("old.md", "old, edited\n")
+
+    assert not (tmp_path / "new.md").exists()
+    assert file_service.read_file("new.md")["content"] == "hello\n"
+    assert b"".join(file_service.iter_file_bytes("old.md")) == b"old, edited\n"
+    listing = {entry["name"]: entry["size"] for entry in file_service.list_dir("")}
+    assert listing == {"new.md": 6, "old.md": 12}
+
+    file_service.flush_pending_writes()
+    assert (tmp_path / "new.md").read_text(encoding="utf-8") == "hello\n"
+    assert (tmp_path / "old.md").read_text(encoding="utf-8") == "old, edited\n"
+
+
+def test_write_bursts_are_flushed_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_service, "WORKSPACE_DIR", tmp_path)
+    monkeypatch.setattr(file_service, "_write_behind", file_service._WriteBehind(0.2))
+    flushed: list[list[bytes]] = []
+    write_many = file_service._atomic_write_many
+
+    def recording_write_many(items):
+        flushed.append([data for _, data in items])
+        return write_many(items)
+
+    monkeypatch.setattr(file_service, "_atomic_write_many", recording_write_many)
+
+    for count in range(5):
+        file_service.write_file("note.md", f"draft {count}\n")
+    time.sleep(0.6)
+
+    assert flushed == [[b"draft 4\n"]]
+    assert (tmp_path / "note.md").read_text(encoding="utf-8") == "draft 4\n"
+    file_service.flush_pending_writes()
+
+
+def test_shutdown_flushes_pending_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_service, "WORKSPACE_DIR", tmp_path)
+    monkeypatch.setattr(file_service, "_write_behind", file_service._WriteBehind(60))
+
+    with TestClient(app) as client:
+        response = client.put("/api/file", params={"path": "note.md"}, json={"content": "saved\n"})
+        assert response.status_code == 200
+        assert not (tmp_path / "note.md").exists()
+    assert (tmp_path / "note.md").read_text(encoding="utf-8") == "saved\n"
+
+
+def test_file_conditional_requests(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_service, "WORKSPACE_DIR", tmp_path)
+    (tmp_path / "note.md").write_text("# Note\n", encoding="utf-8")
+    params = {"path": "note.md"}
+
+    with TestClient(app) as client:
+        response = client.get("/api/file", params=params)
+        assert response.status_code == 200
+        etag, last_modified = response.headers["etag"], response.headers["last-modified"]
+
+        same = client.get("/api/file", params=params, headers={"If-None-Match": etag})
+        assert same.status_code == 304
+        assert same.headers["etag"] == etag
+        weak = client.get("/api/file", params=params, headers={"If-None-Match": f"W/{etag}"})
+        assert weak.status_code == 304
+        since = client.get("/api/file", params=params, headers={"If-Modified-Since": last_modified})
+        assert since.status_code == 304
+        raw = client.get(
+            "/api/file", params={**params, "raw": "true"}, headers={"If-None-Match": etag}
+        )
+        assert raw.status_code == 304
+
+        (tmp_path / "note.md").write_text("# Note, edited\n", encoding="utf-8")
+        changed = client.get("/api/file", params=params, headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.json()["content"] == "# Note, edited\n"
+
+
+def test_compressed_raw_reads_use_a_weak_etag(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_service, "WORKSPACE_DIR", tmp_path)
+    content = "# Note\n\n" + "Some repeated text.\n" * 200
+    (tmp_path / "note.md").write_text(content, encoding="utf-8")
+    params = {"path": "note.md", "raw": "true"}
+
+    with TestClient(app) as client:
+        identity = client.get("/api/file", params=params, headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in identity.headers
+        assert identity.text == content
+        strong = identity.headers["etag"]
+        assert not strong.startswith("W/")
+
+        gzipped = client.get("/api/file", params=params, headers={"Accept-Encoding": "gzip"})
+        assert gzipped.headers["content-encoding"] == "gzip"
+        assert gzipped.headers["etag"] == f"W/{strong}"
+        assert "Accept-Encoding" in gzipped.headers["vary"]
+        assert gzipped.text == content  # decoded by the client
+
+        # A cached compressed copy revalidates with its weak ETag.
+        revalidated = client.get(
+            "/api/file",
+            params=params,
+            headers={"Accept-Encoding": "gzip", "If-None-Match": gzipped.headers["etag"]},
+        )
+        assert revalidated.status_code == 304
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+
+from app.agents import google_adk_agent
+from app.agents.interface import ChatRequest
+from bench.fake_llm import FakeLLMConfig, fake_genai_module
+
+# One fake stream takes about ttft + output_tokens / tokens_per_second = 0.4s.
+_CONFIG = FakeLLMConfig(ttft=0.3, tokens_per_second=400, output_tokens=40)
+
+
+def _agent(monkeypatch) -> google_adk_agent.GoogleADKAgent:
+    monkeypatch.setattr(google_adk_agent, "genai", fake_genai_module(_CONFIG))
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    return google_adk_agent.GoogleADKAgent()
+
+
+async def _timed_streams(agent: google_adk_agent.GoogleADKAgent, count: int):
+    request = ChatRequest(
+        path="note.md",
+        content="# Note\n\nSome text to summarise.\n",
+        message="Summarise this note.",
+        agent_id="google-adk-qa",
+    )
+
+    async def consume() -> dict:
+        lines = [line async for line in agent.process_stream(request)]
+        return json.loads(lines[-1])
+
+    started = time.perf_counter()
+    finals = await asyncio.gather(*(consume() for _ in range(count)))
+    return time.perf_counter() - started, finals
+
+
+def test_parallel_streams_do_not_serialize(monkeypatch):
+    agent = _agent(monkeypatch)
+    single, _ = asyncio.run(_timed_streams(agent, 1))
+    elapsed, finals = asyncio.run(_timed_streams(agent, 8))
+
+    assert all(final["type"] == "final" and final["answer"] for final in finals)
+    # Serialized, eight streams would take eight times as long as one.
+    assert elapsed < single * 2, f"8 streams took {elapsed:.2f}s, one took {single:.2f}s"
+
+
+def test_failed_patch_resets_before_full_rewrite(monkeypatch):
+    # The fake answers patch prompts with plain words, which never apply as a patch.
+    monkeypatch.setenv("AI_EDIT_PATCH_MIN_CHARS", "0")
+    agent = _agent(monkeypatch)
+    request = ChatRequest(
+        path="note.md",
+        content="# Note\n\nSome text.\n",
+        message="Make it longer.",
+        mode="edit",
+        agent_id="google-adk-qa",
+    )
+
+    async def collect() -> list[dict]:
+        return [json.loads(line) async for line in agent.process_stream(request)]
+
+    events = asyncio.run(collect())
+    types = [event["type"] for event in events]
+
+    assert types.count("reset") == 1 and types[-1] == "final"
+    after_reset = events[types.index("reset") + 1 :]
+    streamed = "".join(event["text"] for event in after_reset if event["type"] == "delta")
+    assert streamed.startswith("```markdown\n")
+    assert events[-1]["proposedContent"].startswith("# Edited")
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator
+from dataclasses import replace
+
+import pytest
+
+from app.agents.admission import AdmissionController, get_admission_settings
+from app.agents.exceptions import (
+    AgentExecutionError,
+    AgentOverloadedError,
+    AgentRequestTooLargeError,
+)
+from app.agents.hedged_agent import HedgedAgent, HedgeSettings
+from app.agents.interface import AgentInterface, ChatRequest, ModelRoute
+from app.agents.router import AgentRouterService
+from app.agents.streaming import event_line, parse_final
+
+
+class DelayedAgent(AgentInterface):
+    def __init__(self, ttft: float) -> None:
+        self.ttft = ttft
+
+    async def process_stream(self, request: ChatRequest) -> AsyncIterator[bytes]:
+        await asyncio.sleep(self.ttft)
+        yield event_line({"type": "final", "answer": str(self.ttft)})
+
+
+class Pool:
+    def __init__(self, agents: dict[str, AgentInterface]) -> None:
+        self.agents = agents
+        self.admitted: list[str] = []
+
+        def settings_for(agent_id: str):
+            self.admitted.append(agent_id)
+            return get_admission_settings(agent_id)
+
+        self.admission = AdmissionController(settings_for)
+
+    def get_agent_instance(self, agent_id: str) -> AgentInterface:
+        return self.agents[agent_id]
+
+
+def test_hedge_uses_pooled_agents_and_censors_the_loser():
+    pool = Pool({"openai-qa": DelayedAgent(0.15), "google-adk-qa": DelayedAgent(1.0)})
+    settings = HedgeSettings(
+        agent_ids=("openai-qa", "google-adk-qa"), hedge_delay=0.1, window=10
+    )
+    agent = HedgedAgent(pool, settings)
+    request = ChatRequest(path="note.md", content="# Note\n", message="hi", agent_id="auto")
+
+    async def main() -> dict:
+        lines = [line async for line in agent.process_stream(request)]
+        return parse_final(lines[-1])
+
+    assert asyncio.run(main())["answer"] == "0.15"
+    assert agent._agents == pool.agents
+    assert sorted(pool.admitted) == ["google-adk-qa", "openai-qa"]
+    # The hedge was cancelled ~0.05 s after it started; that must not look like a fast TTFT.
+    assert agent._latency["google-adk-qa"].p95() >= agent._latency["openai-qa"].p95()
+    assert agent.ranked_agent_ids() == ["openai-qa", "google-adk-qa"]
+
+
+def _saturated_pool(agents: dict[str, AgentInterface]) -> Pool:
+    pool = Pool(agents)
+    pool.admission = AdmissionController(
+        lambda agent_id: replace(get_admission_settings(agent_id), max_concurrency=1, max_queue=0)
+    )
+    return pool
+
+
+def test_all_candidates_shedding_raises_overloaded():
+    pool = _saturated_pool({"openai-qa": DelayedAgent(0), "google-adk-qa": DelayedAgent(0)})
+    settings = HedgeSettings(
+        agent_ids=("openai-qa", "google-adk-qa"), hedge_delay=0.1, window=10
+    )
+    agent = HedgedAgent(pool, settings)
+    request = ChatRequest(path="note.md", content="# Note\n", message="hi", agent_id="auto")
+
+    async def main() -> None:
+        held = [await pool.admission.admit(agent_id) for agent_id in pool.agents]
+        pool.admission._limiter("openai-qa")._avg_hold = 5.0
+        pool.admission._limiter("google-adk-qa")._avg_hold = 3.0
+        with pytest.raises(AgentOverloadedError) as info:
+            await agent.start(request)
+        assert info.value.retry_after == 3
+        with pytest.raises(AgentOverloadedError):
+            [line async for line in agent.process_stream(request)]
+        # Shedding is not a provider failure.
+        assert agent._latency["openai-qa"].p95() is None
+        for lease in held:
+            lease.release()
+        lines = [line async for line in agent.process_stream(request)]
+        assert parse_final(lines[-1])["answer"] == "0"
+
+    asyncio.run(main())
+
+
+def _transient_agent(agent_id: str, calls: list[str]) -> type[AgentInterface]:
+    class TransientAgent(AgentInterface):
+        async def process_stream(self, request: ChatRequest) -> AsyncIterator[bytes]:
+            calls.append(agent_id)
+            try:
+                raise TimeoutError("upstream timed out")
+            except TimeoutError as exc:
+                raise AgentExecutionError("Agent run failed.") from exc
+            yield b""
+
+    return TransientAgent
+
+
+def test_router_leaves_admission_and_retries_to_the_providers(monkeypatch):
+    monkeypatch.setenv("AI_AUTO_AGENTS", "openai-qa,google-adk-qa")
+    monkeypatch.setenv("AI_RETRY_ATTEMPTS", "2")
+    monkeypatch.setenv("AI_RETRY_BASE_DELAY", "0")
+    calls: list[str] = []
+    registry = {
+        "auto": HedgedAgent,
+        "openai-qa": _transient_agent("openai-qa", calls),
+        "google-adk-qa": _transient_agent("google-adk-qa", calls),
+    }
+    router = AgentRouterService(registry=registry)
+    request = ChatRequest(path="note.md", content="# Note\n", message="hi", agent_id="auto")
+
+    with pytest.raises(AgentExecutionError):
+        asyncio.run(router.complete(request))
+    # Each provider is retried by its own admission; the race is not rerun on top.
+    assert sorted(calls) == ["google-adk-qa"] * 3 + ["openai-qa"] * 3
+    assert "auto" not in router.admission._limiters
+
+
+class RoutedAgent(AgentInterface):
+    def __init__(self, *routes: ModelRoute) -> None:
+        self.routes = list(routes)
+
+    def model_routes(self) -> list[ModelRoute]:
+        return self.routes
+
+    async def process_stream(self, request: ChatRequest) -> AsyncIterator[bytes]:
+        yield event_line({"type": "final", "answer": request.route.model})
+
+
+def test_candidates_are_routed_by_size():
+    pool = Pool(
+        {
+            "openai-qa": RoutedAgent(ModelRoute(model="small", max_input_tokens=2000)),
+            "google-adk-qa": RoutedAgent(ModelRoute(model="large", max_input_tokens=100_000)),
+        }
+    )
+    agent = HedgedAgent(pool)
+    request = ChatRequest(
+        path="note.md", content="# Note\n" + "word " * 5000, message="fix", mode="edit"
+    )
+
+    async def answer(request: ChatRequest) -> str:
+        lines = [line async for line in agent.process_stream(request)]
+        return parse_final(lines[-1])["answer"]
+
+    # The edit does not fit the first-ranked candidate, so it is left out of the race.
+    assert asyncio.run(answer(request)) == "large"
+    too_large = request.model_copy(update={"content": "# Note\n" + "word " * 200_000})
+    with pytest.raises(AgentRequestTooLargeError) as info:
+        asyncio.run(agent.start(too_large))
+    assert info.value.limit == 100_000
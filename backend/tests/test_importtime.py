@@ -0,0 +1,10 @@
+from __future__ import annotations
+
+from bench.importtime import LAZY_MODULES, measure
+
+
+def test_app_main_does_not_import_provider_sdks(tmp_path):
+    imported = measure("app.main", str(tmp_path))
+
+    assert "app.main" in imported
+    assert [module for module in LAZY_MODULES if module in imported] == []
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from app.agents.interface import ChatRequest, ChatTurn, ModelRoute, SessionContext
+from app.agents.model_routing import plan_route
+
+_ROUTES = [
+    ModelRoute(model="small", max_input_tokens=4000),
+    ModelRoute(model="large", max_input_tokens=100000),
+]
+
+
+def test_session_history_counts_towards_the_route():
+    request = ChatRequest(path="note.md", content="# Note\n\nShort.\n", message="And now?")
+    assert plan_route(request, _ROUTES).model == "small"
+
+    history = [ChatTurn(role="user", text="word " * 5000), ChatTurn(role="assistant", text="ok")]
+    session = SessionContext(session_id="s", history=history)
+    routed = plan_route(request.model_copy(update={"session": session}), _ROUTES)
+    assert routed.model == "large"
+
+
+def test_patch_edit_keeps_a_route_for_the_full_rewrite(monkeypatch):
+    monkeypatch.setenv("AI_EDIT_STRATEGY", "patch")
+    monkeypatch.setenv("AI_EDIT_PATCH_MIN_CHARS", "0")
+    content = "# Note\n\n" + "word " * 2400  # ~3000 tokens: a patch fits, a rewrite does not
+    request = ChatRequest(path="note.md", content=content, message="Tidy up.", mode="edit")
+
+    routed = plan_route(request, _ROUTES)
+    assert (routed.model, routed.rewrite_model) == ("small", "large")
+    assert plan_route(request, _ROUTES[:1]).rewrite_model is None
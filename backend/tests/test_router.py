@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import asyncio
+import gc
+import json
+from collections.abc import AsyncIterator
+
+import pytest
+
+from app.agents.exceptions import AgentSessionBusyError
+from app.agents.interface import AgentInterface, ChatRequest
+from app.agents.router import AgentRouterService
+from app.agents.streaming import delta_line, event_line, parse_final
+
+
+class EchoAgent(AgentInterface):
+    async def process_stream(self, request: ChatRequest) -> AsyncIterator[bytes]:
+        yield delta_line(request.message)
+        yield event_line({"type": "final", "answer": request.message})
+
+
+def _router() -> AgentRouterService:
+    return AgentRouterService(registry={"echo": EchoAgent})
+
+
+def _request(message: str = "hello") -> ChatRequest:
+    return ChatRequest(path="note.md", content="# Note\n", message=message, agent_id="echo")
+
+
+def test_unstarted_streams_are_unregistered():
+    router = _router()
+
+    async def main() -> None:
+        response = await router.route_request(_request())
+        request_id = response.headers["X-AI-Request-Id"]
+        assert router.cancel(request_id)
+        # The client went away before the body was sent.
+        del response
+        gc.collect()
+        assert not router.cancel(request_id)
+
+    asyncio.run(main())
+
+
+def test_finished_streams_are_unregistered():
+    router = _router()
+
+    async def main() -> None:
+        response = await router.route_request(_request())
+        request_id = response.headers["X-AI-Request-Id"]
+        chunks = [chunk async for chunk in response.body_iterator]
+        assert any(parse_final(chunk) for chunk in chunks)
+        assert not router.cancel(request_id)
+
+    asyncio.run(main())
+
+
+def test_stats_follow_the_final_event(monkeypatch):
+    async def events() -> list[str]:
+        response = await _router().route_request(_request())
+        return [json.loads(chunk)["type"] async for chunk in response.body_iterator]
+
+    assert asyncio.run(events()) == ["delta", "final", "stats"]
+    monkeypatch.setenv("AI_STREAM_STATS", "false")
+    assert asyncio.run(events()) == ["delta", "final"]
+
+
+def test_session_turns_do_not_overlap():
+    router = _router()
+    request = _request().model_copy(update={"session_id": "s"})
+
+    async def main() -> None:
+        first = await router.route_request(request)
+        with pytest.raises(AgentSessionBusyError):
+            await router.route_request(request)
+        # Dropping a body that never started ends its turn too.
+        del first
+        gc.collect()
+        second = await router.route_request(request)
+        assert [chunk async for chunk in second.body_iterator]
+        third = await router.route_request(request.model_copy(update={"message": "again"}))
+        assert [chunk async for chunk in third.body_iterator]
+
+    asyncio.run(main())
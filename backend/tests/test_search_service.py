@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+
+from app.services import search_service
+from app.services.search_service import SearchIndex
+
+
+def _paths(index: SearchIndex, query: str) -> list[str]:
+    return [result["path"] for result in index.search(query)["results"]]
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    root = tmp_path / "workspace"
+    (root / "notes").mkdir(parents=True)
+    (root / "alpha.md").write_text("# Alpha\n\nquartz lantern\n", encoding="utf-8")
+    (root / "notes" / "beta.md").write_text("# Beta\n\nmarble harbor\n", encoding="utf-8")
+    return root
+
+
+def test_queries_do_not_walk_after_startup(workspace, tmp_path, monkeypatch):
+    index = SearchIndex(workspace, tmp_path / "index.pickle", save_delay=60)
+    index.ensure_ready()
+    assert _paths(index, "quartz") == ["alpha.md"]
+
+    walk = search_service._walk_markdown
+
+    def no_full_walk(root, start=""):
+        assert start, "queries must not walk the whole workspace"
+        return walk(root, start)
+
+    monkeypatch.setattr(search_service, "_walk_markdown", no_full_walk)
+
+    (workspace / "gamma.md").write_text("copper quartz\n", encoding="utf-8")
+    index.apply_changes([{"kind": "created", "path": "gamma.md", "is_dir": False}])
+    assert sorted(_paths(index, "quartz")) == ["alpha.md", "gamma.md"]
+
+    (workspace / "notes").rename(workspace / "archive")
+    index.apply_changes(
+        [{"kind": "renamed", "path": "archive", "old_path": "notes", "is_dir": True}]
+    )
+    assert _paths(index, "marble") == ["archive/beta.md"]
+
+    (workspace / "alpha.md").unlink()
+    index.apply_changes([{"kind": "deleted", "path": "alpha.md", "is_dir": False}])
+    assert _paths(index, "quartz") == ["gamma.md"]
+
+
+def test_changes_are_saved_in_the_background(workspace, tmp_path):
+    index_path = tmp_path / "index.pickle"
+    index = SearchIndex(workspace, index_path, save_delay=0.05)
+    index.ensure_ready()
+
+    deadline = time.monotonic() + 5
+    while not index_path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert index_path.exists()
+
+    reloaded = SearchIndex(workspace, index_path, save_delay=60)
+    assert reloaded.refresh() == 0
+
+
+def test_retrieval_does_not_wait_for_the_startup_scan(workspace, tmp_path, monkeypatch):
+    index = SearchIndex(workspace, tmp_path / "index.pickle", save_delay=60)
+    monkeypatch.setattr(search_service, "search_index", index)
+
+    assert search_service.related_documents("quartz", limit=4) == ([], {})
+    assert not index.ready
+
+    index.ensure_ready()
+    documents, _ = search_service.related_documents("quartz", limit=4)
+    assert [path for path, _ in documents] == ["alpha.md"]
+
+
+def test_buffered_writes_are_indexed_once_flushed(workspace, tmp_path, monkeypatch):
+    from app.services import file_service
+
+    index = SearchIndex(workspace, tmp_path / "index.pickle", save_delay=60)
+    index.ensure_ready()
+    monkeypatch.setattr(file_service, "WORKSPACE_DIR", workspace)
+    monkeypatch.setattr(file_service, "_write_hooks", [index.update_document])
+    monkeypatch.setattr(file_service, "_write_behind", file_service._WriteBehind(0.05))
+
+    file_service.write_file("new.md", "copper kettle\n")
+    file_service.write_file("alpha.md", "# Alpha\n\nsilver lantern\n")
+    file_service.flush_pending_writes()
+
+    assert _paths(index, "copper") == ["new.md"]
+    assert _paths(index, "silver") == ["alpha.md"]
+    for rel_path in ("new.md", "alpha.md"):
+        stat = (workspace / rel_path).stat()
+        doc = index._docs[rel_path]
+        assert (doc.mtime_ns, doc.size) == (stat.st_mtime_ns, stat.st_size)
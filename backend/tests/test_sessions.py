@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import pytest
+
+from app.agents.exceptions import AgentSessionBusyError
+from app.agents.sessions import SessionSettings, SessionStore, document_update
+
+_SETTINGS = SessionSettings(
+    ttl_seconds=60, max_sessions=8, max_delta_ratio=0.5, max_turns=3, history_tokens=1000
+)
+
+_DOCUMENT = "".join(f"# Section {i}\n\n{'words ' * 40}\n\n" for i in range(8))
+
+
+def _complete_turn(store: SessionStore, text: str, document: str, context: str) -> None:
+    session = store.checkout("s", "agent", "note.md")
+    end_turn = store.begin_turn(session)
+    session.record_turn(text, "answer", document, context)
+    store.save("agent", "note.md", session)
+    end_turn()
+
+
+def test_section_selections_are_not_diffed_against_each_other():
+    store = SessionStore(_SETTINGS)
+    first_sections = _DOCUMENT[:400]
+    _complete_turn(store, "q1", _DOCUMENT, first_sections)
+
+    session = store.checkout("s", "agent", "note.md")
+    other_sections = _DOCUMENT[-400:]
+    update = document_update(session, _DOCUMENT, other_sections, _SETTINGS)
+    assert (update.kind, update.text) == ("full", other_sections)
+    assert document_update(session, _DOCUMENT, first_sections, _SETTINGS).kind == "unchanged"
+
+
+def test_whole_document_turns_send_a_diff_of_the_document():
+    store = SessionStore(_SETTINGS)
+    _complete_turn(store, "q1", _DOCUMENT, _DOCUMENT)
+
+    session = store.checkout("s", "agent", "note.md")
+    edited = _DOCUMENT.replace("# Section 3", "# Section three")
+    update = document_update(session, edited, edited, _SETTINGS)
+    assert update.kind == "delta"
+    assert "+# Section three" in update.text
+    assert update.seen == edited
+
+
+def test_history_is_capped_and_the_document_resent():
+    store = SessionStore(_SETTINGS)
+    for turn in range(5):
+        _complete_turn(store, f"q{turn}", _DOCUMENT, _DOCUMENT)
+
+    session = store.checkout("s", "agent", "note.md")
+    assert [t.text for t in session.history if t.role == "user"] == ["q2", "q3", "q4"]
+    assert document_update(session, _DOCUMENT, _DOCUMENT, _SETTINGS).kind == "full"
+
+
+def test_concurrent_turns_are_rejected():
+    store = SessionStore(_SETTINGS)
+    first = store.checkout("s", "agent", "note.md")
+    second = store.checkout("s", "agent", "note.md")
+
+    end_first = store.begin_turn(first)
+    with pytest.raises(AgentSessionBusyError):
+        store.begin_turn(second)
+
+    first.record_turn("q1", "answer", _DOCUMENT, _DOCUMENT)
+    store.save("agent", "note.md", first)
+    end_first()
+    # ``second`` was checked out before the first turn was saved; it would overwrite it.
+    with pytest.raises(AgentSessionBusyError):
+        store.begin_turn(second)
+    store.begin_turn(store.checkout("s", "agent", "note.md"))()
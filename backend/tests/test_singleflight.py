@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import asyncio
+
+from app.agents.singleflight import SingleFlight
+
+
+async def _source(count: int, delay: float = 0.01):
+    for index in range(count):
+        await asyncio.sleep(delay)
+        yield f"{index}\n".encode()
+
+
+def test_joined_caller_keeps_flight_alive_before_reading():
+    async def scenario() -> list[bytes]:
+        flights = SingleFlight()
+        first, joined_first = flights.join("key", lambda: _source(5))
+        second, joined_second = flights.join("key", lambda: _source(5))
+        assert (joined_first, joined_second) == (False, True)
+
+        # The first caller reads one chunk and leaves before the second starts reading.
+        assert await anext(first) == b"0\n"
+        await first.aclose()
+        return [chunk async for chunk in second]
+
+    assert asyncio.run(scenario()) == [f"{index}\n".encode() for index in range(5)]
+
+
+def test_flight_is_cancelled_once_every_caller_leaves():
+    async def scenario() -> bool:
+        flights = SingleFlight()
+        first, _ = flights.join("key", lambda: _source(100))
+        second, _ = flights.join("key", lambda: _source(100))
+        await anext(first)
+        await first.aclose()
+        # Dropping a stream that was never read releases it too.
+        del second
+        await asyncio.sleep(0.05)
+        return flights.in_flight("key")
+
+    assert asyncio.run(scenario()) is False
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from collections.abc import AsyncIterator
+
+from app.agents.editing import FenceStreamParser, resolve_full_output
+from app.agents.streaming import (
+    RESET_LINE,
+    CoalescePolicy,
+    coalesce_deltas,
+    delta_line,
+    delta_lines,
+    event_line,
+    get_coalesce_policy,
+    parse_final,
+)
+
+REWRITE = "Sure:\n```markdown\n# Title\n\nUse `code` and ``pairs``\n```\nDone."
+
+
+async def _chunks(*texts: str) -> AsyncIterator[str]:
+    for text in texts:
+        yield text
+
+
+def test_parse_final_does_not_depend_on_spacing():
+    compact = (json.dumps({"type": "final", "answer": "ok"}, separators=(",", ":")) + "\n").encode()
+    reordered = event_line({"answer": "ok", "type": "final"})
+
+    assert parse_final(compact) == {"type": "final", "answer": "ok"}
+    assert parse_final(reordered) == {"answer": "ok", "type": "final"}
+
+
+def test_parse_final_ignores_other_events():
+    assert parse_final(delta_line('{"type": "final"}')) is None
+    assert parse_final(event_line({"type": "stats", "note": "final"})) is None
+    assert parse_final(RESET_LINE) is None
+
+
+def test_closing_fence_split_across_chunks_is_held_back():
+    parser = FenceStreamParser()
+
+    assert parser.feed("```markdown\n# Title") == "# Title"
+    assert parser.feed("\n`") == ""
+    assert parser.feed("`") == ""
+    # Not a closing fence after all: the held text is released.
+    assert parser.feed("x") == "\n``x"
+    assert parser.feed("\n``") == ""
+    assert parser.feed("`\ntrailing") == ""
+    assert parser.feed("more") == ""
+
+def _proposed_text(lines: list[bytes]) -> str:
+    events = [json.loads(line) for line in lines]
+    return "".join(event["text"] for event in events if event["type"] == "proposed_delta")
+
+
+def test_proposed_deltas_add_up_to_the_final_document():
+    expected = resolve_full_output(REWRITE)
+
+    async def proposed(texts: list[str]) -> str:
+        lines = delta_lines(_chunks(*texts), None, preview=True)
+        return _proposed_text([line async for line in lines])
+
+    assert asyncio.run(proposed(list(REWRITE))) == expected
+    for split in range(1, len(REWRITE)):
+        assert asyncio.run(proposed([REWRITE[:split], REWRITE[split:]])) == expected
+
+
+async def _paced(*items: str | float) -> AsyncIterator[str]:
+    """Yield text items; numbers are pauses in seconds."""
+    for item in items:
+        if isinstance(item, str):
+            yield item
+        else:
+            await asyncio.sleep(item)
+
+
+def _coalesced(deltas: AsyncIterator[str], policy: CoalescePolicy | None) -> list[str]:
+    async def main() -> list[str]:
+        return [text async for text in coalesce_deltas(deltas, policy)]
+
+    return asyncio.run(main())
+
+
+def test_size_threshold_flushes_without_waiting():
+    policy = CoalescePolicy(flush_interval=60, flush_chars=5)
+
+    assert _coalesced(_paced("ab", "cd", "ef", "g"), policy) == ["abcdef", "g"]
+
+
+def test_time_threshold_flushes_while_upstream_is_silent():
+    policy = CoalescePolicy(flush_interval=0.05, flush_chars=0)
+    flushed_at: list[float] = []
+
+    async def main() -> list[str]:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        texts = []
+        async for text in coalesce_deltas(_paced("a", "b", 0.5, "c"), policy):
+            flushed_at.append(loop.time() - start)
+            texts.append(text)
+        return texts
+
+    assert asyncio.run(main()) == ["ab", "c"]
+    assert flushed_at[0] < 0.4
+
+
+def test_zero_interval_only_flushes_on_size():
+    policy = CoalescePolicy(flush_interval=0, flush_chars=3)
+
+    assert _coalesced(_paced("a", 0.05, "b", 0.05, "c", "d"), policy) == ["abc", "d"]
+
+
+def test_coalescing_can_be_turned_off(monkeypatch):
+    assert get_coalesce_policy(enabled=False) is None
+    monkeypatch.setenv("AI_STREAM_FLUSH_MS", "0")
+    monkeypatch.setenv("AI_STREAM_FLUSH_CHARS", "0")
+    assert get_coalesce_policy() is None
+    assert _coalesced(_paced("a", "b", "c"), None) == ["a", "b", "c"]
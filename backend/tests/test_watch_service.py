@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import asyncio
+
+from app.services import watch_service
+from app.services.watch_service import WorkspaceWatcher
+
+
+def test_reconnecting_client_replays_instead_of_resyncing(tmp_path, monkeypatch):
+    monkeypatch.setattr(watch_service, "watchfiles", None)
+    monkeypatch.setattr(watch_service, "WATCH_POLL_INTERVAL", 0.02)
+    monkeypatch.setattr(watch_service, "WATCH_IDLE_GRACE", 0.5)
+    watcher = WorkspaceWatcher(tmp_path)
+
+    async def main() -> None:
+        stream = watcher.stream()
+        assert (await stream.__anext__()).startswith(b"retry:")
+        last_event_id = f"{watcher._epoch}:0"
+        # The only client goes away, then a note changes while it is disconnected.
+        await stream.aclose()
+        (tmp_path / "note.md").write_text("# Note\n", encoding="utf-8")
+        await asyncio.sleep(0.2)
+
+        stream = watcher.stream(last_event_id)
+        await stream.__anext__()
+        replayed = await asyncio.wait_for(stream.__anext__(), 1)
+        assert b"event: changes" in replayed and b"note.md" in replayed
+        await stream.aclose()
+
+        await asyncio.sleep(0.7)
+        assert not watcher.running
+
+    asyncio.run(main())
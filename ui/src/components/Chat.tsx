@@ -52,7 +52,9 @@ export function Chat({ path, onCollapse, onExpand, isCollapsed }: ChatProps) {
               entry.id === placeholderId ? { ...entry, text: buffer } : entry,
             ),
           );
-        } else {
+        } else if (event.type === "reset") {
+          buffer = "";
+        } else if (event.type === "final") {
           const finalText =
             "answer" in event ? event.answer : event.proposedContent;
           buffer = finalText;
@@ -64,6 +66,7 @@ export function Chat({ path, onCollapse, onExpand, isCollapsed }: ChatProps) {
             ),
           );
         }
+        // Other events (proposed_delta, cancelled, stats) carry nothing to show here.
       });
     },
     onMutate: (input) => {
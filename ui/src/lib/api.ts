@@ -10,6 +10,7 @@ export type FileNode = {
 export type FileContent = {
   path: string
   content: string
+  version?: string // sha256 of the file bytes, also sent as the ETag
 }
 
 const base = '/api'
@@ -38,12 +39,34 @@ export async function readFile(path: string): Promise<FileContent> {
   return http<FileContent>(u.toString())
 }
 
-export async function writeFile(path: string, content: string): Promise<{ ok: boolean }> {
+export type WriteResult = { ok: boolean; version?: string }
+
+export async function writeFile(
+  path: string,
+  content: string,
+  baseVersion?: string,
+): Promise<WriteResult> {
   const u = new URL(`${base}/file`, window.location.origin)
   u.searchParams.set('path', path)
-  return http<{ ok: boolean }>(u.toString(), {
+  return http<WriteResult>(u.toString(), {
     method: 'PUT',
-    body: JSON.stringify({ content }),
+    body: JSON.stringify({ content, base_version: baseVersion }),
+  })
+}
+
+// Offsets are UTF-16 code units, i.e. plain JavaScript string indices into the base content.
+export type TextEdit = { start: number; end: number; text: string }
+
+export async function patchFile(
+  path: string,
+  baseVersion: string,
+  edits: TextEdit[],
+): Promise<WriteResult> {
+  const u = new URL(`${base}/file`, window.location.origin)
+  u.searchParams.set('path', path)
+  return http<WriteResult>(u.toString(), {
+    method: 'PATCH',
+    body: JSON.stringify({ base_version: baseVersion, edits }),
   })
 }
 
@@ -52,13 +75,42 @@ export type AIChatRequest = {
   mode: 'ask' | 'edit'
   message: string
   selection?: string
+  retrieval?: boolean
+  coalesce_deltas?: boolean
+  session_id?: string
 }
 
-export type AIChatResponseAsk = { answer: string }
+export type AIChatSource = { path: string; score: number }
+
+export type AIChatResponseAsk = { answer: string; sources?: AIChatSource[] }
 export type AIChatResponseEdit = { proposedContent: string }
 
+export type AIModelRoute = {
+  model: string
+  tier: number
+  input_tokens: number
+  max_input_tokens: number
+  token_counter: 'tiktoken' | 'estimate'
+  trimmed: boolean
+}
+
 export type AIChatStreamEvent =
   | { type: 'delta'; text: string }
+  | { type: 'proposed_delta'; text: string }
+  // Discard the delta and proposed_delta text received so far; the output starts over.
+  | { type: 'reset' }
+  | { type: 'cancelled' }
+  // Sent after final when AI_STREAM_STATS is on; timing only, not part of the answer.
+  | {
+      type: 'stats'
+      ttft_ms: number
+      duration_ms: number
+      output_chars: number
+      output_tokens: number
+      tokens_per_second: number | null
+      stages_ms: Record<string, number>
+      route: AIModelRoute | null
+    }
   | ({ type: 'final' } & (AIChatResponseAsk | AIChatResponseEdit))
 
 type AIChatFinalEvent = Extract<AIChatStreamEvent, { type: 'final' }>
@@ -66,6 +118,7 @@ type AIChatFinalEvent = Extract<AIChatStreamEvent, { type: 'final' }>
 export async function aiChatStream(
   req: AIChatRequest,
   onEvent: (event: AIChatStreamEvent) => void,
+  onRequestId?: (requestId: string) => void,
 ): Promise<AIChatFinalEvent> {
   const res = await fetch(`${base}/ai/chat`, {
     method: 'POST',
@@ -82,10 +135,14 @@ export async function aiChatStream(
     throw new Error('Readable stream not supported in this browser.')
   }
 
+  const requestId = res.headers.get('X-AI-Request-Id')
+  if (requestId) onRequestId?.(requestId)
+
   const reader = res.body.getReader()
   const decoder = new TextDecoder()
   let buffer = ''
   let finalEvent: AIChatFinalEvent | null = null
+  let cancelled = false
 
   const handleLine = (line: string) => {
     if (!line) return
@@ -98,6 +155,8 @@ export async function aiChatStream(
     onEvent(event)
     if (event.type === 'final') {
       finalEvent = event
+    } else if (event.type === 'cancelled') {
+      cancelled = true
     }
   }
 
@@ -129,8 +188,121 @@ export async function aiChatStream(
   flushBuffer(true)
 
   if (!finalEvent) {
+    if (cancelled) throw new Error('AI response was stopped.')
     throw new Error('Stream ended without a final AI response.')
   }
 
   return finalEvent
 }
+
+export async function stopAIChat(requestId: string): Promise<void> {
+  const res = await fetch(`${base}/ai/chat/${encodeURIComponent(requestId)}/stop`, {
+    method: 'POST',
+  })
+  // 404 means the stream already finished.
+  if (!res.ok && res.status !== 404) {
+    throw new Error(`HTTP ${res.status}: ${await res.text()}`)
+  }
+}
+
+export type AIJobRequest = {
+  path?: string
+  pattern?: string
+  mode: 'ask' | 'edit'
+  message: string
+  agent_id?: string
+  concurrency?: number
+}
+
+export type AIJob = {
+  job_id: string
+  status: 'running' | 'completed' | 'cancelled' | 'failed'
+  path: string
+  pattern: string
+  agent_id: string
+  mode: 'ask' | 'edit'
+  message: string
+  concurrency: number
+  total: number
+  done: number
+  failed: number
+  created_at: number
+}
+
+export type AIJobResult = { type: 'result'; index: number; path: string } & (
+  | { status: 'ok'; answer: string }
+  | { status: 'ok'; proposedContent: string; baseVersion: string; changed: boolean }
+  | { status: 'error'; error: string }
+)
+
+export type AIJobEvent =
+  | ({ type: 'job' } & AIJob)
+  | AIJobResult
+  | ({ type: 'done' } & AIJob)
+
+export async function createAIJob(req: AIJobRequest): Promise<AIJob> {
+  return http<AIJob>(`${base}/ai/jobs`, { method: 'POST', body: JSON.stringify(req) })
+}
+
+export async function listAIJobs(): Promise<AIJob[]> {
+  return http<AIJob[]>(`${base}/ai/jobs`)
+}
+
+export async function cancelAIJob(jobId: string): Promise<AIJob> {
+  return http<AIJob>(`${base}/ai/jobs/${encodeURIComponent(jobId)}/cancel`, { method: 'POST' })
+}
+
+export async function resumeAIJob(jobId: string): Promise<AIJob> {
+  return http<AIJob>(`${base}/ai/jobs/${encodeURIComponent(jobId)}/resume`, { method: 'POST' })
+}
+
+// Follows a job until it finishes; pass the number of results already seen as `after`.
+export async function followAIJob(
+  jobId: string,
+  onEvent: (event: AIJobEvent) => void,
+  after = 0,
+): Promise<void> {
+  const u = new URL(`${base}/ai/jobs/${encodeURIComponent(jobId)}/events`, window.location.origin)
+  u.searchParams.set('after', String(after))
+  const res = await fetch(u.toString())
+  if (!res.ok || !res.body) {
+    throw new Error(`HTTP ${res.status}: ${await res.text()}`)
+  }
+  const reader = res.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  while (true) {
+    const { value, done } = await reader.read()
+    buffer += done ? decoder.decode() : decoder.decode(value, { stream: true })
+    const lines = buffer.split('\n')
+    buffer = done ? '' : (lines.pop() ?? '')
+    for (const line of lines) {
+      if (line.trim()) onEvent(JSON.parse(line) as AIJobEvent)
+    }
+    if (done) break
+  }
+}
+
+export type WorkspaceChange = {
+  kind: 'created' | 'modified' | 'deleted' | 'renamed'
+  path: string
+  old_path?: string
+  is_dir: boolean
+  version?: string
+  // "self" marks the echo of a save made through this API.
+  origin: 'self' | 'external'
+}
+
+// EventSource reconnects on its own and resumes from the last event id; `onResync`
+// means changes were missed and listings should be refetched.
+export function watchWorkspace(
+  onChanges: (changes: WorkspaceChange[]) => void,
+  onResync: () => void,
+): () => void {
+  const source = new EventSource(`${base}/watch`)
+  source.addEventListener('changes', (event) => {
+    onChanges((JSON.parse((event as MessageEvent).data) as { changes: WorkspaceChange[] }).changes)
+  })
+  source.addEventListener('resync', () => onResync())
+  return () => source.close()
+}